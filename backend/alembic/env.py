@@ -7,7 +7,10 @@ from sqlalchemy import pool
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from app.database import Base
-from app.models import User, Tunnel, SystemFlag  # noqa: F401 - ensure models are registered
+from app.models import (  # noqa: F401 - ensure models are registered
+    User, Tunnel, SystemFlag, IPLease, GatewayNode, PeerStatus, TunnelTombstone,
+    TrafficSample, TrafficHourly, TrafficDaily, EmailOutbox, EmailCampaign,
+)
 
 config = context.config
 
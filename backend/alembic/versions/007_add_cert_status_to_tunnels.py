@@ -0,0 +1,45 @@
+"""Add certificate job state to tunnels
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tunnels",
+        sa.Column("cert_status", sa.String(16), nullable=False, server_default=sa.text("'pending'")),
+    )
+    op.add_column(
+        "tunnels",
+        sa.Column("cert_attempts", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+    op.add_column(
+        "tunnels",
+        sa.Column("cert_next_attempt_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    # Existing tunnels had their certificate requested inline at creation time
+    op.execute("UPDATE tunnels SET cert_status = 'issued'")
+    op.create_index(
+        "ix_tunnels_cert_pending",
+        "tunnels",
+        ["cert_next_attempt_at"],
+        postgresql_where=sa.text("cert_status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tunnels_cert_pending", table_name="tunnels")
+    op.drop_column("tunnels", "cert_next_attempt_at")
+    op.drop_column("tunnels", "cert_attempts")
+    op.drop_column("tunnels", "cert_status")
@@ -0,0 +1,73 @@
+"""Add ip_leases table for database-side IP allocation
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-16
+"""
+import ipaddress
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import INET, UUID
+
+from app.config import settings
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _populate(pool: str, subnet: str, reserved: str, tunnel_column: str) -> None:
+    network = ipaddress.IPv4Network(subnet)
+    op.execute(
+        sa.text(
+            "INSERT INTO ip_leases (pool, address) "
+            "SELECT :pool, CAST(:first AS inet) + n "
+            "FROM generate_series(0, :count - 1) AS n "
+            "WHERE CAST(:first AS inet) + n <> CAST(:reserved AS inet)"
+        ).bindparams(
+            pool=pool,
+            first=str(network.network_address + 1),
+            count=max(network.num_addresses - 2, 0),
+            reserved=reserved,
+        )
+    )
+    op.execute(
+        sa.text(
+            f"UPDATE ip_leases SET tunnel_id = t.id FROM tunnels t "
+            f"WHERE ip_leases.pool = :pool AND ip_leases.address = host(t.{tunnel_column})::inet"
+        ).bindparams(pool=pool)
+    )
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ip_leases",
+        sa.Column("pool", sa.String(16), primary_key=True),
+        sa.Column("address", INET(), primary_key=True),
+        sa.Column(
+            "tunnel_id",
+            UUID(as_uuid=True),
+            sa.ForeignKey(
+                "tunnels.id", ondelete="SET NULL", deferrable=True, initially="DEFERRED"
+            ),
+            nullable=True,
+            index=True,
+        ),
+    )
+    # Index before populating: the deferred FK leaves pending trigger events
+    op.create_index(
+        "ix_ip_leases_free",
+        "ip_leases",
+        ["pool", "address"],
+        postgresql_where=sa.text("tunnel_id IS NULL"),
+    )
+    _populate("vpn", settings.vpn_subnet, settings.vpn_server_ip, "vpn_ip")
+    _populate("device", settings.device_subnet, settings.device_gateway_ip, "device_ip")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ip_leases_free", table_name="ip_leases")
+    op.drop_table("ip_leases")
@@ -0,0 +1,22 @@
+"""Add haproxy_config_version sequence
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE haproxy_config_version")
+
+
+def downgrade() -> None:
+    op.execute("DROP SEQUENCE haproxy_config_version")
@@ -0,0 +1,30 @@
+"""Add peer_status table shared by the peer status samplers
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "peer_status",
+        sa.Column("public_key", sa.String(44), primary_key=True),
+        sa.Column("rx_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("has_handshake", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+        sa.Column("rx_changed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("connected_since", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("peer_status")
@@ -0,0 +1,91 @@
+"""Add tunnel state versions and deletion tombstones
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match TUNNEL_VERSION_LOCK_KEY in app/services/tunnel_version.py
+LOCK_KEY = 0x48565456  # "HVTV"
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE tunnel_state_version")
+
+    op.add_column(
+        "tunnels",
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.execute("UPDATE tunnels SET version = nextval('tunnel_state_version')")
+    op.create_index("ix_tunnels_version", "tunnels", ["version"])
+
+    op.create_table(
+        "tunnel_tombstones",
+        sa.Column("tunnel_id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", UUID(as_uuid=True), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.Column("deleted_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_tunnel_tombstones_version", "tunnel_tombstones", ["version"])
+    op.create_index("ix_tunnel_tombstones_user_id", "tunnel_tombstones", ["user_id"])
+
+    # Writers are serialized by a transaction-scoped advisory lock taken
+    # before drawing a version, so versions become visible in commit order
+    # and a client resuming from version N can never miss a change <= N.
+    op.execute(f"""
+        CREATE FUNCTION tunnels_bump_version() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock({LOCK_KEY});
+            NEW.version := nextval('tunnel_state_version');
+            PERFORM pg_notify('tunnel_changes', NEW.version::text);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER tunnels_bump_version
+        BEFORE INSERT OR UPDATE ON tunnels
+        FOR EACH ROW EXECUTE FUNCTION tunnels_bump_version()
+    """)
+
+    op.execute(f"""
+        CREATE FUNCTION tunnels_record_tombstone() RETURNS trigger AS $$
+        DECLARE
+            v BIGINT;
+        BEGIN
+            PERFORM pg_advisory_xact_lock({LOCK_KEY});
+            v := nextval('tunnel_state_version');
+            INSERT INTO tunnel_tombstones (tunnel_id, user_id, version)
+            VALUES (OLD.id, OLD.user_id, v)
+            ON CONFLICT (tunnel_id) DO UPDATE SET version = EXCLUDED.version, deleted_at = now();
+            PERFORM pg_notify('tunnel_changes', v::text);
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER tunnels_record_tombstone
+        AFTER DELETE ON tunnels
+        FOR EACH ROW EXECUTE FUNCTION tunnels_record_tombstone()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER tunnels_record_tombstone ON tunnels")
+    op.execute("DROP FUNCTION tunnels_record_tombstone()")
+    op.execute("DROP TRIGGER tunnels_bump_version ON tunnels")
+    op.execute("DROP FUNCTION tunnels_bump_version()")
+    op.drop_table("tunnel_tombstones")
+    op.drop_index("ix_tunnels_version", table_name="tunnels")
+    op.drop_column("tunnels", "version")
+    op.execute("DROP SEQUENCE tunnel_state_version")
@@ -0,0 +1,57 @@
+"""Add traffic samples (partitioned by day) and hourly/daily rollups
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision: str = "013"
+down_revision: Union[str, None] = "012"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Daily partitions are created (and dropped) by the traffic rollup job
+    op.execute("""
+        CREATE TABLE traffic_samples (
+            tunnel_id UUID NOT NULL,
+            sampled_at TIMESTAMPTZ NOT NULL,
+            user_id UUID NOT NULL,
+            rx_bytes BIGINT NOT NULL,
+            tx_bytes BIGINT NOT NULL
+        ) PARTITION BY RANGE (sampled_at)
+    """)
+    op.execute("CREATE INDEX ix_traffic_samples_sampled_at ON traffic_samples (sampled_at)")
+
+    op.create_table(
+        "traffic_hourly",
+        sa.Column("tunnel_id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("hour", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("user_id", UUID(as_uuid=True), nullable=False),
+        sa.Column("rx_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("tx_bytes", sa.BigInteger(), nullable=False),
+    )
+    op.create_index("ix_traffic_hourly_hour", "traffic_hourly", ["hour"])
+
+    op.create_table(
+        "traffic_daily",
+        sa.Column("tunnel_id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("user_id", UUID(as_uuid=True), nullable=False),
+        sa.Column("rx_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("tx_bytes", sa.BigInteger(), nullable=False),
+    )
+    op.create_index("ix_traffic_daily_day", "traffic_daily", ["day"])
+    op.create_index("ix_traffic_daily_user_day", "traffic_daily", ["user_id", "day"])
+
+
+def downgrade() -> None:
+    op.drop_table("traffic_daily")
+    op.drop_table("traffic_hourly")
+    op.execute("DROP TABLE traffic_samples")
@@ -0,0 +1,90 @@
+"""Add gateway_nodes and assign tunnels and IP pools to a node
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+revision: str = "014"
+down_revision: Union[str, None] = "013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "gateway_nodes",
+        sa.Column("id", sa.String(32), primary_key=True),
+        sa.Column("driver", sa.String(16), nullable=False, server_default="local"),
+        sa.Column("address", sa.String(255), nullable=True),
+        sa.Column("interface", sa.String(15), nullable=False),
+        sa.Column("endpoint", sa.String(255), nullable=False),
+        sa.Column("vpn_subnet", sa.String(43), nullable=False),
+        sa.Column("vpn_server_ip", sa.String(39), nullable=False),
+        sa.Column("device_subnet", sa.String(43), nullable=False),
+        sa.Column("device_gateway_ip", sa.String(39), nullable=False),
+        sa.Column("max_peers", sa.Integer(), nullable=False, server_default="10000"),
+        sa.Column("is_active", sa.Boolean(), nullable=False, server_default=sa.text("true")),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    # The existing single interface becomes the "local" node
+    op.execute(
+        sa.text(
+            "INSERT INTO gateway_nodes (id, driver, interface, endpoint, vpn_subnet, "
+            "vpn_server_ip, device_subnet, device_gateway_ip) "
+            "VALUES ('local', 'local', :interface, :endpoint, :vpn_subnet, :vpn_server_ip, "
+            ":device_subnet, :device_gateway_ip)"
+        ).bindparams(
+            interface=settings.wireguard_interface,
+            endpoint=settings.wireguard_endpoint,
+            vpn_subnet=settings.vpn_subnet,
+            vpn_server_ip=settings.vpn_server_ip,
+            device_subnet=settings.device_subnet,
+            device_gateway_ip=settings.device_gateway_ip,
+        )
+    )
+
+    op.add_column(
+        "tunnels",
+        sa.Column(
+            "node_id", sa.String(32), sa.ForeignKey("gateway_nodes.id"),
+            nullable=False, server_default="local",
+        ),
+    )
+    op.create_index("ix_tunnels_node_id", "tunnels", ["node_id"])
+
+    op.add_column(
+        "ip_leases",
+        sa.Column(
+            "node_id", sa.String(32), sa.ForeignKey("gateway_nodes.id", ondelete="CASCADE"),
+            nullable=False, server_default="local",
+        ),
+    )
+    op.drop_index("ix_ip_leases_free", table_name="ip_leases")
+    op.create_index(
+        "ix_ip_leases_free",
+        "ip_leases",
+        ["node_id", "pool", "address"],
+        postgresql_where=sa.text("tunnel_id IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ip_leases_free", table_name="ip_leases")
+    op.create_index(
+        "ix_ip_leases_free",
+        "ip_leases",
+        ["pool", "address"],
+        postgresql_where=sa.text("tunnel_id IS NULL"),
+    )
+    op.execute("DELETE FROM ip_leases WHERE node_id <> 'local'")
+    op.drop_column("ip_leases", "node_id")
+    op.drop_index("ix_tunnels_node_id", table_name="tunnels")
+    op.drop_column("tunnels", "node_id")
+    op.drop_table("gateway_nodes")
@@ -0,0 +1,53 @@
+"""Add email_campaigns table for admin announcements
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision: str = "016"
+down_revision: Union[str, None] = "015"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "email_campaigns",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("subject", sa.String(255), nullable=False),
+        sa.Column("body", sa.Text(), nullable=False),
+        sa.Column("active_only", sa.Boolean(), nullable=False, server_default=sa.text("true")),
+        sa.Column("beta_testers", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+        sa.Column("with_tunnels", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queuing"),
+        sa.Column("recipients", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("queued", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_user_id", UUID(as_uuid=True), nullable=True),
+        sa.Column("created_by", sa.String(255), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("queued_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_email_campaigns_created_at", "email_campaigns", ["created_at"])
+
+    op.add_column(
+        "email_outbox",
+        sa.Column(
+            "campaign_id",
+            sa.Integer(),
+            sa.ForeignKey("email_campaigns.id", ondelete="CASCADE"),
+            nullable=True,
+        ),
+    )
+    op.create_index("ix_email_outbox_campaign_id", "email_outbox", ["campaign_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_email_outbox_campaign_id", table_name="email_outbox")
+    op.drop_column("email_outbox", "campaign_id")
+    op.drop_table("email_campaigns")
@@ -0,0 +1,51 @@
+"""NOTIFY user_changes when a user's authorization fields change
+
+Revision ID: 017
+Revises: 016
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "017"
+down_revision: Union[str, None] = "016"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Invalidates the per-process user caches (app/services/user_cache.py)
+    op.execute("""
+        CREATE FUNCTION users_notify_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_changes', OLD.id::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_notify_update
+        AFTER UPDATE ON users
+        FOR EACH ROW
+        WHEN (
+            OLD.email IS DISTINCT FROM NEW.email
+            OR OLD.is_active IS DISTINCT FROM NEW.is_active
+            OR OLD.is_admin IS DISTINCT FROM NEW.is_admin
+            OR OLD.is_beta_tester IS DISTINCT FROM NEW.is_beta_tester
+            OR OLD.is_verified IS DISTINCT FROM NEW.is_verified
+            OR OLD.max_tunnels IS DISTINCT FROM NEW.max_tunnels
+        )
+        EXECUTE FUNCTION users_notify_change()
+    """)
+    op.execute("""
+        CREATE TRIGGER users_notify_delete
+        AFTER DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION users_notify_change()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER users_notify_delete ON users")
+    op.execute("DROP TRIGGER users_notify_update ON users")
+    op.execute("DROP FUNCTION users_notify_change()")
@@ -0,0 +1,93 @@
+"""Only bump tunnel versions on user-visible changes, NOTIFY the owner with them
+
+Revision ID: 018
+Revises: 017
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "018"
+down_revision: Union[str, None] = "017"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match TUNNEL_VERSION_LOCK_KEY in app/services/tunnel_version.py
+LOCK_KEY = 0x48565456  # "HVTV"
+
+# Columns the tunnel endpoints expose (or derive the response from); writes
+# to other columns (cert job leases and backoff, updated_at) keep the version
+VISIBLE_COLUMNS = (
+    "user_id", "subdomain", "target_port", "service_type", "vpn_ip", "device_ip",
+    "use_device_ip", "is_active", "cert_status", "client_public_key", "node_id",
+)
+
+
+def _bump_function(payload_user: str) -> str:
+    return f"""
+        CREATE OR REPLACE FUNCTION tunnels_bump_version() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock({LOCK_KEY});
+            NEW.version := nextval('tunnel_state_version');
+            PERFORM pg_notify('tunnel_changes', {payload_user});
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """
+
+
+def _tombstone_function(payload_user: str) -> str:
+    return f"""
+        CREATE OR REPLACE FUNCTION tunnels_record_tombstone() RETURNS trigger AS $$
+        DECLARE
+            v BIGINT;
+        BEGIN
+            PERFORM pg_advisory_xact_lock({LOCK_KEY});
+            v := nextval('tunnel_state_version');
+            INSERT INTO tunnel_tombstones (tunnel_id, user_id, version)
+            VALUES (OLD.id, OLD.user_id, v)
+            ON CONFLICT (tunnel_id) DO UPDATE SET version = EXCLUDED.version, deleted_at = now();
+            PERFORM pg_notify('tunnel_changes', {payload_user});
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """
+
+
+def upgrade() -> None:
+    # Payload "<version>:<user id>", so each process can track the latest
+    # version of every user (ETags of the user endpoints)
+    op.execute(_bump_function("NEW.version || ':' || NEW.user_id"))
+    op.execute(_tombstone_function("v || ':' || OLD.user_id"))
+
+    changed = "\n            OR ".join(
+        f"OLD.{column} IS DISTINCT FROM NEW.{column}" for column in VISIBLE_COLUMNS
+    )
+    op.execute("DROP TRIGGER tunnels_bump_version ON tunnels")
+    op.execute("""
+        CREATE TRIGGER tunnels_bump_version
+        BEFORE INSERT ON tunnels
+        FOR EACH ROW EXECUTE FUNCTION tunnels_bump_version()
+    """)
+    op.execute(f"""
+        CREATE TRIGGER tunnels_bump_version_on_update
+        BEFORE UPDATE ON tunnels
+        FOR EACH ROW
+        WHEN (
+            {changed}
+        )
+        EXECUTE FUNCTION tunnels_bump_version()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER tunnels_bump_version_on_update ON tunnels")
+    op.execute("DROP TRIGGER tunnels_bump_version ON tunnels")
+    op.execute("""
+        CREATE TRIGGER tunnels_bump_version
+        BEFORE INSERT OR UPDATE ON tunnels
+        FOR EACH ROW EXECUTE FUNCTION tunnels_bump_version()
+    """)
+    op.execute(_bump_function("NEW.version::text"))
+    op.execute(_tombstone_function("v::text"))
@@ -6,12 +6,26 @@ class Settings(BaseSettings):
     jwt_secret: str = "changeme"
     jwt_algorithm: str = "HS256"
     jwt_expiration_minutes: int = 1440
+    # bcrypt cost factor of new hashes; older hashes are upgraded on login
+    bcrypt_rounds: int = 12
+    # Threads running bcrypt, and how many more hashes may wait for one
+    # before requests are rejected with 503
+    password_hash_workers: int = 2
+    password_hash_max_queue: int = 16
     fernet_key: str = "changeme"
     wireguard_endpoint: str = "vpn.homeaccess.site:51820"
     wireguard_interface: str = "wg1"
     wireguard_config_path: str = "/etc/wireguard/wg1.conf"
+    # PersistentKeepalive of client configs, overridable per tunnel service_type
+    # (e.g. WIREGUARD_KEEPALIVE_BY_SERVICE='{"camera": 15}')
+    wireguard_keepalive: int = 25
+    wireguard_keepalive_by_service: dict[str, int] = {}
+    # SSH user for gateway nodes using the "ssh" driver
+    gateway_ssh_user: str = "homevpn"
     haproxy_backends_path: str = "/etc/haproxy/homevpn-backends.cfg"
     haproxy_map_path: str = "/etc/haproxy/homevpn-subdomains.map"
+    # HAProxy runtime API socket; empty disables runtime updates (reload only)
+    haproxy_admin_socket: str = "/var/run/haproxy/admin.sock"
     vpn_subnet: str = "172.16.0.0/16"
     vpn_server_ip: str = "172.16.0.1"
     device_subnet: str = "10.100.0.0/16"
@@ -35,6 +49,10 @@ class Settings(BaseSettings):
     smtp_password: str = ""
     smtp_from: str = "noreply@homeaccess.site"
     smtp_tls: bool = True
+    # Persistent SMTP connections used by the email sender of each API
+    # process, and its cap in messages per second (0: no cap)
+    smtp_pool_size: int = 2
+    smtp_rate_limit: float = 5
 
     class Config:
         env_file = ".env"
@@ -5,13 +5,42 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import async_session, get_db
 from app.models.user import User
 from app.services.auth import decode_access_token
+from app.services.user_cache import user_cache
 
 security = HTTPBearer()
 
 
+async def _load_user(user_id: UUID, db: AsyncSession) -> User | None:
+    # Cached users are transient: handlers needing a persistent (or fresh)
+    # user must load it from their session
+    user = user_cache.get(user_id)
+    if user is None:
+        generation = user_cache.generation
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        if user is not None:
+            user_cache.put(user, generation)
+    return user
+
+
+async def is_still_authorized(token: str, admin: bool = False) -> bool:
+    """Re-check a token during a long-lived response (SSE stream).
+
+    False once the token has expired or the user is deactivated, deleted or
+    (with `admin`) no longer an administrator.
+    """
+    user_id = decode_access_token(token)
+    if user_id is None:
+        return False
+    # The session only takes a connection on a cache miss
+    async with async_session() as db:
+        user = await _load_user(user_id, db)
+    return user is not None and user.is_active and (user.is_admin or not admin)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db),
@@ -22,8 +51,7 @@ async def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session expir\u00e9e, veuillez vous reconnecter",
         )
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await _load_user(user_id, db)
     if user is None or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -9,28 +9,62 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
 from app.routers import admin, auth, billing, contact, tunnels, health
+from app.services.announcements import announcement_loop
+from app.services.auth import PASSWORD_RETRY_AFTER_SECONDS, PasswordHasherBusy
+from app.services.certbot import cert_worker_loop
+from app.services.email_outbox import email_sender_loop
+from app.services.gateway import wireguard_save_loop
 from app.services.haproxy import haproxy_daemon_loop
+from app.services.peer_status import peer_status_sampler_loop
+from app.services.pg_notify import pg_listener
+from app.services.reconciler import reconciler_loop
+from app.services.traffic_accounting import traffic_accounting_loop
 
 limiter = Limiter(key_func=get_remote_address)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: launch the HAProxy reload daemon
-    daemon_task = asyncio.create_task(haproxy_daemon_loop())
+    # Startup: launch the Postgres listener, the HAProxy reload daemon,
+    # the peer status sampler, traffic accounting, the WireGuard save loop
+    # and reconciler, the certificate worker, the email sender and the
+    # announcement fan-out
+    tasks = [
+        asyncio.create_task(pg_listener.run()),
+        asyncio.create_task(haproxy_daemon_loop()),
+        asyncio.create_task(peer_status_sampler_loop()),
+        asyncio.create_task(traffic_accounting_loop()),
+        asyncio.create_task(wireguard_save_loop()),
+        asyncio.create_task(reconciler_loop()),
+        asyncio.create_task(cert_worker_loop()),
+        asyncio.create_task(email_sender_loop()),
+        asyncio.create_task(announcement_loop()),
+    ]
     yield
-    # Shutdown: cancel the daemon gracefully
-    daemon_task.cancel()
-    try:
-        await daemon_task
-    except asyncio.CancelledError:
-        pass
+    # Shutdown: cancel the background tasks gracefully
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
 
 
 app = FastAPI(title="HomeVPN", version="1.0.0", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service surchargé, réessayez dans quelques secondes"},
+        headers={"Retry-After": str(PASSWORD_RETRY_AFTER_SECONDS)},
+    )
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -1,6 +1,16 @@
 from app.models.user import User
 from app.models.tunnel import Tunnel
 from app.models.activity_log import ActivityLog
+from app.models.email_campaign import EmailCampaign
+from app.models.email_outbox import EmailOutbox
 from app.models.system_flag import SystemFlag
+from app.models.ip_lease import IPLease
+from app.models.gateway_node import GatewayNode
+from app.models.peer_status import PeerStatus
+from app.models.tunnel_tombstone import TunnelTombstone
+from app.models.traffic import TrafficDaily, TrafficHourly, TrafficSample
 
-__all__ = ["User", "Tunnel", "ActivityLog", "SystemFlag"]
+__all__ = [
+    "User", "Tunnel", "ActivityLog", "EmailCampaign", "EmailOutbox", "SystemFlag", "IPLease", "GatewayNode",
+    "PeerStatus", "TunnelTombstone", "TrafficSample", "TrafficHourly", "TrafficDaily",
+]
@@ -0,0 +1,37 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Boolean, DateTime, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class EmailCampaign(Base):
+    """An admin announcement, fanned out to the outbox one row per recipient.
+
+    The audience filters are combined (AND). Recipients are queued in
+    users.id order; `last_user_id` lets an interrupted fan-out resume.
+    """
+
+    __tablename__ = "email_campaigns"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    body: Mapped[str] = mapped_column(Text, nullable=False)
+    active_only: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    beta_testers: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    with_tunnels: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    # queuing (fan-out in progress) / queued (every recipient is in the outbox)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queuing")
+    # Audience size when the campaign was created
+    recipients: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    queued: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_user_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)
+    created_by: Mapped[str] = mapped_column(String(255), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
+    queued_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Boolean, DateTime, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+LOCAL_NODE_ID = "local"
+
+
+class GatewayNode(Base):
+    """A WireGuard gateway: one interface, its public endpoint and its address pools.
+
+    The "local" node is the interface on the API host (created from the
+    settings by migration 014). Other nodes are driven remotely (see
+    services/gateway.py) and reached by HAProxy through a route to their
+    pools via `address`.
+    """
+
+    __tablename__ = "gateway_nodes"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    # Driver used for `wg` commands on the node: local, ssh
+    driver: Mapped[str] = mapped_column(String(16), nullable=False, default="local")
+    # Private address of the node (ssh target, next hop towards its pools)
+    address: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    interface: Mapped[str] = mapped_column(String(15), nullable=False)
+    endpoint: Mapped[str] = mapped_column(String(255), nullable=False)
+    vpn_subnet: Mapped[str] = mapped_column(String(43), nullable=False)
+    vpn_server_ip: Mapped[str] = mapped_column(String(39), nullable=False)
+    device_subnet: Mapped[str] = mapped_column(String(43), nullable=False)
+    device_gateway_ip: Mapped[str] = mapped_column(String(39), nullable=False)
+    # Placement stops assigning new tunnels at max_peers or when inactive
+    max_peers: Mapped[int] = mapped_column(Integer, nullable=False, default=10000)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
@@ -0,0 +1,42 @@
+import uuid
+from typing import Optional
+
+from sqlalchemy import ForeignKey, Index, String, text
+from sqlalchemy.dialects.postgresql import INET, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class IPLease(Base):
+    """One row per allocatable host address of each node's VPN and device pools.
+
+    A lease is held while tunnel_id is set. The foreign key is deferred so
+    an address can be claimed before the tunnel row is inserted in the same
+    transaction, and cleared automatically when the tunnel is deleted.
+    """
+
+    __tablename__ = "ip_leases"
+    __table_args__ = (
+        Index(
+            "ix_ip_leases_free",
+            "node_id",
+            "pool",
+            "address",
+            postgresql_where=text("tunnel_id IS NULL"),
+        ),
+    )
+
+    pool: Mapped[str] = mapped_column(String(16), primary_key=True)
+    address: Mapped[str] = mapped_column(INET, primary_key=True)
+    # Gateway node owning the address (pools are disjoint across nodes)
+    node_id: Mapped[str] = mapped_column(
+        String(32), ForeignKey("gateway_nodes.id", ondelete="CASCADE"), nullable=False,
+        server_default="local",
+    )
+    tunnel_id: Mapped[Optional[uuid.UUID]] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("tunnels.id", ondelete="SET NULL", deferrable=True, initially="DEFERRED"),
+        nullable=True,
+        index=True,
+    )
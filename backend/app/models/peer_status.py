@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, Boolean, DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class PeerStatus(Base):
+    """Liveness of one WireGuard peer, written by the leader peer status sampler.
+
+    Shared by every API process so they all report the same connectivity,
+    and so a new leader resumes the rx history instead of starting over.
+    """
+
+    __tablename__ = "peer_status"
+
+    public_key: Mapped[str] = mapped_column(String(44), primary_key=True)
+    rx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    tx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    has_handshake: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    rx_changed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    connected_since: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,47 @@
+import uuid
+from datetime import date, datetime
+
+from sqlalchemy import BigInteger, Date, DateTime, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class TrafficSample(Base):
+    """Bytes transferred by a tunnel since the previous sample.
+
+    Partitioned by day on sampled_at (see migration 013); partitions are
+    created ahead and dropped after TRAFFIC_RAW_RETENTION_DAYS.
+    """
+
+    __tablename__ = "traffic_samples"
+    __table_args__ = {"postgresql_partition_by": "RANGE (sampled_at)"}
+
+    # No single-column key on a partitioned table: the mapper key is composite
+    tunnel_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    sampled_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    rx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    tx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class TrafficHourly(Base):
+    __tablename__ = "traffic_hourly"
+
+    tunnel_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    hour: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, index=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    rx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    tx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class TrafficDaily(Base):
+    __tablename__ = "traffic_daily"
+    __table_args__ = (Index("ix_traffic_daily_user_day", "user_id", "day"),)
+
+    tunnel_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    rx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    tx_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Boolean, CheckConstraint, DateTime, ForeignKey, Integer, String, Text, func
+from sqlalchemy import BigInteger, Boolean, CheckConstraint, DateTime, ForeignKey, Integer, String, Text, func
 from sqlalchemy.dialects.postgresql import INET, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -41,11 +41,23 @@ class Tunnel(Base):
     client_public_key: Mapped[str] = mapped_column(Text, nullable=False)
     server_public_key: Mapped[str] = mapped_column(Text, nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    # Let's Encrypt certificate job state: pending / issued / failed
+    cert_status: Mapped[str] = mapped_column(String(16), default="pending", nullable=False)
+    cert_attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    cert_next_attempt_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
+    # Gateway node whose interface carries the peer
+    node_id: Mapped[str] = mapped_column(
+        String(32), ForeignKey("gateway_nodes.id"), nullable=False, server_default="local", index=True
+    )
+    # Drawn from tunnel_state_version by a trigger on every insert/update
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0", index=True)
 
     user = relationship("User", back_populates="tunnels")
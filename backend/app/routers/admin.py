@@ -1,20 +1,63 @@
+import logging
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.config import settings
-from app.database import get_db
-from app.dependencies import get_current_admin
+from app.database import async_session, get_db
+from app.dependencies import get_current_admin, is_still_authorized, security
 from app.models.activity_log import ActivityLog
+from app.models.email_campaign import EmailCampaign
+from app.models.email_outbox import EmailOutbox
+from app.models.gateway_node import GatewayNode
 from app.models.tunnel import Tunnel
+from app.models.tunnel_tombstone import TunnelTombstone
 from app.models.user import User
-from app.schemas.user import AdminTunnelResponse, AdminUserResponse, AdminUserUpdate
+from app.schemas.announcement import AnnouncementCreate, AnnouncementDetail, AnnouncementResponse
+from app.schemas.gateway import GatewayNodeCreate, GatewayNodeResponse, GatewayNodeUpdate
+from app.schemas.user import (
+    AdminTunnelDelta,
+    AdminTunnelResponse,
+    AdminTunnelState,
+    AdminUserResponse,
+    AdminUserUpdate,
+)
 from app.services.activity import log_activity
-from app.services.haproxy import request_haproxy_reload
-from app.services.wireguard import wireguard_service
+from app.services.announcements import (
+    EMAIL_CAMPAIGNS_CHANNEL,
+    campaign_progress,
+    count_audience,
+)
+from app.services.auth import password_hasher
+from app.services.certbot import CERT_PENDING, request_cert_issuance
+from app.services.email_outbox import email_sender, outbox_counts
+from app.services.executor import command_executor
+from app.services.gateway import (
+    GATEWAY_NODES_CHANNEL,
+    gateway_registry,
+    install_route,
+    node_loads,
+    node_routes,
+    overlapping_node,
+)
+from app.services.gateway_driver import DRIVERS
+from app.services.haproxy import current_config_version, haproxy_service, request_haproxy_reload
+from app.services.ip_allocator import ip_allocator
+from app.services.reconciler import remove_peers, request_reconcile, wireguard_reconciler
+from app.services.traffic import traffic_recorder
+from app.services.traffic_accounting import monthly_usage_by_tunnel, traffic_accountant, usage_version
+from app.services.tunnel_version import etag_matches, make_etag, tunnel_version
+from app.services.user_cache import user_cache
+from app.services.peer_status import peer_status_sampler, stream_tunnel_status
+from app.services.pg_notify import notify
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -70,20 +113,30 @@ async def update_user(
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
+    removed_peers: list[tuple[str, str]] = []
     if data.is_active is not None:
         user.is_active = data.is_active
         # Remove/restore all WireGuard peers on ban/unban
         tunnels_result = await db.execute(
             select(Tunnel).where(Tunnel.user_id == user.id)
         )
-        for tunnel in tunnels_result.scalars().all():
+        user_tunnels = tunnels_result.scalars().all()
+        if data.is_active:
             try:
-                if data.is_active:
-                    wireguard_service.add_peer(tunnel.client_public_key, str(tunnel.vpn_ip), str(tunnel.device_ip))
-                else:
-                    wireguard_service.remove_peer(tunnel.client_public_key)
+                # Tunnels deactivated by an admin stay without a peer
+                await gateway_registry.apply_peers(
+                    add=[
+                        (t.node_id, t.client_public_key, str(t.vpn_ip), str(t.device_ip))
+                        for t in user_tunnels
+                        if t.is_active
+                    ]
+                )
             except Exception:
-                pass
+                logger.exception("Failed to update WireGuard peers of %s", user.email)
+                request_reconcile()
+        else:
+            # Removed once the ban is committed
+            removed_peers = [(t.node_id, t.client_public_key) for t in user_tunnels]
     if data.is_admin is not None:
         if user.email == "contact@fredclement.fr":
             raise HTTPException(
@@ -98,6 +151,9 @@ async def update_user(
         user.max_tunnels = data.max_tunnels
 
     await db.commit()
+    # Other processes are notified by the users trigger
+    user_cache.invalidate(user.id)
+    await remove_peers(removed_peers)
     await db.refresh(user)
 
     # Log activity after commit (separate session, never blocks)
@@ -147,16 +203,14 @@ async def delete_user(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     user_email = user.email
-
-    # Remove all WireGuard peers before DB cascade delete
-    for tunnel in user.tunnels:
-        try:
-            wireguard_service.remove_peer(tunnel.client_public_key)
-        except Exception:
-            pass
+    peers = [(t.node_id, t.client_public_key) for t in user.tunnels]
 
     await db.delete(user)
     await db.commit()
+    user_cache.invalidate(user_id)
+
+    # Remove all WireGuard peers once the cascade delete is committed
+    await remove_peers(peers)
 
     # Regenerate HAProxy config
     await request_haproxy_reload()
@@ -167,43 +221,88 @@ async def delete_user(
 # ---- Tunnels ----
 
 
-@router.get("/tunnels", response_model=list[AdminTunnelResponse])
+def _admin_tunnel(
+    t: Tunnel, usage: dict[UUID, tuple[int, int]] | None = None
+) -> AdminTunnelState | AdminTunnelResponse:
+    """A tunnel as the admin endpoints return it, with its usage unless `usage` is None."""
+    state = AdminTunnelState(
+        id=t.id,
+        user_id=t.user_id,
+        user_email=t.user.email,
+        subdomain=t.subdomain,
+        target_port=t.target_port,
+        service_type=t.service_type,
+        vpn_ip=str(t.vpn_ip),
+        device_ip=str(t.device_ip),
+        use_device_ip=t.use_device_ip,
+        is_active=t.is_active,
+        full_domain=f"{t.subdomain}.{settings.domain}",
+        created_at=t.created_at,
+    )
+    if usage is None:
+        return state
+    rx_bytes, tx_bytes = usage.get(t.id, (0, 0))
+    return AdminTunnelResponse(
+        **state.model_dump(), monthly_rx_bytes=rx_bytes, monthly_tx_bytes=tx_bytes
+    )
+
+
+@router.get("/tunnels", response_model=list[AdminTunnelResponse] | AdminTunnelDelta)
 async def list_all_tunnels(
+    request: Request,
+    response: Response,
+    since: int | None = Query(None, ge=0),
     _admin: User = Depends(get_current_admin),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(Tunnel).options(selectinload(Tunnel.user)).order_by(Tunnel.created_at.desc())
+    """List all tunnels with their usage this month, or with `?since=<version>` only what changed.
+
+    The delta has no usage: usage changes are not versioned, and the ETag of
+    the full list follows the rollups instead.
+    """
+    version = await tunnel_version.get()
+    if since is None:
+        etag = make_etag("admin", version, usage_version(), "all")
+    else:
+        etag = make_etag("admin", version, since)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+    query = select(Tunnel).options(selectinload(Tunnel.user)).order_by(Tunnel.created_at.desc())
+    if since is None:
+        rows = (await db.execute(query)).scalars().all()
+        usage = await monthly_usage_by_tunnel(db)
+        return [_admin_tunnel(t, usage) for t in rows]
+
+    rows = (await db.execute(query.where(Tunnel.version > since))).scalars().all()
+    deleted = await db.execute(
+        select(TunnelTombstone.tunnel_id).where(TunnelTombstone.version > since)
+    )
+    return AdminTunnelDelta(
+        version=version, tunnels=[_admin_tunnel(t) for t in rows], deleted=deleted.scalars().all()
     )
-    tunnels = result.scalars().all()
-    return [
-        AdminTunnelResponse(
-            id=t.id,
-            user_id=t.user_id,
-            user_email=t.user.email,
-            subdomain=t.subdomain,
-            target_port=t.target_port,
-            service_type=t.service_type,
-            vpn_ip=str(t.vpn_ip),
-            device_ip=str(t.device_ip),
-            use_device_ip=t.use_device_ip,
-            is_active=t.is_active,
-            full_domain=f"{t.subdomain}.{settings.domain}",
-            created_at=t.created_at,
-        )
-        for t in tunnels
-    ]
 
 
 @router.get("/tunnels/status")
 async def all_tunnels_status(
+    request: Request,
+    response: Response,
     _admin: User = Depends(get_current_admin),
     db: AsyncSession = Depends(get_db),
 ):
     """Return WireGuard connection status for ALL tunnels."""
-    result = await db.execute(select(Tunnel))
-    tunnels = result.scalars().all()
-    peers_status = wireguard_service.get_peers_status()
+    snapshot = await peer_status_sampler.get()
+    etag = make_etag("admin", await tunnel_version.get(), peer_status_sampler.generation)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+    result = await db.execute(select(Tunnel.id, Tunnel.client_public_key))
+    tunnels = result.all()
+    peers_status = snapshot.peers
     default = {"connected": False, "connected_since": 0}
     return {
         str(t.id): peers_status.get(t.client_public_key, default)
@@ -211,6 +310,61 @@ async def all_tunnels_status(
     }
 
 
+@router.get("/tunnels/status/stream")
+async def all_tunnels_status_stream(
+    _admin: User = Depends(get_current_admin),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """Stream the connection status of ALL tunnels (Server-Sent Events)."""
+
+    async def load_tunnels() -> dict[str, str]:
+        async with async_session() as session:
+            result = await session.execute(select(Tunnel.client_public_key, Tunnel.id))
+            return {row.client_public_key: str(row.id) for row in result}
+
+    async def is_authorized() -> bool:
+        return await is_still_authorized(credentials.credentials, admin=True)
+
+    return StreamingResponse(
+        stream_tunnel_status(load_tunnels, is_authorized),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/tunnels/traffic/top")
+async def top_tunnels_by_traffic(
+    limit: int = Query(10, ge=1, le=100),
+    minutes: int = Query(5, ge=1, le=60),
+    _admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return the tunnels with the most traffic over the last `minutes`."""
+    top = traffic_recorder.top(limit, minutes)
+    if not top:
+        return []
+    result = await db.execute(
+        select(Tunnel.id, Tunnel.client_public_key, Tunnel.subdomain, User.email)
+        .join(User, User.id == Tunnel.user_id)
+        .where(Tunnel.client_public_key.in_([key for key, _, _ in top]))
+    )
+    tunnels = {row.client_public_key: row for row in result}
+    seconds = minutes * 60
+    return [
+        {
+            "tunnel_id": str(tunnels[key].id),
+            "subdomain": tunnels[key].subdomain,
+            "user_email": tunnels[key].email,
+            "rx_bytes": rx_bytes,
+            "tx_bytes": tx_bytes,
+            "rx_bytes_per_second": round(rx_bytes / seconds),
+            "tx_bytes_per_second": round(tx_bytes / seconds),
+        }
+        for key, rx_bytes, tx_bytes in top
+        if key in tunnels
+    ]
+
+
 @router.patch("/tunnels/{tunnel_id}", response_model=AdminTunnelResponse)
 async def admin_update_tunnel(
     tunnel_id: UUID,
@@ -228,38 +382,154 @@ async def admin_update_tunnel(
     if "is_active" in data:
         tunnel.is_active = data["is_active"]
         if data["is_active"]:
-            wireguard_service.add_peer(tunnel.client_public_key, str(tunnel.vpn_ip), str(tunnel.device_ip))
-        else:
-            try:
-                wireguard_service.remove_peer(tunnel.client_public_key)
-            except Exception:
-                pass
+            wireguard = await gateway_registry.service(tunnel.node_id)
+            await wireguard.add_peer(tunnel.client_public_key, str(tunnel.vpn_ip), str(tunnel.device_ip))
 
     await db.commit()
     await db.refresh(tunnel)
+    if "is_active" in data and not tunnel.is_active:
+        await remove_peers([(tunnel.node_id, tunnel.client_public_key)])
 
     await request_haproxy_reload()
 
+    if tunnel.is_active and tunnel.cert_status == CERT_PENDING:
+        request_cert_issuance()
+
     if "is_active" in data:
         state = "actif" if tunnel.is_active else "inactif"
         await log_activity(_admin.email, "admin_toggle_tunnel", detail=f"{tunnel.subdomain} → {state}")
 
-    return AdminTunnelResponse(
-        id=tunnel.id,
-        user_id=tunnel.user_id,
-        user_email=tunnel.user.email,
-        subdomain=tunnel.subdomain,
-        target_port=tunnel.target_port,
-        service_type=tunnel.service_type,
-        vpn_ip=str(tunnel.vpn_ip),
-        device_ip=str(tunnel.device_ip),
-        use_device_ip=tunnel.use_device_ip,
-        is_active=tunnel.is_active,
-        full_domain=f"{tunnel.subdomain}.{settings.domain}",
-        created_at=tunnel.created_at,
+    return _admin_tunnel(tunnel, await monthly_usage_by_tunnel(db, [tunnel.id]))
+
+
+# ---- Gateway nodes ----
+
+
+def _node_response(node: GatewayNode, loads: dict[str, tuple[int, int]]) -> GatewayNodeResponse:
+    tunnel_count, traffic_bytes = loads.get(node.id, (0, 0))
+    return GatewayNodeResponse(
+        id=node.id,
+        driver=node.driver,
+        address=node.address,
+        interface=node.interface,
+        endpoint=node.endpoint,
+        vpn_subnet=node.vpn_subnet,
+        device_subnet=node.device_subnet,
+        max_peers=node.max_peers,
+        is_active=node.is_active,
+        created_at=node.created_at,
+        tunnel_count=tunnel_count,
+        traffic_bytes=traffic_bytes,
     )
 
 
+@router.get("/nodes", response_model=list[GatewayNodeResponse])
+async def list_nodes(
+    _admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """List gateway nodes with their tunnel count and recent traffic."""
+    result = await db.execute(select(GatewayNode).order_by(GatewayNode.created_at))
+    loads = await node_loads(db)
+    return [_node_response(node, loads) for node in result.scalars().all()]
+
+
+@router.post("/nodes", response_model=GatewayNodeResponse, status_code=status.HTTP_201_CREATED)
+async def create_node(
+    data: GatewayNodeCreate,
+    admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Register a gateway node and create the leases of its address pools."""
+    if data.driver not in DRIVERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown driver (available: {', '.join(sorted(DRIVERS))})",
+        )
+    overlap = await overlapping_node(db, [data.vpn_subnet, data.device_subnet])
+    if overlap is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Subnets overlap those of node {overlap}",
+        )
+    node = GatewayNode(**data.model_dump())
+    db.add(node)
+    try:
+        await db.flush()
+        await ip_allocator.add_pools(
+            db, node.id, data.vpn_subnet, data.vpn_server_ip,
+            data.device_subnet, data.device_gateway_ip,
+        )
+        # HAProxy must reach the node's tunnels before any is placed there
+        for subnet, via in node_routes(node):
+            try:
+                await install_route(subnet, via)
+            except Exception as e:
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_502_BAD_GATEWAY,
+                    detail=f"Cannot route {subnet} via {via}: {e}",
+                )
+        await notify(db, GATEWAY_NODES_CHANNEL, node.id)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Node id already exists or its subnets overlap another node",
+        )
+    await db.refresh(node)
+
+    await log_activity(admin.email, "admin_add_node", detail=f"{node.id} ({node.endpoint})")
+    return _node_response(node, {})
+
+
+@router.patch("/nodes/{node_id}", response_model=GatewayNodeResponse)
+async def update_node(
+    node_id: str,
+    data: GatewayNodeUpdate,
+    admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Change a node's endpoint (for new configs), capacity, or stop placing tunnels on it."""
+    node = await db.get(GatewayNode, node_id)
+    if not node:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Node not found")
+
+    for field, value in data.model_dump(exclude_none=True).items():
+        setattr(node, field, value)
+    await notify(db, GATEWAY_NODES_CHANNEL, node.id)
+    await db.commit()
+    await db.refresh(node)
+
+    await log_activity(admin.email, "admin_update_node", detail=node.id)
+    return _node_response(node, await node_loads(db))
+
+
+# ---- System ----
+
+
+@router.get("/system")
+async def system_metrics(
+    _admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return runtime metrics of the API process (external commands, ...)."""
+    return {
+        "commands": command_executor.metrics(),
+        "passwords": password_hasher.status(),
+        "user_cache": user_cache.status(),
+        "wireguard": wireguard_reconciler.status(),
+        "gateways": gateway_registry.status(),
+        "email": {**email_sender.status(), "outbox": await outbox_counts(db)},
+        "traffic": traffic_accountant.status(),
+        "haproxy": {
+            "requested_version": await current_config_version(db),
+            **haproxy_service.status(),
+        },
+    }
+
+
 # ---- Activity log ----
 
 
@@ -293,3 +563,132 @@ async def list_activity(
         }
         for log in logs
     ]
+
+
+# ---- Email outbox ----
+
+
+@router.get("/emails")
+async def list_emails(
+    status_filter: str | None = Query(default=None, alias="status", pattern="^(pending|sent|failed)$"),
+    limit: int = Query(default=50, ge=1, le=200),
+    offset: int = Query(default=0, ge=0),
+    _admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return queued and sent emails with their delivery state (newest first)."""
+    query = select(
+        EmailOutbox.id,
+        EmailOutbox.to_email,
+        EmailOutbox.subject,
+        EmailOutbox.status,
+        EmailOutbox.attempts,
+        EmailOutbox.last_error,
+        EmailOutbox.created_at,
+        EmailOutbox.sent_at,
+    )
+    if status_filter:
+        query = query.where(EmailOutbox.status == status_filter)
+    result = await db.execute(
+        query.order_by(EmailOutbox.created_at.desc()).offset(offset).limit(limit)
+    )
+    return [
+        {
+            "id": row.id,
+            "to_email": row.to_email,
+            "subject": row.subject,
+            "status": row.status,
+            "attempts": row.attempts,
+            "last_error": row.last_error,
+            "created_at": row.created_at.isoformat(),
+            "sent_at": row.sent_at.isoformat() if row.sent_at else None,
+        }
+        for row in result.all()
+    ]
+
+
+# ---- Announcements ----
+
+
+def _announcement_response(
+    campaign: EmailCampaign, progress: dict[str, int], model=AnnouncementResponse, **extra
+):
+    fields = {name: getattr(campaign, name) for name in model.model_fields if hasattr(campaign, name)}
+    return model(
+        **fields,
+        sent=progress.get("sent", 0),
+        pending=progress.get("pending", 0),
+        failed=progress.get("failed", 0),
+        **extra,
+    )
+
+
+@router.post("/announcements", response_model=AnnouncementResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_announcement(
+    data: AnnouncementCreate,
+    admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Email an announcement to the users matching the filters.
+
+    Recipients are queued in the outbox in the background; follow the
+    progress with GET /announcements/{id}.
+    """
+    recipients = await count_audience(db, data.active_only, data.beta_testers, data.with_tunnels)
+    if recipients == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Aucun utilisateur ne correspond aux filtres",
+        )
+    campaign = EmailCampaign(**data.model_dump(), recipients=recipients, created_by=admin.email)
+    db.add(campaign)
+    await db.flush()
+    await notify(db, EMAIL_CAMPAIGNS_CHANNEL, str(campaign.id))
+    await db.commit()
+    await db.refresh(campaign)
+
+    await log_activity(
+        admin.email, "admin_send_announcement", detail=f"{campaign.subject} ({recipients} destinataires)"
+    )
+    return _announcement_response(campaign, {})
+
+
+@router.get("/announcements", response_model=list[AnnouncementResponse])
+async def list_announcements(
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    _admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return announcements (newest first) with their delivery progress."""
+    result = await db.execute(
+        select(EmailCampaign).order_by(EmailCampaign.created_at.desc()).offset(offset).limit(limit)
+    )
+    campaigns = result.scalars().all()
+    progress = await campaign_progress(db, [campaign.id for campaign in campaigns])
+    return [_announcement_response(campaign, progress[campaign.id]) for campaign in campaigns]
+
+
+@router.get("/announcements/{campaign_id}", response_model=AnnouncementDetail)
+async def get_announcement(
+    campaign_id: int,
+    bounces_limit: int = Query(default=100, ge=0, le=1000),
+    _admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return an announcement, its delivery progress and its failed recipients."""
+    campaign = await db.get(EmailCampaign, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Announcement not found")
+    progress = await campaign_progress(db, [campaign.id])
+    result = await db.execute(
+        select(EmailOutbox.to_email, EmailOutbox.last_error, EmailOutbox.attempts)
+        .where(EmailOutbox.campaign_id == campaign.id, EmailOutbox.status == "failed")
+        .order_by(EmailOutbox.id)
+        .limit(bounces_limit)
+    )
+    bounces = [
+        {"to_email": row.to_email, "last_error": row.last_error, "attempts": row.attempts}
+        for row in result.all()
+    ]
+    return _announcement_response(campaign, progress[campaign.id], AnnouncementDetail, bounces=bounces)
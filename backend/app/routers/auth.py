@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from sqlalchemy import func, select
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -19,7 +19,13 @@ from app.schemas.user import (
     UserRegister,
     UserResponse,
 )
-from app.services.auth import create_access_token, hash_password, verify_password
+from app.services.auth import (
+    PasswordHasherBusy,
+    create_access_token,
+    hash_password,
+    password_hasher,
+    verify_password,
+)
 from app.services.activity import log_activity
 from app.services.email import (
     generate_password,
@@ -57,7 +63,7 @@ async def register(request: Request, data: UserRegister, db: AsyncSession = Depe
 
     user = User(
         email=data.email,
-        password_hash=hash_password(password),
+        password_hash=await hash_password(password),
         is_verified=False,
         verification_code=code,
         verification_expires=datetime.now(timezone.utc) + timedelta(minutes=15),
@@ -67,12 +73,12 @@ async def register(request: Request, data: UserRegister, db: AsyncSession = Depe
     await db.refresh(user)
 
     try:
-        send_verification_email(data.email, code, password)
+        await send_verification_email(data.email, code, password)
     except Exception:
         pass
 
     try:
-        send_new_user_notification(data.email)
+        await send_new_user_notification(data.email)
     except Exception:
         pass
 
@@ -122,11 +128,11 @@ async def resend_code(request: Request, data: ResendRequest, db: AsyncSession =
 
     user.verification_code = code
     user.verification_expires = datetime.now(timezone.utc) + timedelta(minutes=15)
-    user.password_hash = hash_password(password)
+    user.password_hash = await hash_password(password)
     await db.commit()
 
     try:
-        send_verification_email(data.email, code, password)
+        await send_verification_email(data.email, code, password)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -144,11 +150,11 @@ async def forgot_password(request: Request, data: ForgotPasswordRequest, db: Asy
 
     if user and user.is_active:
         new_password = generate_password()
-        user.password_hash = hash_password(new_password)
+        user.password_hash = await hash_password(new_password)
         await db.commit()
 
         try:
-            send_new_password_email(data.email, new_password)
+            await send_new_password_email(data.email, new_password)
         except Exception:
             pass
 
@@ -161,7 +167,10 @@ async def forgot_password(request: Request, data: ForgotPasswordRequest, db: Asy
 async def login(request: Request, data: UserLogin, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(User).where(User.email == data.email))
     user = result.scalar_one_or_none()
-    if not user or not verify_password(data.password, user.password_hash):
+    # End the read transaction: don't hold a pooled connection while the
+    # password check waits for a worker
+    await db.commit()
+    if not user or not await verify_password(data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou mot de passe incorrect",
@@ -176,6 +185,23 @@ async def login(request: Request, data: UserLogin, db: AsyncSession = Depends(ge
             status_code=status.HTTP_403_FORBIDDEN,
             detail="not_verified",
         )
+    if password_hasher.needs_rehash(user.password_hash):
+        # Best effort: a busy hasher skips the upgrade, never the login
+        try:
+            new_hash = await hash_password(data.password)
+        except PasswordHasherBusy:
+            new_hash = None
+        if new_hash is not None:
+            # Unless the password changed meanwhile (reset, concurrent login)
+            result = await db.execute(
+                update(User)
+                .where(User.id == user.id, User.password_hash == user.password_hash)
+                .values(password_hash=new_hash)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if result.rowcount:
+                password_hasher.stats["rehashed"] += 1
     await log_activity(user.email, "login")
 
     token = create_access_token(user.id)
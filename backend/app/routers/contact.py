@@ -39,7 +39,7 @@ async def contact(
         attachments.append((f.filename or "fichier", content))
 
     try:
-        send_contact_email(
+        await send_contact_email(
             from_email=user.email,
             subject=subject,
             message=message,
@@ -1,23 +1,35 @@
+import logging
+import uuid
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import PlainTextResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database import get_db
-from app.dependencies import get_current_user
+from app.database import async_session, get_db
+from app.dependencies import get_current_user, is_still_authorized, security
 from app.services.activity import log_activity
 from app.models.tunnel import Tunnel
+from app.models.tunnel_tombstone import TunnelTombstone
 from app.models.user import User
-from app.schemas.tunnel import SubdomainCheck, TunnelCreate, TunnelResponse, TunnelUpdate
+from app.schemas.tunnel import SubdomainCheck, TunnelCreate, TunnelDelta, TunnelResponse, TunnelUpdate
 from app.services.crypto import decrypt_key, encrypt_key
-from app.services.certbot import certbot_service
+from app.services.certbot import CERT_PENDING, request_cert_issuance
+from app.services.gateway import NoGatewayCapacityError, gateway_registry, place_tunnel
 from app.services.haproxy import request_haproxy_reload
 from app.services.ip_allocator import ip_allocator
+from app.services.reconciler import remove_peers
+from app.services.traffic import TRAFFIC_SLOTS, traffic_recorder
+from app.services.traffic_accounting import monthly_usage_by_user
+from app.services.tunnel_version import etag_matches, make_etag, tunnel_version
 from app.services.email import send_tunnel_created_email
-from app.services.wireguard import wireguard_service
+from app.services.peer_status import peer_status_sampler, stream_tunnel_status
+from app.services.wireguard import generate_keypair
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -38,6 +50,7 @@ def _to_response(tunnel: Tunnel) -> TunnelResponse:
         device_ip=str(tunnel.device_ip),
         use_device_ip=tunnel.use_device_ip,
         is_active=tunnel.is_active,
+        cert_status=tunnel.cert_status,
         full_domain=f"{tunnel.subdomain}.{settings.domain}",
         created_at=tunnel.created_at,
         updated_at=tunnel.updated_at,
@@ -60,15 +73,24 @@ async def check_subdomain(
 
 @router.get("/status")
 async def tunnels_status(
+    request: Request,
+    response: Response,
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """Return WireGuard connection status for each of the user's tunnels."""
+    snapshot = await peer_status_sampler.get()
+    etag = make_etag(user.id, await tunnel_version.get_user(user.id), peer_status_sampler.generation)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
     result = await db.execute(
         select(Tunnel).where(Tunnel.user_id == user.id)
     )
     tunnels = result.scalars().all()
-    peers_status = wireguard_service.get_peers_status()
+    peers_status = snapshot.peers
     default = {"connected": False, "connected_since": 0}
     return {
         str(t.id): peers_status.get(t.client_public_key, default)
@@ -76,16 +98,75 @@ async def tunnels_status(
     }
 
 
-@router.get("/", response_model=list[TunnelResponse])
+@router.get("/status/stream")
+async def tunnels_status_stream(
+    user: User = Depends(get_current_user),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """Stream the connection status of the user's tunnels (Server-Sent Events)."""
+    user_id = user.id
+
+    async def load_tunnels() -> dict[str, str]:
+        # Short-lived session: the stream must not hold a connection open
+        async with async_session() as session:
+            result = await session.execute(
+                select(Tunnel.client_public_key, Tunnel.id).where(Tunnel.user_id == user_id)
+            )
+            return {row.client_public_key: str(row.id) for row in result}
+
+    async def is_authorized() -> bool:
+        return await is_still_authorized(credentials.credentials)
+
+    return StreamingResponse(
+        stream_tunnel_status(load_tunnels, is_authorized),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/usage")
+async def monthly_usage(
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return the bytes transferred by all the user's tunnels this month (UTC)."""
+    rx_bytes, tx_bytes = await monthly_usage_by_user(db, user.id)
+    return {"rx_bytes": rx_bytes, "tx_bytes": tx_bytes}
+
+
+@router.get("/", response_model=list[TunnelResponse] | TunnelDelta)
 async def list_tunnels(
+    request: Request,
+    response: Response,
+    since: int | None = Query(None, ge=0),
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(Tunnel).where(Tunnel.user_id == user.id).order_by(Tunnel.created_at.desc())
-    )
+    """List the user's tunnels, or with `?since=<version>` only what changed."""
+    version = await tunnel_version.get_user(user.id)
+    etag = make_etag(user.id, version, since if since is not None else "all")
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+    query = select(Tunnel).where(Tunnel.user_id == user.id).order_by(Tunnel.created_at.desc())
+    if since is None:
+        result = await db.execute(query)
+        return [_to_response(t) for t in result.scalars().all()]
+
+    result = await db.execute(query.where(Tunnel.version > since))
     tunnels = result.scalars().all()
-    return [_to_response(t) for t in tunnels]
+    deleted = await db.execute(
+        select(TunnelTombstone.tunnel_id).where(
+            TunnelTombstone.user_id == user.id, TunnelTombstone.version > since
+        )
+    )
+    return TunnelDelta(
+        version=version,
+        tunnels=[_to_response(t) for t in tunnels],
+        deleted=deleted.scalars().all(),
+    )
 
 
 @router.post("/", response_model=TunnelResponse, status_code=status.HTTP_201_CREATED)
@@ -122,16 +203,26 @@ async def create_tunnel(
             detail="Subdomain already taken",
         )
 
-    # Allocate IPs
-    vpn_ip = await ip_allocator.allocate_next_ip(db)
-    device_ip = await ip_allocator.allocate_next_device_ip(db)
+    # Pick a gateway node and lease IPs from its pools (committed together
+    # with the tunnel row)
+    try:
+        node_id = await place_tunnel(db)
+    except NoGatewayCapacityError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No gateway capacity left, try again later",
+        )
+    tunnel_id = uuid.uuid4()
+    vpn_ip, device_ip = await ip_allocator.allocate(db, tunnel_id, node_id)
+    wireguard = await gateway_registry.service(node_id)
 
     # Generate WireGuard keypair
-    private_key, public_key = wireguard_service.generate_keypair()
-    server_public_key = wireguard_service.get_server_public_key()
+    private_key, public_key = generate_keypair()
+    server_public_key = await wireguard.get_server_public_key()
 
     # Create tunnel in DB
     tunnel = Tunnel(
+        id=tunnel_id,
         user_id=user.id,
         subdomain=subdomain,
         target_port=data.target_port,
@@ -139,6 +230,7 @@ async def create_tunnel(
         use_device_ip=data.use_device_ip,
         vpn_ip=vpn_ip,
         device_ip=device_ip,
+        node_id=node_id,
         client_private_key=encrypt_key(private_key),
         client_public_key=public_key,
         server_public_key=server_public_key,
@@ -149,7 +241,7 @@ async def create_tunnel(
 
     # Add WireGuard peer
     try:
-        wireguard_service.add_peer(public_key, vpn_ip, device_ip)
+        await wireguard.add_peer(public_key, vpn_ip, device_ip)
     except Exception as e:
         await db.delete(tunnel)
         await db.commit()
@@ -161,21 +253,22 @@ async def create_tunnel(
     # Regenerate HAProxy config
     await request_haproxy_reload()
 
-    # Request SSL certificate for the subdomain (non-blocking failure)
-    certbot_service.request_cert(subdomain)
+    # SSL certificate is issued in the background by the cert worker
+    request_cert_issuance()
 
     await log_activity(user.email, "tunnel_create", detail=subdomain)
 
     # Send welcome email with WireGuard config attached
     try:
         private_key = decrypt_key(tunnel.client_private_key)
-        config_text = wireguard_service.generate_client_config(
+        config_text = wireguard.generate_client_config(
             private_key=private_key,
             vpn_ip=vpn_ip,
             device_ip=device_ip,
             server_public_key=tunnel.server_public_key,
+            service_type=tunnel.service_type,
         )
-        send_tunnel_created_email(
+        await send_tunnel_created_email(
             to_email=user.email,
             subdomain=subdomain,
             full_domain=f"{subdomain}.{settings.domain}",
@@ -216,18 +309,19 @@ async def update_tunnel(
     if data.is_active is not None:
         tunnel.is_active = data.is_active
         if data.is_active:
-            wireguard_service.add_peer(tunnel.client_public_key, str(tunnel.vpn_ip), str(tunnel.device_ip))
-        else:
-            try:
-                wireguard_service.remove_peer(tunnel.client_public_key)
-            except Exception:
-                pass
+            wireguard = await gateway_registry.service(tunnel.node_id)
+            await wireguard.add_peer(tunnel.client_public_key, str(tunnel.vpn_ip), str(tunnel.device_ip))
 
     await db.commit()
     await db.refresh(tunnel)
+    if data.is_active is False:
+        await remove_peers([(tunnel.node_id, tunnel.client_public_key)])
 
     await request_haproxy_reload()
 
+    if tunnel.is_active and tunnel.cert_status == CERT_PENDING:
+        request_cert_issuance()
+
     if data.is_active is not None:
         state = "actif" if tunnel.is_active else "inactif"
         await log_activity(user.email, "tunnel_toggle", detail=f"{tunnel.subdomain} → {state}")
@@ -243,16 +337,14 @@ async def delete_tunnel(
 ):
     tunnel = await _get_user_tunnel(tunnel_id, user.id, db)
     subdomain = tunnel.subdomain
-
-    # Remove WireGuard peer
-    try:
-        wireguard_service.remove_peer(tunnel.client_public_key)
-    except Exception:
-        pass
+    peer = (tunnel.node_id, tunnel.client_public_key)
 
     await db.delete(tunnel)
     await db.commit()
 
+    # Remove WireGuard peer
+    await remove_peers([peer])
+
     # Regenerate HAProxy config
     await request_haproxy_reload()
 
@@ -268,11 +360,13 @@ async def download_config(
     tunnel = await _get_user_tunnel(tunnel_id, user.id, db)
     private_key = decrypt_key(tunnel.client_private_key)
 
-    config = wireguard_service.generate_client_config(
+    wireguard = await gateway_registry.service(tunnel.node_id)
+    config = wireguard.generate_client_config(
         private_key=private_key,
         vpn_ip=str(tunnel.vpn_ip),
         device_ip=str(tunnel.device_ip),
         server_public_key=tunnel.server_public_key,
+        service_type=tunnel.service_type,
     )
 
     return PlainTextResponse(
@@ -284,6 +378,18 @@ async def download_config(
     )
 
 
+@router.get("/{tunnel_id}/traffic")
+async def tunnel_traffic(
+    tunnel_id: UUID,
+    minutes: int = Query(60, ge=1, le=TRAFFIC_SLOTS),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return the tunnel's rx/tx bytes per minute over the last `minutes`."""
+    tunnel = await _get_user_tunnel(tunnel_id, user.id, db)
+    return traffic_recorder.history(tunnel.client_public_key, minutes)
+
+
 async def _get_user_tunnel(tunnel_id: UUID, user_id: UUID, db: AsyncSession) -> Tunnel:
     result = await db.execute(
         select(Tunnel).where(Tunnel.id == tunnel_id, Tunnel.user_id == user_id)
@@ -0,0 +1,46 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class AnnouncementCreate(BaseModel):
+    subject: str = Field(..., min_length=1, max_length=200)
+    # Plain text; blank lines separate paragraphs
+    body: str = Field(..., min_length=1, max_length=20000)
+    # Audience filters, combined
+    active_only: bool = True
+    beta_testers: bool = False
+    with_tunnels: bool = False
+
+
+class AnnouncementResponse(BaseModel):
+    id: int
+    subject: str
+    active_only: bool
+    beta_testers: bool
+    with_tunnels: bool
+    status: str
+    created_by: str
+    created_at: datetime
+    queued_at: Optional[datetime] = None
+    recipients: int
+    queued: int
+    # Outbox delivery state of the queued messages; failed = bounced or
+    # given up after retries
+    sent: int = 0
+    pending: int = 0
+    failed: int = 0
+
+    model_config = {"from_attributes": True}
+
+
+class AnnouncementBounce(BaseModel):
+    to_email: str
+    last_error: Optional[str] = None
+    attempts: int
+
+
+class AnnouncementDetail(AnnouncementResponse):
+    body: str
+    bounces: list[AnnouncementBounce] = []
@@ -0,0 +1,59 @@
+import ipaddress
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+
+class GatewayNodeCreate(BaseModel):
+    id: str = Field(..., min_length=1, max_length=32, pattern=r"^[a-z0-9]([a-z0-9-]*[a-z0-9])?$")
+    driver: str = "ssh"
+    address: Optional[str] = None
+    interface: str = Field(..., min_length=1, max_length=15)
+    endpoint: str = Field(..., min_length=1, max_length=255)
+    vpn_subnet: str
+    vpn_server_ip: str
+    device_subnet: str
+    device_gateway_ip: str
+    max_peers: int = Field(default=10000, ge=1)
+
+    @field_validator("vpn_subnet", "device_subnet")
+    @classmethod
+    def _check_subnet(cls, value: str) -> str:
+        return str(ipaddress.IPv4Network(value))
+
+    @model_validator(mode="after")
+    def _check_gateway_ips(self):
+        if ipaddress.IPv4Address(self.vpn_server_ip) not in ipaddress.IPv4Network(self.vpn_subnet):
+            raise ValueError("vpn_server_ip must be inside vpn_subnet")
+        if ipaddress.IPv4Address(self.device_gateway_ip) not in ipaddress.IPv4Network(self.device_subnet):
+            raise ValueError("device_gateway_ip must be inside device_subnet")
+        if ipaddress.IPv4Network(self.vpn_subnet).overlaps(ipaddress.IPv4Network(self.device_subnet)):
+            raise ValueError("vpn_subnet and device_subnet must not overlap")
+        if self.driver != "local" and not self.address:
+            raise ValueError("address is required for remote nodes")
+        return self
+
+
+class GatewayNodeUpdate(BaseModel):
+    endpoint: Optional[str] = Field(None, min_length=1, max_length=255)
+    max_peers: Optional[int] = Field(None, ge=1)
+    is_active: Optional[bool] = None
+
+
+class GatewayNodeResponse(BaseModel):
+    id: str
+    driver: str
+    address: Optional[str] = None
+    interface: str
+    endpoint: str
+    vpn_subnet: str
+    device_subnet: str
+    max_peers: int
+    is_active: bool
+    created_at: datetime
+    tunnel_count: int = 0
+    # rx + tx of the node's tunnels over the placement traffic window
+    traffic_bytes: int = 0
+
+    model_config = {"from_attributes": True}
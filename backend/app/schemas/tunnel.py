@@ -29,6 +29,7 @@ class TunnelResponse(BaseModel):
     device_ip: str
     use_device_ip: bool
     is_active: bool
+    cert_status: str
     full_domain: str
     created_at: datetime
     updated_at: datetime
@@ -36,6 +37,14 @@ class TunnelResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class TunnelDelta(BaseModel):
+    """Tunnels changed since a version (`?since=`), and ids of deleted ones."""
+
+    version: int
+    tunnels: list[TunnelResponse]
+    deleted: list[UUID]
+
+
 class SubdomainCheck(BaseModel):
     subdomain: str
     available: bool
@@ -58,7 +58,7 @@ class AdminUserResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
-class AdminTunnelResponse(BaseModel):
+class AdminTunnelState(BaseModel):
     id: UUID
     user_id: UUID
     user_email: str
@@ -75,6 +75,24 @@ class AdminTunnelResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class AdminTunnelResponse(AdminTunnelState):
+    # Current UTC month, as of the last traffic rollup
+    monthly_rx_bytes: int = 0
+    monthly_tx_bytes: int = 0
+
+
+class AdminTunnelDelta(BaseModel):
+    """Tunnels changed since a version (`?since=`), and ids of deleted ones.
+
+    Usage changes don't make a tunnel part of the delta, so it is left out;
+    the full list has the current usage.
+    """
+
+    version: int
+    tunnels: list[AdminTunnelState]
+    deleted: list[UUID]
+
+
 class AdminUserUpdate(BaseModel):
     is_active: bool | None = None
     is_admin: bool | None = None
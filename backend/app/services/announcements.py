@@ -0,0 +1,184 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import exists, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app.models.email_campaign import EmailCampaign
+from app.models.email_outbox import EmailOutbox
+from app.models.tunnel import Tunnel
+from app.models.user import User
+from app.services.crypto import encrypt_key
+from app.services.email_outbox import EMAIL_OUTBOX_CHANNEL, EMAIL_FAILED, EMAIL_PENDING, EMAIL_SENT
+from app.services.email_templates import TEMPLATES, build_bulk_message
+from app.services.pg_notify import notify, pg_listener
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_QUEUING = "queuing"
+CAMPAIGN_QUEUED = "queued"
+
+# NOTIFY channel waking the fan-out when a campaign is created
+EMAIL_CAMPAIGNS_CHANNEL = "email_campaigns"
+# Recipients fetched per round trip of the server-side cursor, and queued
+# (one multi-row insert, one commit) at a time
+FANOUT_CHUNK_SIZE = 500
+FANOUT_POLL_INTERVAL_SECONDS = 60
+# Advisory lock (with the campaign id) held by the process fanning it out
+FANOUT_LOCK_KEY = 0x48564541  # "HVEA"
+
+
+def audience_query(
+    active_only: bool, beta_testers: bool, with_tunnels: bool
+) -> Select:
+    """Recipients (users.id, email) of a campaign's filters, in users.id order."""
+    query = select(User.id, User.email).order_by(User.id)
+    if active_only:
+        query = query.where(User.is_active == True, User.is_verified == True)  # noqa: E712
+    if beta_testers:
+        query = query.where(User.is_beta_tester == True)  # noqa: E712
+    if with_tunnels:
+        query = query.where(exists().where(Tunnel.user_id == User.id))
+    return query
+
+
+async def count_audience(
+    db: AsyncSession, active_only: bool, beta_testers: bool, with_tunnels: bool
+) -> int:
+    query = audience_query(active_only, beta_testers, with_tunnels).order_by(None)
+    return (await db.execute(select(func.count()).select_from(query.subquery()))).scalar()
+
+
+async def campaign_progress(db: AsyncSession, campaign_ids: list[int]) -> dict[int, dict[str, int]]:
+    """Outbox messages per delivery status, per campaign."""
+    if not campaign_ids:
+        return {}
+    result = await db.execute(
+        select(EmailOutbox.campaign_id, EmailOutbox.status, func.count())
+        .where(EmailOutbox.campaign_id.in_(campaign_ids))
+        .group_by(EmailOutbox.campaign_id, EmailOutbox.status)
+    )
+    progress = {
+        campaign_id: {EMAIL_PENDING: 0, EMAIL_SENT: 0, EMAIL_FAILED: 0}
+        for campaign_id in campaign_ids
+    }
+    for campaign_id, status, count in result.all():
+        progress[campaign_id][status] = count
+    return progress
+
+
+class AnnouncementFanout:
+    """Queues each recipient of a campaign in the outbox.
+
+    Recipients are streamed from a server-side cursor, so memory stays at
+    one chunk whatever the number of users. The message is rendered and
+    encoded once per campaign; each chunk is inserted and committed with the
+    campaign's progress, so an interrupted fan-out resumes after the last
+    queued user instead of sending twice.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+
+    def on_notify(self, _payload: str | None) -> None:
+        self._wakeup.set()
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def run_pending(self) -> None:
+        from app.database import async_session
+
+        async with async_session() as db:
+            campaign_ids = (
+                await db.execute(
+                    select(EmailCampaign.id)
+                    .where(EmailCampaign.status == CAMPAIGN_QUEUING)
+                    .order_by(EmailCampaign.id)
+                )
+            ).scalars().all()
+        for campaign_id in campaign_ids:
+            await self.fan_out(campaign_id)
+
+    async def fan_out(self, campaign_id: int) -> None:
+        from app.database import async_session
+
+        # The reading session holds the cursor and, for its whole
+        # transaction, the campaign's lock; progress is committed by `db`.
+        async with async_session() as reader, async_session() as db:
+            locked = (
+                await reader.execute(
+                    select(func.pg_try_advisory_xact_lock(FANOUT_LOCK_KEY, campaign_id))
+                )
+            ).scalar()
+            if not locked:
+                return
+            campaign = await db.get(EmailCampaign, campaign_id)
+            if campaign is None or campaign.status != CAMPAIGN_QUEUING:
+                return
+
+            text, html = TEMPLATES["announcement"].render(
+                subject=campaign.subject,
+                paragraphs=[p.strip() for p in campaign.body.split("\n\n") if p.strip()],
+            )
+            build = build_bulk_message(campaign.subject, text, html)
+            subject = campaign.subject[:255]
+
+            query = audience_query(campaign.active_only, campaign.beta_testers, campaign.with_tunnels)
+            if campaign.last_user_id is not None:
+                query = query.where(User.id > campaign.last_user_id)
+            stream = await reader.stream(query.execution_options(yield_per=FANOUT_CHUNK_SIZE))
+            async for chunk in stream.partitions():
+                await db.execute(
+                    insert(EmailOutbox),
+                    [
+                        {
+                            "to_email": email,
+                            "subject": subject,
+                            "message": encrypt_key(build(email).decode("ascii")),
+                            "campaign_id": campaign_id,
+                        }
+                        for _, email in chunk
+                    ],
+                )
+                await db.execute(
+                    update(EmailCampaign)
+                    .where(EmailCampaign.id == campaign_id)
+                    .values(queued=EmailCampaign.queued + len(chunk), last_user_id=chunk[-1].id)
+                )
+                await notify(db, EMAIL_OUTBOX_CHANNEL)
+                await db.commit()
+
+            await db.execute(
+                update(EmailCampaign)
+                .where(EmailCampaign.id == campaign_id)
+                .values(status=CAMPAIGN_QUEUED, queued_at=datetime.now(timezone.utc))
+            )
+            await db.commit()
+            await db.refresh(campaign)
+            logger.info("Announcement %d queued for %d recipients", campaign_id, campaign.queued)
+
+
+announcement_fanout = AnnouncementFanout()
+pg_listener.subscribe(EMAIL_CAMPAIGNS_CHANNEL, announcement_fanout.on_notify)
+
+
+async def announcement_loop() -> None:
+    """Background loop queuing the recipients of new announcements."""
+    logger.info("Announcement fan-out started (chunk=%d)", FANOUT_CHUNK_SIZE)
+
+    try:
+        while True:
+            try:
+                await announcement_fanout.run_pending()
+            except Exception:
+                logger.exception("Announcement fan-out error (will retry)")
+            await announcement_fanout.wait(FANOUT_POLL_INTERVAL_SECONDS)
+    except asyncio.CancelledError:
+        logger.info("Announcement fan-out stopped")
@@ -1,3 +1,8 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from uuid import UUID
 
@@ -6,13 +11,106 @@ from jose import JWTError, jwt
 
 from app.config import settings
 
+logger = logging.getLogger(__name__)
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+# Seconds clients are asked to wait when the password pool is saturated
+PASSWORD_RETRY_AFTER_SECONDS = 2
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+class PasswordHasherBusy(Exception):
+    """Too many password hashes are waiting; the request should be retried later."""
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded thread pool instead of on the event loop.
+
+    bcrypt releases the GIL, so `workers` hashes run in parallel while the
+    loop keeps serving other requests. At most `max_queue` more wait for a
+    worker; beyond that, requests fail immediately with PasswordHasherBusy
+    (503) rather than piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int, max_queue: int, rounds: int):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        # Jobs submitted and not finished; released from the worker threads
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.stats = {"calls": 0, "rejected": 0, "rehashed": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+    def _release(self, _future: Future) -> None:
+        with self._pending_lock:
+            self._pending -= 1
+
+    async def _run(self, func, *args):
+        with self._pending_lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise PasswordHasherBusy()
+            self._pending += 1
+        self.stats["calls"] += 1
+        start = time.monotonic()
+        future = self._executor.submit(func, *args)
+        # Released when the job ends, not when the caller stops waiting: the
+        # job of a cancelled request (client gone) keeps its slot while it
+        # runs; one still queued is cancelled with it
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            # Includes the time spent waiting for a worker
+            duration = time.monotonic() - start
+            self.stats["total_seconds"] += duration
+            self.stats["max_seconds"] = max(self.stats["max_seconds"], duration)
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("utf-8")
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(
+            bcrypt.checkpw, plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True if the hash was made with another cost factor than `rounds`."""
+        # $2b$<cost>$<salt+hash>
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def status(self) -> dict:
+        calls = self.stats["calls"]
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "rounds": self.rounds,
+            "in_flight": min(self._pending, self.workers),
+            "queued": max(0, self._pending - self.workers),
+            "calls": calls,
+            "rejected": self.stats["rejected"],
+            "rehashed": self.stats["rehashed"],
+            "avg_ms": round(self.stats["total_seconds"] / calls * 1000, 1) if calls else 0.0,
+            "max_ms": round(self.stats["max_seconds"] * 1000, 1),
+        }
+
+
+password_hasher = PasswordHasher(
+    settings.password_hash_workers, settings.password_hash_max_queue, settings.bcrypt_rounds
+)
+
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 def create_access_token(user_id: UUID) -> str:
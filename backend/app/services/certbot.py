@@ -1,15 +1,35 @@
+import asyncio
 import logging
 import subprocess
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_, select, update
 
 from app.config import settings
+from app.models.tunnel import Tunnel
+from app.services.executor import command_executor
 
 logger = logging.getLogger(__name__)
 
+CERT_PENDING = "pending"
+CERT_ISSUED = "issued"
+CERT_FAILED = "failed"
+
+CERT_POLL_INTERVAL_SECONDS = 30
+CERT_MAX_ATTEMPTS = 5
+# Retry delay grows linearly with the number of failed attempts
+CERT_RETRY_BACKOFF_SECONDS = 300
+# A claimed job is hidden from other workers for this long (longer than
+# a certbot run, cert install and HAProxy reload)
+CERT_CLAIM_SECONDS = 600
+# Advisory lock serializing use of certbot_http_port across API processes
+CERTBOT_LOCK_KEY = 0x48564E43  # "HVNC"
+
 
 class CertbotService:
     """Manages Let's Encrypt certificates for tunnel subdomains via HTTP-01 challenge."""
 
-    def request_cert(self, subdomain: str) -> bool:
+    async def request_cert(self, subdomain: str) -> bool:
         """Request a Let's Encrypt certificate for {subdomain}.{domain}.
 
         Uses certbot standalone mode on the configured HTTP port.
@@ -20,7 +40,7 @@ class CertbotService:
         haproxy_cert = f"/etc/haproxy/certs/{domain}.pem"
 
         try:
-            result = subprocess.run(
+            result = await command_executor.run(
                 [
                     "sudo", "certbot", "certonly",
                     "--standalone",
@@ -30,27 +50,24 @@ class CertbotService:
                     "--agree-tos",
                     "--email", settings.certbot_email,
                 ],
-                capture_output=True,
-                text=True,
                 timeout=120,
+                check=False,
             )
 
             if result.returncode != 0:
-                logger.error(f"Certbot failed for {domain}: {result.stderr}")
+                logger.error(f"Certbot failed for {domain}: {result.stderr.decode(errors='replace')}")
                 return False
 
             # Combine key + fullchain for HAProxy
-            subprocess.run(
+            await command_executor.run(
                 ["sudo", "bash", "-c",
                  f"cat {cert_dir}/privkey.pem {cert_dir}/fullchain.pem > {haproxy_cert}"],
-                check=True,
                 timeout=10,
             )
 
             # Reload HAProxy to pick up new cert
-            subprocess.run(
+            await command_executor.run(
                 ["sudo", "systemctl", "reload", "haproxy"],
-                check=True,
                 timeout=10,
             )
 
@@ -63,3 +80,121 @@ class CertbotService:
 
 
 certbot_service = CertbotService()
+
+_cert_wakeup = asyncio.Event()
+
+
+def request_cert_issuance() -> None:
+    """Wake the cert worker so a newly pending tunnel is handled right away."""
+    _cert_wakeup.set()
+
+
+async def _claim_next_cert_job(session) -> tuple | None:
+    """Lease the oldest due pending tunnel: (id, subdomain, attempts) or None."""
+    now = datetime.now(timezone.utc)
+    due = (
+        select(Tunnel.id)
+        .where(
+            Tunnel.cert_status == CERT_PENDING,
+            Tunnel.is_active == True,  # noqa: E712
+            or_(Tunnel.cert_next_attempt_at.is_(None), Tunnel.cert_next_attempt_at <= now),
+        )
+        .order_by(Tunnel.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    # The job stays pending, hidden until the lease expires: a process that
+    # dies while certbot runs doesn't lose it
+    result = await session.execute(
+        update(Tunnel)
+        .where(Tunnel.id == due)
+        .values(cert_next_attempt_at=now + timedelta(seconds=CERT_CLAIM_SECONDS))
+        .returning(Tunnel.id, Tunnel.subdomain, Tunnel.cert_attempts)
+    )
+    job = result.first()
+    await session.commit()
+    return job
+
+
+async def _process_next_cert_job() -> bool:
+    """Issue the certificate of the oldest due pending tunnel.
+
+    Returns True if a job was processed, False if there was nothing to do
+    (or another API process currently owns the challenge port).
+    """
+    from app.database import async_session, engine
+
+    # Session-level lock on a connection outside any transaction: held
+    # while certbot runs without leaving a transaction open
+    lock_conn = await engine.connect()
+    locked = False
+    try:
+        locked = (
+            await lock_conn.execute(select(func.pg_try_advisory_lock(CERTBOT_LOCK_KEY)))
+        ).scalar()
+        await lock_conn.commit()
+        if not locked:
+            return False
+
+        async with async_session() as session:
+            job = await _claim_next_cert_job(session)
+        if job is None:
+            return False
+
+        issued = await certbot_service.request_cert(job.subdomain)
+        attempts = job.cert_attempts + 1
+        if issued:
+            values = {"cert_status": CERT_ISSUED, "cert_next_attempt_at": None}
+        elif attempts >= CERT_MAX_ATTEMPTS:
+            values = {"cert_status": CERT_FAILED, "cert_next_attempt_at": None}
+        else:
+            values = {
+                "cert_next_attempt_at": datetime.now(timezone.utc)
+                + timedelta(seconds=CERT_RETRY_BACKOFF_SECONDS * attempts),
+            }
+
+        # Core UPDATE: the tunnel may have been deleted while certbot ran
+        async with async_session() as session:
+            await session.execute(
+                update(Tunnel)
+                .where(Tunnel.id == job.id)
+                .values(cert_attempts=attempts, **values)
+            )
+            await session.commit()
+        return True
+    finally:
+        try:
+            if locked:
+                await lock_conn.execute(select(func.pg_advisory_unlock(CERTBOT_LOCK_KEY)))
+                await lock_conn.commit()
+        except Exception:
+            # Closing the DBAPI connection releases the lock too
+            await lock_conn.invalidate()
+        await lock_conn.close()
+
+
+async def cert_worker_loop() -> None:
+    """Background worker issuing pending certificates one at a time.
+
+    Only one certbot runs at a time (it binds certbot_http_port), so tunnel
+    creation never waits on it. Failed requests are retried with backoff and
+    marked failed after CERT_MAX_ATTEMPTS.
+    """
+    logger.info("Cert worker started (poll interval=%ds)", CERT_POLL_INTERVAL_SECONDS)
+
+    try:
+        while True:
+            try:
+                while await _process_next_cert_job():
+                    pass
+            except Exception:
+                logger.exception("Cert worker error (will retry)")
+
+            try:
+                await asyncio.wait_for(_cert_wakeup.wait(), CERT_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _cert_wakeup.clear()
+    except asyncio.CancelledError:
+        logger.info("Cert worker stopped")
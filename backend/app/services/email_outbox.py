@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import smtplib
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.email_outbox import EmailOutbox
+from app.services.crypto import decrypt_key, encrypt_key
+from app.services.pg_notify import notify, pg_listener
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PENDING = "pending"
+EMAIL_SENT = "sent"
+EMAIL_FAILED = "failed"
+
+# NOTIFY channel waking the sender when a message is queued
+EMAIL_OUTBOX_CHANNEL = "email_outbox"
+EMAIL_BATCH_SIZE = 50
+EMAIL_MAX_ATTEMPTS = 6
+# Retry delay doubles with each failed attempt: 1, 2, 4, 8, 16 min
+EMAIL_RETRY_BACKOFF_SECONDS = 60
+# Claimed messages are hidden from other senders for this long
+EMAIL_CLAIM_SECONDS = 300
+# A batch must be sent well within its claim, whatever the rate cap
+EMAIL_BATCH_SEND_SECONDS = EMAIL_CLAIM_SECONDS // 2
+# Fallback poll, in case a notification was missed
+EMAIL_POLL_INTERVAL_SECONDS = 30
+# The SMTP session is closed after this long without messages
+SMTP_IDLE_SECONDS = 60
+SMTP_TIMEOUT_SECONDS = 30
+# Delivered and failed messages are kept this long for reporting
+EMAIL_RETENTION_DAYS = 30
+EMAIL_PRUNE_INTERVAL_SECONDS = 3600
+
+
+class SMTPSession:
+    """One authenticated SMTP connection, reused across messages.
+
+    smtplib is blocking: every call runs in a worker thread. The connection
+    is opened on first use and re-opened once if the server dropped it.
+    """
+
+    def __init__(self):
+        self._smtp: smtplib.SMTP | None = None
+        self.last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            if settings.smtp_tls:
+                smtp.starttls()
+            if settings.smtp_user:
+                smtp.login(settings.smtp_user, settings.smtp_password)
+        except BaseException:
+            smtp.close()
+            raise
+        return smtp
+
+    def _send(self, from_addr: str, to_addrs: list[str], message: bytes) -> None:
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.sendmail(from_addr, to_addrs, message)
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = self._connect()
+            self._smtp.sendmail(from_addr, to_addrs, message)
+
+    async def send(self, from_addr: str, to_addrs: list[str], message: bytes) -> None:
+        try:
+            await asyncio.to_thread(self._send, from_addr, to_addrs, message)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # The server answered: the session is still usable
+            raise
+        except BaseException:
+            # Connection state unknown: start over next time
+            await self.close()
+            raise
+        finally:
+            self.last_used = time.monotonic()
+
+    def _quit(self, smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    async def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            await asyncio.to_thread(self._quit, smtp)
+
+    @property
+    def is_open(self) -> bool:
+        return self._smtp is not None
+
+
+class RateLimiter:
+    """Spaces out acquisitions to at most `rate` per second (0: no limit)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _is_permanent(error: Exception) -> bool:
+    """5xx answers and refused recipients won't succeed on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+async def enqueue_email(
+    to_email: str, subject: str, message: bytes, db: AsyncSession | None = None
+) -> None:
+    """Queue a wire-format message (see email_templates.build_message).
+
+    With `db`, the message is added to the caller's transaction and only
+    sent if it commits; otherwise it is committed in its own session.
+    """
+    entry = EmailOutbox(
+        to_email=to_email,
+        subject=subject[:255],
+        # Already CRLF and 7-bit: sent as is
+        message=encrypt_key(message.decode("ascii")),
+    )
+    if db is not None:
+        db.add(entry)
+        await notify(db, EMAIL_OUTBOX_CHANNEL)
+        return
+
+    from app.database import async_session
+
+    async with async_session() as session:
+        session.add(entry)
+        await notify(session, EMAIL_OUTBOX_CHANNEL)
+        await session.commit()
+
+
+class EmailSender:
+    """Delivers the outbox over a small pool of persistent SMTP sessions.
+
+    Due messages are claimed in batches with `FOR UPDATE SKIP LOCKED`, so
+    several API processes can run a sender without sending twice.
+    Transactional emails are claimed before announcements, and sending is
+    capped at `smtp_rate_limit` messages per second across the pool.
+    """
+
+    def __init__(self, pool_size: int, rate: float):
+        self.pool = [SMTPSession() for _ in range(max(1, pool_size))]
+        self.limiter = RateLimiter(rate)
+        self.batch_size = EMAIL_BATCH_SIZE
+        if rate > 0:
+            self.batch_size = max(1, min(EMAIL_BATCH_SIZE, int(rate * EMAIL_BATCH_SEND_SECONDS)))
+        self._wakeup = asyncio.Event()
+        self.stats = {"sent": 0, "retried": 0, "failed": 0, "last_error": None}
+
+    def on_notify(self, _payload: str | None) -> None:
+        self._wakeup.set()
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _claim(self, session: AsyncSession) -> list[EmailOutbox]:
+        now = datetime.now(timezone.utc)
+        due = (
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status == EMAIL_PENDING, EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.campaign_id.is_not(None), EmailOutbox.next_attempt_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(due))
+            .values(next_attempt_at=now + timedelta(seconds=EMAIL_CLAIM_SECONDS))
+            .returning(EmailOutbox)
+        )
+        claimed = list(result.scalars().all())
+        await session.commit()
+        return claimed
+
+    async def deliver_batch(self) -> int:
+        """Send one batch of due messages; returns how many were claimed."""
+        from app.database import async_session
+
+        async with async_session() as session:
+            batch = await self._claim(session)
+            queue: asyncio.Queue[EmailOutbox] = asyncio.Queue()
+            for entry in batch:
+                queue.put_nowait(entry)
+            commit_lock = asyncio.Lock()
+
+            async def worker(smtp: SMTPSession) -> None:
+                while not queue.empty():
+                    entry = queue.get_nowait()
+                    await self.limiter.acquire()
+                    error = await self._send(smtp, entry)
+                    # Record each outcome right away: a crash mid-batch must
+                    # not resend what was already delivered. Entries are only
+                    # modified under the lock, never while a commit flushes.
+                    async with commit_lock:
+                        self._record(entry, error)
+                        await session.commit()
+
+            await asyncio.gather(*(worker(smtp) for smtp in self.pool[: len(batch)]))
+        return len(batch)
+
+    async def _send(self, smtp: SMTPSession, entry: EmailOutbox) -> Exception | None:
+        """Send one message; returns the error, if any (entry is left untouched)."""
+        try:
+            await smtp.send(
+                settings.smtp_from, [entry.to_email], decrypt_key(entry.message).encode()
+            )
+        except Exception as e:
+            return e
+        return None
+
+    def _record(self, entry: EmailOutbox, exc: Exception | None) -> None:
+        entry.attempts += 1
+        if exc is not None:
+            error = f"{type(exc).__name__}: {exc}"[:1000]
+            entry.last_error = error
+            self.stats["last_error"] = error
+            if _is_permanent(exc) or entry.attempts >= EMAIL_MAX_ATTEMPTS:
+                entry.status = EMAIL_FAILED
+                entry.message = None
+                self.stats["failed"] += 1
+                logger.warning("Email %d to %s failed: %s", entry.id, entry.to_email, error)
+            else:
+                delay = EMAIL_RETRY_BACKOFF_SECONDS * 2 ** (entry.attempts - 1)
+                entry.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                self.stats["retried"] += 1
+            return
+        entry.status = EMAIL_SENT
+        entry.message = None
+        entry.sent_at = datetime.now(timezone.utc)
+        self.stats["sent"] += 1
+
+    async def prune(self) -> None:
+        from app.database import async_session
+
+        async with async_session() as session:
+            await session.execute(
+                delete(EmailOutbox).where(
+                    EmailOutbox.status != EMAIL_PENDING,
+                    EmailOutbox.created_at
+                    < datetime.now(timezone.utc) - timedelta(days=EMAIL_RETENTION_DAYS),
+                )
+            )
+            await session.commit()
+
+    async def close_idle(self, idle_seconds: float) -> None:
+        for smtp in self.pool:
+            if smtp.is_open and time.monotonic() - smtp.last_used > idle_seconds:
+                await smtp.close()
+
+    def status(self) -> dict:
+        return {
+            **self.stats,
+            "smtp_connections": sum(smtp.is_open for smtp in self.pool),
+            "smtp_pool_size": len(self.pool),
+            "rate_limit": self.limiter.rate,
+        }
+
+
+email_sender = EmailSender(settings.smtp_pool_size, settings.smtp_rate_limit)
+pg_listener.subscribe(EMAIL_OUTBOX_CHANNEL, email_sender.on_notify)
+
+
+async def outbox_counts(db: AsyncSession) -> dict[str, int]:
+    """Number of outbox messages per delivery status."""
+    result = await db.execute(
+        select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status)
+    )
+    return dict(result.all())
+
+
+async def email_sender_loop() -> None:
+    """Background loop delivering queued emails, woken by NOTIFY on enqueue."""
+    logger.info(
+        "Email sender started (batch=%d, connections=%d, rate limit=%s/s)",
+        email_sender.batch_size, len(email_sender.pool), email_sender.limiter.rate or "no",
+    )
+    next_prune = time.monotonic()
+
+    try:
+        while True:
+            try:
+                while await email_sender.deliver_batch() == email_sender.batch_size:
+                    pass
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + EMAIL_PRUNE_INTERVAL_SECONDS
+                    await email_sender.prune()
+            except Exception:
+                logger.exception("Email sender error (will retry)")
+            await email_sender.close_idle(SMTP_IDLE_SECONDS)
+            await email_sender.wait(EMAIL_POLL_INTERVAL_SECONDS)
+    except asyncio.CancelledError:
+        await email_sender.close_idle(0)
+        logger.info("Email sender stopped")
@@ -0,0 +1,147 @@
+import base64
+import secrets
+from collections.abc import Callable
+from email.header import Header
+from email.utils import encode_rfc2231
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, StrictUndefined, select_autoescape
+
+from app.config import settings
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates" / "email"
+
+# Templates are compiled once per process and never re-read from disk; the
+# bytecode cache lets later processes skip the compilation too. HTML output
+# is autoescaped (user input such as contact messages), plain text is not.
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html"]),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
+    undefined=StrictUndefined,
+)
+
+
+class EmailTemplate:
+    """A `<name>.txt` / `<name>.html` pair, rendered from the same context."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._text = _env.get_template(f"{name}.txt")
+        self._html = _env.get_template(f"{name}.html")
+
+    def render(self, **context) -> tuple[str, str]:
+        return self._text.render(context), self._html.render(context)
+
+
+TEMPLATES = {
+    name: EmailTemplate(name)
+    for name in (
+        "verification", "new_password", "new_user_notification", "tunnel_created", "contact", "announcement",
+    )
+}
+
+
+# --- MIME assembly ---------------------------------------------------------
+# Messages always have the same structure, so everything but the headers,
+# bodies and attachments is encoded once, as bytes, with CRLF line endings.
+# Bodies are base64: the boundary contains "=_", which base64 never does.
+
+_BOUNDARY = f"=_homeaccess_{secrets.token_hex(12)}"
+_ALT_BOUNDARY = f"{_BOUNDARY}_alt"
+
+_MIME_ALTERNATIVE = (
+    f'MIME-Version: 1.0\r\nContent-Type: multipart/alternative; boundary="{_ALT_BOUNDARY}"\r\n\r\n'
+).encode()
+_MIME_MIXED = (
+    f'MIME-Version: 1.0\r\nContent-Type: multipart/mixed; boundary="{_BOUNDARY}"\r\n\r\n'
+).encode()
+_MIXED_ALTERNATIVE_PART = (
+    f'--{_BOUNDARY}\r\nContent-Type: multipart/alternative; boundary="{_ALT_BOUNDARY}"\r\n\r\n'
+).encode()
+_TEXT_PART = (
+    f"--{_ALT_BOUNDARY}\r\n"
+    'Content-Type: text/plain; charset="utf-8"\r\n'
+    "Content-Transfer-Encoding: base64\r\n\r\n"
+).encode()
+_HTML_PART = (
+    f"--{_ALT_BOUNDARY}\r\n"
+    'Content-Type: text/html; charset="utf-8"\r\n'
+    "Content-Transfer-Encoding: base64\r\n\r\n"
+).encode()
+_ALT_END = f"--{_ALT_BOUNDARY}--\r\n".encode()
+_ATTACHMENT_PART = (
+    f"--{_BOUNDARY}\r\n"
+    "Content-Type: application/octet-stream\r\n"
+    "Content-Transfer-Encoding: base64\r\n"
+).encode()
+_MIXED_END = f"--{_BOUNDARY}--\r\n".encode()
+
+
+def _b64(data: bytes) -> bytes:
+    # 76-character lines, as required by RFC 2045
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+def _header_value(value: str) -> str:
+    value = " ".join(value.splitlines())
+    if value.isascii():
+        return value
+    return Header(value, "utf-8").encode()
+
+
+def _attachment_disposition(filename: str) -> bytes:
+    filename = " ".join(filename.splitlines()).replace('"', "")
+    if filename.isascii():
+        value = f'attachment; filename="{filename}"'
+    else:
+        value = f"attachment; filename*={encode_rfc2231(filename, 'utf-8')}"
+    return f"Content-Disposition: {value}\r\n\r\n".encode()
+
+
+def _headers(to_email: str, subject: str, reply_to: str | None) -> bytes:
+    headers = f"Subject: {_header_value(subject)}\r\nFrom: {settings.smtp_from}\r\nTo: {_header_value(to_email)}\r\n"
+    if reply_to:
+        headers += f"Reply-To: {_header_value(reply_to)}\r\n"
+    return headers.encode()
+
+
+def _body(text: str, html: str, attachments: list[tuple[str, bytes]] | None) -> bytes:
+    parts = [_MIME_MIXED if attachments else _MIME_ALTERNATIVE]
+    if attachments:
+        parts.append(_MIXED_ALTERNATIVE_PART)
+    parts += [
+        _TEXT_PART,
+        _b64(text.replace("\r\n", "\n").replace("\n", "\r\n").encode()),
+        _HTML_PART,
+        _b64(html.encode()),
+        _ALT_END,
+    ]
+    for filename, content in attachments or ():
+        parts += [_ATTACHMENT_PART, _attachment_disposition(filename), _b64(content)]
+    if attachments:
+        parts.append(_MIXED_END)
+    return b"".join(parts)
+
+
+def build_message(
+    to_email: str,
+    subject: str,
+    text: str,
+    html: str,
+    attachments: list[tuple[str, bytes]] | None = None,
+    reply_to: str | None = None,
+) -> bytes:
+    """Wire-format message (CRLF, 7-bit) with text and HTML alternatives."""
+    return _headers(to_email, subject, reply_to) + _body(text, html, attachments)
+
+
+def build_bulk_message(subject: str, text: str, html: str) -> Callable[[str], bytes]:
+    """Like build_message() for one message sent to many recipients.
+
+    The body is encoded once; the returned function only adds the headers
+    of each recipient.
+    """
+    body = _body(text, html, None)
+    return lambda to_email: _headers(to_email, subject, None) + body
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import subprocess
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_SECONDS = 30
+# Grace period between SIGTERM (relayed by sudo to the child) and SIGKILL
+TERMINATE_GRACE_SECONDS = 5
+
+# Max concurrent invocations per executable (sudo is stripped from the key)
+CONCURRENCY_LIMITS = {
+    "wg": 8,
+    "wg-quick": 1,  # rewrites the whole interface config file
+    "systemctl": 1,
+    "certbot": 1,  # binds the HTTP-01 challenge port
+    "ssh": 8,  # remote gateway nodes, shared by all of them
+}
+DEFAULT_CONCURRENCY = 4
+
+
+@dataclass(frozen=True)
+class CommandResult:
+    args: tuple[str, ...]
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    duration: float
+
+
+@dataclass
+class CommandStats:
+    calls: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    in_flight: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    exit_codes: dict[int, int] = field(default_factory=dict)
+
+
+def _command_name(args: list[str]) -> str:
+    for arg in args:
+        if arg != "sudo":
+            return arg
+    return "sudo"
+
+
+class CommandExecutor:
+    """Runs external commands without blocking the event loop.
+
+    Raises the same exceptions as `subprocess.run(..., check=True, timeout=...)`
+    (CalledProcessError, TimeoutExpired, FileNotFoundError) so callers keep
+    their existing error handling. Timed out or cancelled commands are
+    terminated before the exception propagates.
+    """
+
+    def __init__(self):
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._stats: dict[str, CommandStats] = {}
+
+    async def run(
+        self,
+        args: list[str],
+        *,
+        input: bytes | None = None,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        check: bool = True,
+    ) -> CommandResult:
+        name = _command_name(args)
+        stats = self._stats.setdefault(name, CommandStats())
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(CONCURRENCY_LIMITS.get(name, DEFAULT_CONCURRENCY))
+            self._semaphores[name] = semaphore
+
+        async with semaphore:
+            stats.calls += 1
+            stats.in_flight += 1
+            start = time.monotonic()
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *args,
+                    stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+                try:
+                    stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+                except asyncio.TimeoutError:
+                    stats.timeouts += 1
+                    await self._terminate(proc)
+                    raise subprocess.TimeoutExpired(args, timeout)
+                except asyncio.CancelledError:
+                    await self._terminate(proc)
+                    raise
+            except BaseException:
+                stats.failures += 1
+                raise
+            finally:
+                duration = time.monotonic() - start
+                stats.in_flight -= 1
+                stats.total_seconds += duration
+                stats.max_seconds = max(stats.max_seconds, duration)
+
+        returncode = proc.returncode
+        stats.exit_codes[returncode] = stats.exit_codes.get(returncode, 0) + 1
+        if returncode != 0:
+            stats.failures += 1
+            if check:
+                raise subprocess.CalledProcessError(returncode, args, stdout, stderr)
+
+        return CommandResult(
+            args=tuple(args),
+            returncode=returncode,
+            stdout=stdout,
+            stderr=stderr,
+            duration=duration,
+        )
+
+    async def _terminate(self, proc: asyncio.subprocess.Process) -> None:
+        try:
+            proc.terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), TERMINATE_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        except ProcessLookupError:
+            pass
+        except Exception:
+            logger.exception("Failed to terminate command (pid=%s)", proc.pid)
+
+    def metrics(self) -> dict[str, dict]:
+        """Per-command call counts, latency and exit-code distribution."""
+        return {
+            name: {
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "timeouts": stats.timeouts,
+                "in_flight": stats.in_flight,
+                "avg_ms": round(stats.total_seconds / stats.calls * 1000, 1) if stats.calls else 0.0,
+                "max_ms": round(stats.max_seconds * 1000, 1),
+                "exit_codes": dict(stats.exit_codes),
+            }
+            for name, stats in self._stats.items()
+        }
+
+
+command_executor = CommandExecutor()
@@ -0,0 +1,397 @@
+import asyncio
+import ipaddress
+import logging
+import time
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.gateway_node import LOCAL_NODE_ID, GatewayNode
+from app.models.traffic import TrafficHourly
+from app.models.tunnel import Tunnel
+from app.services.executor import command_executor
+from app.services.gateway_driver import make_driver
+from app.services.pg_notify import pg_listener
+from app.services.wireguard import (
+    SAVE_DEBOUNCE_SECONDS,
+    PeerState,
+    WireGuardService,
+    wait_any_save_requested,
+)
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel announcing gateway node changes to every API process
+GATEWAY_NODES_CHANNEL = "gateway_nodes"
+
+# Placement score = peers / max_peers + weight x share of the recent traffic
+PLACEMENT_TRAFFIC_WEIGHT = 1.0
+PLACEMENT_TRAFFIC_WINDOW = timedelta(hours=24)
+# Delay before a failed route change is tried again
+ROUTE_RETRY_SECONDS = 30
+
+
+class NoGatewayCapacityError(RuntimeError):
+    """No active gateway node can take another tunnel."""
+
+
+def _service_config(node: GatewayNode) -> tuple:
+    return (node.driver, node.address, node.interface, node.endpoint, node.vpn_server_ip)
+
+
+def node_routes(node: GatewayNode) -> list[tuple[str, str]]:
+    """(subnet, next hop) routes towards a remote node's pools."""
+    if node.driver == "local" or not node.address:
+        return []
+    return [(node.vpn_subnet, node.address), (node.device_subnet, node.address)]
+
+
+async def install_route(subnet: str, via: str) -> None:
+    # Allowed by the sudoers entry of deploy/install.sh
+    await command_executor.run(["sudo", "ip", "route", "replace", subnet, "via", via])
+
+
+class GatewayRegistry:
+    """WireGuard services of the gateway nodes, built from the gateway_nodes table.
+
+    Reloaded lazily after a notification on GATEWAY_NODES_CHANNEL (and after
+    the listener reconnects). A node whose settings did not change keeps its
+    service, and with it the liveness state of its peers.
+
+    Also exposes the aggregated peer view the status sampler expects from a
+    single WireGuardService (get_peers_status / peer_states / load_peer_states).
+    """
+
+    def __init__(self):
+        self._nodes: dict[str, GatewayNode] = {}
+        self._services: dict[str, WireGuardService] = {}
+        # Last status of each node, reused while its dump fails
+        self._status: dict[str, dict[str, dict]] = {}
+        # (subnet, next hop) routes installed towards remote nodes
+        self._routes: set[tuple[str, str]] = set()
+        self._unroutable: dict[str, str] = {}
+        self._route_retry_at: float | None = None
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def on_notify(self, _payload: str | None) -> None:
+        self._stale = True
+
+    def _needs_load(self) -> bool:
+        retry_at = self._route_retry_at
+        return self._stale or (retry_at is not None and time.monotonic() >= retry_at)
+
+    async def refresh(self) -> None:
+        # A load in progress has cleared the flag but not set the services yet
+        if not self._needs_load() and not self._lock.locked():
+            return
+        async with self._lock:
+            if not self._needs_load():
+                return
+            from app.database import async_session
+
+            # Cleared first: a notification arriving during the load re-marks it
+            self._stale = False
+            try:
+                async with async_session() as session:
+                    nodes = (await session.execute(select(GatewayNode))).scalars().all()
+                    session.expunge_all()
+            except BaseException:
+                self._stale = True
+                raise
+
+            services: dict[str, WireGuardService] = {}
+            for node in nodes:
+                previous = self._services.get(node.id)
+                if previous is not None and _service_config(self._nodes[node.id]) == _service_config(node):
+                    services[node.id] = previous
+                    continue
+                service = WireGuardService(
+                    node_id=node.id,
+                    interface=node.interface,
+                    endpoint=node.endpoint,
+                    vpn_server_ip=node.vpn_server_ip,
+                    driver=make_driver(node),
+                )
+                if previous is not None:
+                    service.load_peer_states(previous.peer_states)
+                services[node.id] = service
+            self._nodes = {node.id: node for node in nodes}
+            self._services = services
+            self._status = {key: value for key, value in self._status.items() if key in services}
+            await self._ensure_routes(nodes)
+
+    async def _ensure_routes(self, nodes: Iterable[GatewayNode]) -> None:
+        """Route each remote node's pools through it, so HAProxy reaches its tunnels.
+
+        Routes of nodes whose address or subnets changed (or that are gone)
+        are deleted. A node whose routes can't be installed gets no new
+        tunnels (see place_tunnel); failed changes are retried by the first
+        refresh after ROUTE_RETRY_SECONDS.
+        """
+        wanted = {route: node.id for node in nodes for route in node_routes(node)}
+        unroutable: dict[str, str] = {}
+        failed = False
+        for subnet, via in sorted(self._routes - wanted.keys()):
+            try:
+                await command_executor.run(["sudo", "ip", "route", "del", subnet, "via", via])
+            except Exception as e:
+                # Still ours to delete on the next refresh
+                logger.error("Failed to delete route %s via %s: %s", subnet, via, e)
+                failed = True
+                continue
+            self._routes.discard((subnet, via))
+        for route, node_id in wanted.items():
+            if route in self._routes:
+                continue
+            try:
+                await install_route(*route)
+            except Exception as e:
+                logger.error("Failed to route %s via node %s: %s", route[0], node_id, e)
+                unroutable[node_id] = str(e)
+                failed = True
+                continue
+            self._routes.add(route)
+        self._unroutable = unroutable
+        self._route_retry_at = time.monotonic() + ROUTE_RETRY_SECONDS if failed else None
+
+    @property
+    def unroutable(self) -> dict[str, str]:
+        """Nodes whose pools HAProxy can't reach, with the route error."""
+        return self._unroutable
+
+    async def node(self, node_id: str) -> GatewayNode:
+        await self.refresh()
+        return self._nodes[node_id]
+
+    async def service(self, node_id: str) -> WireGuardService:
+        await self.refresh()
+        return self._services[node_id]
+
+    async def services(self) -> list[WireGuardService]:
+        await self.refresh()
+        return list(self._services.values())
+
+    @property
+    def loaded_services(self) -> list[WireGuardService]:
+        """Services as last loaded, without touching the DB (shutdown paths)."""
+        return list(self._services.values())
+
+    async def apply_peers(
+        self,
+        add: Iterable[tuple[str, str, str, str]] = (),
+        remove: Iterable[tuple[str, str]] = (),
+    ) -> None:
+        """Add (node_id, public_key, vpn_ip, device_ip) and remove (node_id, public_key) peers.
+
+        One batched apply_peers per node involved; every node is attempted
+        and the first failure is re-raised afterwards.
+        """
+        changes: dict[str, tuple[list, list]] = {}
+        for node_id, public_key, vpn_ip, device_ip in add:
+            changes.setdefault(node_id, ([], []))[0].append((public_key, vpn_ip, device_ip))
+        for node_id, public_key in remove:
+            changes.setdefault(node_id, ([], []))[1].append(public_key)
+
+        error: Exception | None = None
+        for node_id, (to_add, to_remove) in changes.items():
+            try:
+                service = await self.service(node_id)
+                await service.apply_peers(add=to_add, remove=to_remove)
+            except Exception as e:
+                logger.exception("Peer changes failed on gateway node %s", node_id)
+                error = error or e
+        if error is not None:
+            raise error
+
+    async def get_peers_status(self) -> dict[str, dict]:
+        """Status of the peers of all nodes; a node whose dump fails keeps its last status.
+
+        Raises only if no node could be read.
+        """
+        services = await self.services()
+        results = await asyncio.gather(
+            *(service.get_peers_status() for service in services), return_exceptions=True
+        )
+        status: dict[str, dict] = {}
+        failures = 0
+        for service, result in zip(services, results):
+            if isinstance(result, BaseException):
+                failures += 1
+                logger.warning("Cannot read peers of gateway node %s: %s", service.node_id, result)
+                result = self._status.get(service.node_id, {})
+            else:
+                self._status[service.node_id] = result
+            status.update(result)
+        if services and failures == len(services):
+            raise RuntimeError("No gateway node answered")
+        return status
+
+    @property
+    def peer_states(self) -> dict[str, PeerState]:
+        states: dict[str, PeerState] = {}
+        for service in self._services.values():
+            states.update(service.peer_states)
+        return states
+
+    def load_peer_states(self, states: dict[str, PeerState]) -> None:
+        # Each node keeps only the peers of its own next dump
+        for service in self._services.values():
+            service.load_peer_states(states)
+
+    def status(self) -> dict:
+        return {
+            node_id: {
+                "interface": service.interface,
+                "endpoint": service.endpoint,
+                "driver": self._nodes[node_id].driver,
+                "peers": len(service.peer_states),
+                "route_error": self._unroutable.get(node_id),
+            }
+            for node_id, service in self._services.items()
+        }
+
+
+gateway_registry = GatewayRegistry()
+pg_listener.subscribe(GATEWAY_NODES_CHANNEL, gateway_registry.on_notify)
+
+
+async def node_loads(db: AsyncSession) -> dict[str, tuple[int, int]]:
+    """(tunnel count, bytes over the traffic window) per node."""
+    peers = dict(
+        (await db.execute(select(Tunnel.node_id, func.count()).group_by(Tunnel.node_id))).all()
+    )
+    since = datetime.now(timezone.utc) - PLACEMENT_TRAFFIC_WINDOW
+    traffic = dict(
+        (
+            await db.execute(
+                select(Tunnel.node_id, func.sum(TrafficHourly.rx_bytes + TrafficHourly.tx_bytes))
+                .join(Tunnel, Tunnel.id == TrafficHourly.tunnel_id)
+                .where(TrafficHourly.hour >= since)
+                .group_by(Tunnel.node_id)
+            )
+        ).all()
+    )
+    return {
+        node_id: (peers.get(node_id, 0), int(traffic.get(node_id) or 0))
+        for node_id in peers.keys() | traffic.keys()
+    }
+
+
+async def overlapping_node(db: AsyncSession, subnets: Iterable[str]) -> str | None:
+    """Id of a node whose pools overlap one of `subnets`, if any.
+
+    Networks are compared, not leases: leases leave out each node's own
+    address, which a new subnet must not cover either.
+    """
+    networks = [ipaddress.IPv4Network(subnet) for subnet in subnets]
+    rows = (
+        await db.execute(select(GatewayNode.id, GatewayNode.vpn_subnet, GatewayNode.device_subnet))
+    ).all()
+    for node_id, *pools in rows:
+        for pool in pools:
+            if any(network.overlaps(ipaddress.IPv4Network(pool)) for network in networks):
+                return node_id
+    return None
+
+
+async def _claim_node(db: AsyncSession, node_id: str) -> bool:
+    """Lock the node's row until the transaction ends and check it has room left.
+
+    The lock serializes the creations on a node, so the count taken under it
+    stays right until the new tunnel is committed. A node without room is
+    unlocked right away (savepoint rollback): placements trying nodes in
+    different orders can't deadlock.
+    """
+    savepoint = await db.begin_nested()
+    node = (
+        await db.execute(
+            select(GatewayNode.is_active, GatewayNode.max_peers)
+            .where(GatewayNode.id == node_id)
+            .with_for_update()
+        )
+    ).one_or_none()
+    if node is not None and node.is_active:
+        peers = (
+            await db.execute(select(func.count()).select_from(Tunnel).where(Tunnel.node_id == node_id))
+        ).scalar()
+        if peers < node.max_peers:
+            await savepoint.commit()
+            return True
+    await savepoint.rollback()
+    return False
+
+
+async def place_tunnel(db: AsyncSession) -> str:
+    """Pick the node for a new tunnel: the least loaded active node with room left.
+
+    Load is the node's share of its peer capacity plus its share of the
+    traffic of all nodes over PLACEMENT_TRAFFIC_WINDOW. The chosen node stays
+    locked until the caller's transaction ends, so the tunnel must be
+    inserted in it. Nodes HAProxy has no route to are skipped.
+    """
+    await gateway_registry.refresh()
+    unroutable = gateway_registry.unroutable
+    nodes = [
+        node
+        for node in (
+            await db.execute(select(GatewayNode).where(GatewayNode.is_active == True))  # noqa: E712
+        ).scalars().all()
+        if node.id not in unroutable
+    ]
+    if not nodes:
+        raise NoGatewayCapacityError("No reachable gateway node")
+    if len(nodes) == 1:
+        # Single gateway: no load to compare
+        (node,) = nodes
+        if not await _claim_node(db, node.id):
+            raise NoGatewayCapacityError("Gateway node is full")
+        return node.id
+
+    loads = await node_loads(db)
+    total_traffic = sum(traffic for _, traffic in loads.values()) or 1
+    candidates: list[tuple[float, bool, str]] = []
+    for node in nodes:
+        peers, traffic = loads.get(node.id, (0, 0))
+        if peers >= node.max_peers:
+            continue
+        score = peers / node.max_peers + PLACEMENT_TRAFFIC_WEIGHT * traffic / total_traffic
+        # Ties go to the local node, then by name, for stable placement
+        candidates.append((score, node.id != LOCAL_NODE_ID, node.id))
+    # Loads were read without locks: a node filled meanwhile passes its turn
+    for _, _, node_id in sorted(candidates):
+        if await _claim_node(db, node_id):
+            return node_id
+    raise NoGatewayCapacityError("All gateway nodes are full")
+
+
+async def wireguard_save_loop() -> None:
+    """Background loop that coalesces peer changes into one `wg-quick save` per node.
+
+    A pending save is flushed on shutdown so no applied change is lost
+    across a restart.
+    """
+    logger.info("WireGuard save loop started (debounce=%ds)", SAVE_DEBOUNCE_SECONDS)
+
+    try:
+        while True:
+            await wait_any_save_requested()
+            await asyncio.sleep(SAVE_DEBOUNCE_SECONDS)
+            for service in gateway_registry.loaded_services:
+                if not service.save_pending:
+                    continue
+                try:
+                    await service.save()
+                except Exception:
+                    logger.exception("wg-quick save failed on node %s (will retry)", service.node_id)
+                    service.request_save()
+    except asyncio.CancelledError:
+        for service in gateway_registry.loaded_services:
+            if service.save_pending:
+                try:
+                    await service.save()
+                except Exception:
+                    logger.exception("wg-quick save failed on shutdown (node %s)", service.node_id)
+        logger.info("WireGuard save loop stopped")
@@ -0,0 +1,75 @@
+import logging
+import shlex
+from collections.abc import Callable
+from typing import Any
+
+from app.config import settings
+from app.services.executor import DEFAULT_TIMEOUT_SECONDS, CommandResult, command_executor
+
+logger = logging.getLogger(__name__)
+
+# Reuse one SSH connection per node for successive commands
+SSH_OPTIONS = [
+    "-o", "BatchMode=yes",
+    "-o", "ConnectTimeout=5",
+    "-o", "ControlMaster=auto",
+    "-o", "ControlPath=/tmp/homevpn-ssh-%C",
+    "-o", "ControlPersist=60",
+]
+
+
+class WireGuardDriver:
+    """Runs the privileged commands (`wg`, `wg-quick`, ...) of one gateway node."""
+
+    async def run(
+        self,
+        args: list[str],
+        *,
+        input: bytes | None = None,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    ) -> CommandResult:
+        raise NotImplementedError
+
+
+class LocalDriver(WireGuardDriver):
+    """Commands run on the API host through sudo."""
+
+    async def run(self, args, *, input=None, timeout=DEFAULT_TIMEOUT_SECONDS) -> CommandResult:
+        return await command_executor.run(["sudo", *args], input=input, timeout=timeout)
+
+
+class SSHDriver(WireGuardDriver):
+    """Commands run on a remote node over SSH (key-based, sudo without password)."""
+
+    def __init__(self, address: str):
+        self.target = f"{settings.gateway_ssh_user}@{address}"
+
+    async def run(self, args, *, input=None, timeout=DEFAULT_TIMEOUT_SECONDS) -> CommandResult:
+        # The remote side gets a shell command line: quote every argument
+        return await command_executor.run(
+            ["ssh", *SSH_OPTIONS, self.target, shlex.join(["sudo", *args])],
+            input=input,
+            timeout=timeout,
+        )
+
+
+# Driver factories by GatewayNode.driver; they receive the node row
+DriverFactory = Callable[[Any], WireGuardDriver]
+
+DRIVERS: dict[str, DriverFactory] = {
+    "local": lambda node: LocalDriver(),
+    "ssh": lambda node: SSHDriver(node.address),
+}
+
+
+def register_driver(name: str, factory: DriverFactory) -> None:
+    """Make a driver available to gateway nodes, e.g. a fake one for local testing."""
+    DRIVERS[name] = factory
+
+
+def make_driver(node) -> WireGuardDriver:
+    try:
+        factory = DRIVERS[node.driver]
+    except KeyError:
+        raise ValueError(f"Unknown gateway driver {node.driver!r} (node {node.id})") from None
+    return factory(node)
@@ -1,19 +1,110 @@
 import asyncio
+import hashlib
+import json
 import logging
 import os
+import secrets
 import subprocess
+import tempfile
+from datetime import datetime, timezone
 
-from sqlalchemy import select, update
+from sqlalchemy import func, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.models.tunnel import Tunnel
 from app.models.system_flag import SystemFlag
+from app.services.executor import command_executor
+from app.services.haproxy_runtime import HAProxyRuntimeClient, HAProxyRuntimeError
+from app.services.pg_notify import notify, pg_listener
 
 logger = logging.getLogger(__name__)
 
 HAPROXY_RELOAD_FLAG = "haproxy_reload_needed"
-DAEMON_INTERVAL_SECONDS = 5
+HAPROXY_RELOAD_CHANNEL = "haproxy_reload"
+# Bumped by every reload request; identifies the DB state a config reflects
+HAPROXY_VERSION_SEQUENCE = "haproxy_config_version"
+# Bursts of changes within this window result in a single regeneration
+DAEMON_COALESCE_SECONDS = 0.2
+# Safety net for notifications missed while the listener was disconnected
+DAEMON_FALLBACK_POLL_SECONDS = 60
+
+GENERATED_HEADER = "# Auto-generated by HomeVPN API. Do not edit manually.\n"
+# Rows fetched per round-trip from the server-side cursor
+RENDER_BATCH_SIZE = 1000
+# Advisory lock serializing regenerations across API processes
+HAPROXY_APPLY_LOCK_KEY = 0x48564841  # "HVHA"
+
+SERVER_NAME = "srv1"
+SERVER_OPTIONS = "check inter 10s fall 3 rise 2"
+
+
+def _backend_name(subdomain: str) -> str:
+    return f"bk_hvpn_{subdomain}"
+
+
+class _AtomicFile:
+    """Temp file next to `path`, hashed as it is written, renamed over it on commit.
+
+    HAProxy (or a concurrent reader) never sees a half-written file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+
+    def write(self, text: str) -> None:
+        data = text.encode()
+        self._file.write(data)
+        self._hash.update(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def commit(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.chmod(self.tmp_path, 0o644)
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self) -> None:
+        self._file.close()
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    f = _AtomicFile(path)
+    try:
+        f.write(data.decode())
+        f.commit()
+    except BaseException:
+        f.discard()
+        raise
+
+
+def _file_digest(path: str) -> str | None:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _config_digest(backends_digest: str | None, map_digest: str | None) -> str | None:
+    if backends_digest is None or map_digest is None:
+        return None
+    return hashlib.sha256(f"{backends_digest}:{map_digest}".encode()).hexdigest()
 
 
 class HAProxyService:
@@ -32,84 +123,255 @@ class HAProxyService:
 
         # At the end:
         .include /etc/haproxy/homevpn-backends.cfg
+
+    Changes are applied through the runtime API (stats socket) when the
+    running HAProxy already knows every backend involved: map entries and
+    servers are added/removed and server addresses updated in place. A full
+    reload is only needed for brand-new backends, on the first run after
+    startup, or if a runtime command fails.
+
+    Any API process may apply a change, one at a time (advisory lock). What
+    HAProxy runs is recorded in the state file shared by all of them: a
+    process only diffs against its own routes if it made the last apply,
+    and reloads otherwise.
     """
 
     def __init__(self):
         self.backends_path = settings.haproxy_backends_path
         self.map_path = settings.haproxy_map_path
-
-    async def regenerate_config(self, db: AsyncSession) -> None:
-        result = await db.execute(
-            select(Tunnel).where(Tunnel.is_active == True)  # noqa: E712
+        self.runtime = (
+            HAProxyRuntimeClient(settings.haproxy_admin_socket)
+            if settings.haproxy_admin_socket
+            else None
         )
-        tunnels = result.scalars().all()
-
-        backends_lines = [
-            "# Auto-generated by HomeVPN API. Do not edit manually.\n"
-        ]
-        map_entries = []
-
-        for tunnel in tunnels:
-            backend_name = f"bk_hvpn_{tunnel.subdomain}"
-            backends_lines.append(f"backend {backend_name}")
-            target_ip = tunnel.device_ip if tunnel.use_device_ip else tunnel.vpn_ip
-            backends_lines.append(
-                f"    server srv1 {target_ip}:{tunnel.target_port} check inter 10s fall 3 rise 2"
+        # Routing state of HAProxy as this process last applied it:
+        # {subdomain: (ip, port)}. Only valid while the state file still
+        # names this process as the last applier.
+        self._applied_routes: dict[str, tuple[str, int]] | None = None
+        # Backends defined in the config HAProxy was last reloaded with
+        self._loaded_backends: set[str] = set()
+        # Identifies this process as an applier in the state file
+        self._token = f"{os.getpid()}-{secrets.token_hex(4)}"
+        # Last applied version/hash and applier, next to the generated files
+        self.state_path = f"{self.backends_path}.applied"
+        # Per-process counters of how regenerations were applied
+        self.stats = {"reloads": 0, "runtime_updates": 0, "skipped": 0}
+
+    async def regenerate_config(self, db: AsyncSession, version: int | None = None) -> None:
+        """Render the config from the DB and apply it if it changed.
+
+        `version` is the haproxy_config_version the DB state corresponds to;
+        it is recorded as the applied version once HAProxy runs this config.
+        """
+        # Held until the session's transaction ends: the state file can't
+        # change under us between reading it and recording the new apply
+        await db.execute(select(func.pg_advisory_xact_lock(HAPROXY_APPLY_LOCK_KEY)))
+
+        # Only the routed columns (no keys), streamed through a server-side
+        # cursor and written as we go: memory stays flat with the tunnel
+        # count, apart from the compact routes table used for runtime diffs.
+        # Ordered so identical DB state always renders identical bytes.
+        stream = await db.stream(
+            select(
+                Tunnel.subdomain,
+                Tunnel.vpn_ip,
+                Tunnel.device_ip,
+                Tunnel.use_device_ip,
+                Tunnel.target_port,
             )
-            backends_lines.append("")
-            map_entries.append(f"{tunnel.subdomain} {backend_name}")
-
-        # Write backends config file
-        os.makedirs(os.path.dirname(self.backends_path), exist_ok=True)
-        with open(self.backends_path, "w") as f:
-            f.write("\n".join(backends_lines))
-
-        # Write map file
-        os.makedirs(os.path.dirname(self.map_path), exist_ok=True)
-        with open(self.map_path, "w") as f:
-            f.write("# Auto-generated by HomeVPN API. Do not edit manually.\n")
-            if map_entries:
-                f.write("\n".join(map_entries) + "\n")
+            .where(Tunnel.is_active == True)  # noqa: E712
+            .order_by(Tunnel.subdomain)
+            .execution_options(yield_per=RENDER_BATCH_SIZE)
+        )
 
-        self._reload()
+        backends_file = _AtomicFile(self.backends_path)
+        map_file = _AtomicFile(self.map_path)
+        routes: dict[str, tuple[str, int]] = {}
+        try:
+            backends_file.write(GENERATED_HEADER)
+            map_file.write(GENERATED_HEADER)
+            async for row in stream:
+                backend_name = _backend_name(row.subdomain)
+                target_ip = str(row.device_ip if row.use_device_ip else row.vpn_ip)
+                backends_file.write(
+                    f"\nbackend {backend_name}\n"
+                    f"    server {SERVER_NAME} {target_ip}:{row.target_port} {SERVER_OPTIONS}\n"
+                )
+                map_file.write(f"{row.subdomain} {backend_name}\n")
+                routes[row.subdomain] = (target_ip, row.target_port)
+        except BaseException:
+            backends_file.discard()
+            map_file.discard()
+            raise
+
+        digest = _config_digest(backends_file.hexdigest(), map_file.hexdigest())
+
+        state = self._read_state()
+        if state.get("sha256") == digest:
+            # HAProxy already runs this config, whoever applied it
+            if self._files_digest() == digest:
+                backends_file.discard()
+                map_file.discard()
+            else:
+                backends_file.commit()
+                map_file.commit()
+            if state.get("applier") != self._token:
+                # Adopt it; only its own backends are known to be loaded
+                self._applied_routes = routes
+                self._loaded_backends = {_backend_name(subdomain) for subdomain in routes}
+            self.stats["skipped"] += 1
+            logger.info("HAProxy config unchanged, nothing to apply")
+            self._write_state(version, digest)
+            return
+
+        if state.get("applier") != self._token:
+            # Another process applied since: our routes aren't HAProxy's
+            self._applied_routes = None
+
+        backends_file.commit()
+        map_file.commit()
+
+        # The files above are always rewritten so the next reload matches
+        if await self._apply_runtime(routes):
+            self.stats["runtime_updates"] += 1
+            applied = True
+        elif await self._reload():
+            self.stats["reloads"] += 1
+            self._loaded_backends = {_backend_name(subdomain) for subdomain in routes}
+            applied = True
+        else:
+            applied = False
+
+        if applied:
+            self._applied_routes = routes
+            self._write_state(version, digest)
+        else:
+            # HAProxy may run anything from the old config to a partial
+            # runtime update: force a reload next time, in every process
+            self._applied_routes = None
+            self._write_state(None, None)
+
+    def _files_digest(self) -> str | None:
+        return _config_digest(_file_digest(self.backends_path), _file_digest(self.map_path))
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, version: int | None, digest: str | None) -> None:
+        if version is None and digest is not None:
+            previous = self._read_state()
+            version = previous.get("version") if previous.get("sha256") == digest else None
+        state = {
+            "version": version,
+            "sha256": digest,
+            "applier": self._token,
+            "applied_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            _atomic_write(self.state_path, json.dumps(state).encode())
+        except OSError:
+            logger.exception("Failed to record applied HAProxy config version")
+
+    def status(self) -> dict:
+        """Applied config version/hash (shared by all workers via the state file)."""
+        state = self._read_state()
+        return {
+            "applied_version": state.get("version"),
+            "applied_sha256": state.get("sha256"),
+            "applied_at": state.get("applied_at"),
+            **self.stats,
+        }
+
+    async def _apply_runtime(self, routes: dict[str, tuple[str, int]]) -> bool:
+        """Apply the routing diff over the runtime API. False means reload."""
+        previous = self._applied_routes
+        if self.runtime is None or previous is None:
+            return False
+        added = routes.keys() - previous.keys()
+        if any(_backend_name(subdomain) not in self._loaded_backends for subdomain in added):
+            return False
 
-    def _reload(self) -> None:
+        try:
+            for subdomain in previous.keys() - routes.keys():
+                backend = _backend_name(subdomain)
+                await self.runtime.del_map(self.map_path, subdomain)
+                await self.runtime.del_server(backend, SERVER_NAME)
+            for subdomain, (ip, port) in routes.items():
+                backend = _backend_name(subdomain)
+                if subdomain in added:
+                    await self.runtime.add_server(backend, SERVER_NAME, ip, port, SERVER_OPTIONS)
+                    await self.runtime.add_map(self.map_path, subdomain, backend)
+                elif previous[subdomain] != (ip, port):
+                    await self.runtime.set_server_addr(backend, SERVER_NAME, ip, port)
+        except HAProxyRuntimeError as e:
+            logger.warning("HAProxy runtime update failed, falling back to reload: %s", e)
+            return False
+
+        logger.info("HAProxy updated via runtime API (no reload)")
+        return True
+
+    async def _reload(self) -> bool:
         """Reload HAProxy via sudo systemctl (allowed via sudoers.d/homevpn)."""
         try:
-            subprocess.run(
-                ["sudo", "systemctl", "reload", "haproxy"],
-                check=True,
-                capture_output=True,
-            )
+            await command_executor.run(["sudo", "systemctl", "reload", "haproxy"], timeout=30)
             logger.info("HAProxy reloaded successfully")
-        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
             logger.error("HAProxy reload failed: %s", e)
+            return False
 
 
 haproxy_service = HAProxyService()
 
 
 async def request_haproxy_reload() -> None:
-    """Set the haproxy_reload_needed flag in the database.
+    """Bump the config version, set the reload flag and notify the daemon.
 
     Uses a dedicated session to avoid affecting the caller's transaction.
+    The NOTIFY is delivered on commit, together with the flag.
     """
     from app.database import async_session
 
     try:
         async with async_session() as session:
+            await session.execute(select(func.nextval(HAPROXY_VERSION_SEQUENCE)))
             await session.execute(
                 update(SystemFlag)
                 .where(SystemFlag.key == HAPROXY_RELOAD_FLAG)
                 .values(value=True)
             )
+            await notify(session, HAPROXY_RELOAD_CHANNEL)
             await session.commit()
     except Exception:
         logger.exception("Failed to set haproxy reload flag")
 
 
+async def current_config_version(session: AsyncSession) -> int:
+    """Latest requested config version (0 if no reload was ever requested)."""
+    result = await session.execute(
+        text(
+            f"SELECT CASE WHEN is_called THEN last_value ELSE 0 END "
+            f"FROM {HAPROXY_VERSION_SEQUENCE}"
+        )
+    )
+    return result.scalar()
+
+
+_reload_wakeup = asyncio.Event()
+# Also fired on listener (re)connect, so missed notifications trigger a check
+pg_listener.subscribe(HAPROXY_RELOAD_CHANNEL, lambda _payload: _reload_wakeup.set())
+
+
 async def haproxy_daemon_loop() -> None:
-    """Background loop that checks the reload flag every 5 seconds.
+    """Background loop that regenerates HAProxy config when the flag is set.
+
+    Wakes on the haproxy_reload notification, waits a short coalescing
+    window so a burst of changes yields a single regeneration, and falls
+    back to polling the flag every 60 seconds in case a notification is lost.
 
     When the flag is set:
     1. Clear the flag first (so concurrent changes re-arm it)
@@ -118,35 +380,45 @@ async def haproxy_daemon_loop() -> None:
     """
     from app.database import async_session
 
-    logger.info("HAProxy daemon started (interval=%ds)", DAEMON_INTERVAL_SECONDS)
+    logger.info(
+        "HAProxy daemon started (coalesce=%.1fs, fallback poll=%ds)",
+        DAEMON_COALESCE_SECONDS,
+        DAEMON_FALLBACK_POLL_SECONDS,
+    )
+
+    # Check once at startup for changes made while the API was down
+    _reload_wakeup.set()
 
     while True:
         try:
-            await asyncio.sleep(DAEMON_INTERVAL_SECONDS)
+            try:
+                await asyncio.wait_for(_reload_wakeup.wait(), DAEMON_FALLBACK_POLL_SECONDS)
+                await asyncio.sleep(DAEMON_COALESCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _reload_wakeup.clear()
 
             async with async_session() as session:
-                result = await session.execute(
-                    select(SystemFlag.value).where(
-                        SystemFlag.key == HAPROXY_RELOAD_FLAG
-                    )
-                )
-                flag_value = result.scalar_one_or_none()
-
-                if not flag_value:
-                    continue
-
                 # Clear flag BEFORE regenerating — any new change during
-                # regen will re-arm the flag for the next cycle
-                await session.execute(
+                # regen will re-arm the flag for the next cycle. The
+                # conditional UPDATE lets only one API worker win the flag.
+                result = await session.execute(
                     update(SystemFlag)
-                    .where(SystemFlag.key == HAPROXY_RELOAD_FLAG)
+                    .where(SystemFlag.key == HAPROXY_RELOAD_FLAG, SystemFlag.value == True)  # noqa: E712
                     .values(value=False)
+                    .returning(SystemFlag.key)
                 )
+                claimed = result.scalar_one_or_none()
+                # DB state version this regeneration will reflect
+                version = await current_config_version(session)
                 await session.commit()
 
+            if not claimed:
+                continue
+
             # Regenerate with a fresh session
             async with async_session() as regen_session:
-                await haproxy_service.regenerate_config(regen_session)
+                await haproxy_service.regenerate_config(regen_session, version=version)
 
             logger.info("HAProxy config regenerated by daemon")
 
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_TIMEOUT_SECONDS = 5
+
+
+class HAProxyRuntimeError(Exception):
+    """A runtime API command failed or HAProxy rejected it."""
+
+
+class HAProxyRuntimeClient:
+    """Minimal client for the HAProxy runtime API (stats socket, level admin).
+
+    Each command opens a short-lived connection in non-interactive mode:
+    HAProxy answers and closes the socket. Works against any listener that
+    speaks the same line protocol, e.g. a fake unix socket server in tests.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = RUNTIME_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    async def execute(self, command: str) -> str:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(self.socket_path), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise HAProxyRuntimeError(f"cannot connect to {self.socket_path}: {e}") from e
+        try:
+            writer.write(command.encode() + b"\n")
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise HAProxyRuntimeError(f"{command!r} failed: {e}") from e
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        return data.decode(errors="replace").strip()
+
+    async def _expect_empty(self, command: str) -> None:
+        """Run a command whose success output is empty (add/del map, ...)."""
+        output = await self.execute(command)
+        if output:
+            raise HAProxyRuntimeError(f"{command!r}: {output}")
+
+    async def add_map(self, map_path: str, key: str, value: str) -> None:
+        await self._expect_empty(f"add map {map_path} {key} {value}")
+
+    async def del_map(self, map_path: str, key: str) -> None:
+        await self._expect_empty(f"del map {map_path} {key}")
+
+    async def set_server_addr(self, backend: str, server: str, ip: str, port: int) -> None:
+        command = f"set server {backend}/{server} addr {ip} port {port}"
+        output = await self.execute(command)
+        # Success answers: "IP changed from ...", "no need to change the addr..."
+        if "changed" not in output and "no need" not in output:
+            raise HAProxyRuntimeError(f"{command!r}: {output}")
+
+    async def add_server(self, backend: str, server: str, ip: str, port: int, options: str = "") -> None:
+        """Add a dynamic server and bring it (and its health checks) up."""
+        command = f"add server {backend}/{server} {ip}:{port} {options}".rstrip()
+        output = await self.execute(command)
+        if "New server registered" not in output:
+            raise HAProxyRuntimeError(f"{command!r}: {output}")
+        if "check" in options.split():
+            await self._expect_empty(f"enable health {backend}/{server}")
+        await self._expect_empty(f"enable server {backend}/{server}")
+
+    async def del_server(self, backend: str, server: str) -> None:
+        """Delete a server; HAProxy requires it to be in maintenance first."""
+        await self._expect_empty(f"disable server {backend}/{server}")
+        command = f"del server {backend}/{server}"
+        output = await self.execute(command)
+        if "Server deleted" not in output:
+            raise HAProxyRuntimeError(f"{command!r}: {output}")
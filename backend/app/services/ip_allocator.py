@@ -1,44 +1,83 @@
 import ipaddress
+import uuid
 
-from sqlalchemy import select
+from sqlalchemy import func, literal, select, union_all, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import settings
-from app.models.tunnel import Tunnel
+from app.models.ip_lease import IPLease
+
+VPN_POOL = "vpn"
+DEVICE_POOL = "device"
 
 
 class IPAllocator:
-    def __init__(self):
-        self.network = ipaddress.IPv4Network(settings.vpn_subnet)
-        self.server_ip = ipaddress.IPv4Address(settings.vpn_server_ip)
-        self.device_network = ipaddress.IPv4Network(settings.device_subnet)
-        self.device_gateway_ip = ipaddress.IPv4Address(settings.device_gateway_ip)
-
-    async def allocate_next_ip(self, db: AsyncSession) -> str:
-        result = await db.execute(select(Tunnel.vpn_ip))
-        allocated = {str(row[0]) for row in result.fetchall()}
-
-        for host in self.network.hosts():
-            if host == self.server_ip:
-                continue
-            ip_str = str(host)
-            if ip_str not in allocated:
-                return ip_str
-
-        raise RuntimeError("VPN IP address pool exhausted")
-
-    async def allocate_next_device_ip(self, db: AsyncSession) -> str:
-        result = await db.execute(select(Tunnel.device_ip))
-        allocated = {str(row[0]) for row in result.fetchall() if row[0] is not None}
-
-        for host in self.device_network.hosts():
-            if host == self.device_gateway_ip:
-                continue
-            ip_str = str(host)
-            if ip_str not in allocated:
-                return ip_str
-
-        raise RuntimeError("Device IP address pool exhausted")
+    """Claims a VPN IP and a device IP for a new tunnel from the ip_leases table.
+
+    Both addresses are claimed by a single UPDATE in the caller's
+    transaction. `FOR UPDATE SKIP LOCKED` makes concurrent creations pick
+    different free rows instead of racing for the same one, and the claim
+    is rolled back with the transaction if the tunnel is never committed.
+    """
+
+    def _free_lease(self, pool: str, node_id: str, *conditions):
+        return (
+            select(IPLease.pool, IPLease.address)
+            .where(
+                IPLease.node_id == node_id, IPLease.pool == pool, IPLease.tunnel_id.is_(None),
+                *conditions,
+            )
+            .order_by(IPLease.address)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .cte(f"free_{pool}")
+        )
+
+    async def allocate(self, db: AsyncSession, tunnel_id: uuid.UUID, node_id: str) -> tuple[str, str]:
+        """Return (vpn_ip, device_ip) leased to tunnel_id from the node's pools."""
+        free_vpn = self._free_lease(VPN_POOL, node_id)
+        # Only lock a device address once a VPN address is held: a claim that
+        # got the device half alone would hide the last free device address
+        # from the claim holding the last VPN one, failing both
+        free_device = self._free_lease(DEVICE_POOL, node_id, select(free_vpn).exists())
+        claimed = union_all(select(free_vpn), select(free_device)).subquery()
+
+        result = await db.execute(
+            update(IPLease)
+            .where(IPLease.pool == claimed.c.pool, IPLease.address == claimed.c.address)
+            .values(tunnel_id=tunnel_id)
+            .returning(IPLease.pool, IPLease.address)
+        )
+        leases = {row.pool: str(row.address) for row in result}
+
+        if VPN_POOL not in leases:
+            raise RuntimeError("VPN IP address pool exhausted")
+        if DEVICE_POOL not in leases:
+            raise RuntimeError("Device IP address pool exhausted")
+        return leases[VPN_POOL], leases[DEVICE_POOL]
+
+    async def add_pools(
+        self, db: AsyncSession, node_id: str, vpn_subnet: str, vpn_server_ip: str,
+        device_subnet: str, device_gateway_ip: str,
+    ) -> None:
+        """Create the leases of a new node's pools (all hosts but its own address).
+
+        Raises IntegrityError if a subnet overlaps another node's pool.
+        """
+        for pool, subnet, reserved in (
+            (VPN_POOL, vpn_subnet, vpn_server_ip),
+            (DEVICE_POOL, device_subnet, device_gateway_ip),
+        ):
+            network = ipaddress.IPv4Network(subnet)
+            first = func.cast(literal(str(network.network_address + 1)), IPLease.address.type)
+            n = func.generate_series(0, max(network.num_addresses - 3, -1)).column_valued("n")
+            await db.execute(
+                IPLease.__table__.insert().from_select(
+                    ["pool", "address", "node_id"],
+                    select(literal(pool), first + n, literal(node_id)).where(
+                        first + n != func.cast(literal(reserved), IPLease.address.type)
+                    ),
+                )
+            )
 
 
 ip_allocator = IPAllocator()
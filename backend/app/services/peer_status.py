@@ -0,0 +1,428 @@
+import asyncio
+import json
+import logging
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import MappingProxyType
+
+from sqlalchemy import String, any_, bindparam, delete, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.models.peer_status import PeerStatus
+from app.services.traffic import traffic_recorder
+from app.services.traffic_accounting import traffic_accountant
+from app.services.gateway import GatewayRegistry, gateway_registry
+from app.services.wireguard import PeerState
+
+logger = logging.getLogger(__name__)
+
+STATUS_SAMPLE_INTERVAL_SECONDS = 5
+# Readers refresh the snapshot themselves if the sampler falls this far behind
+STATUS_MAX_AGE_SECONDS = 10
+# Session-level advisory lock held by the one process that reads the dump
+PEER_STATUS_LOCK_KEY = 0x48565053  # "HVPS"
+
+# Pending change sets per stream subscriber before it is resynced instead
+STREAM_QUEUE_SIZE = 16
+# Comment line sent on idle streams to keep proxies from closing them
+STREAM_HEARTBEAT_SECONDS = 15
+
+DISCONNECTED = MappingProxyType({"connected": False, "connected_since": 0})
+
+
+def _to_datetime(timestamp: float) -> datetime | None:
+    return datetime.fromtimestamp(timestamp, timezone.utc) if timestamp else None
+
+
+def _to_timestamp(value: datetime | None) -> float:
+    return value.timestamp() if value else 0.0
+
+
+@dataclass(frozen=True)
+class PeerStatusSnapshot:
+    """Peer status as read from one `wg show dump`, never mutated once published."""
+
+    taken_at: float
+    peers: Mapping[str, dict]
+    # (rx_bytes, tx_bytes) counters per peer, kept apart so that traffic
+    # alone doesn't count as a status change
+    counters: Mapping[str, tuple[int, int]]
+
+
+@dataclass(frozen=True)
+class PeerStatusChanges:
+    """Peers whose status differs between two consecutive snapshots."""
+
+    changed: Mapping[str, Mapping]
+    # Peers that were not in the previous snapshot (new tunnels)
+    added: frozenset[str]
+
+
+class PeerStatusSubscription:
+    """Queue of peer status changes for one stream client.
+
+    A client that falls STREAM_QUEUE_SIZE change sets behind has its backlog
+    dropped and is flagged for a resync (a full snapshot) instead, so a slow
+    client costs bounded memory and never slows the sampler down.
+    """
+
+    def __init__(self, maxsize: int = STREAM_QUEUE_SIZE):
+        self._queue: asyncio.Queue[PeerStatusChanges | None] = asyncio.Queue(maxsize)
+        self.resync = False
+
+    def push(self, changes: PeerStatusChanges) -> None:
+        if self.resync:
+            return
+        try:
+            self._queue.put_nowait(changes)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self.resync = True
+            self._queue.put_nowait(None)  # wake the client up
+
+    async def get(self) -> PeerStatusChanges | None:
+        """Next change set, or None if the client must resync."""
+        return await self._queue.get()
+
+
+class PeerStatusSampler:
+    """Publishes the WireGuard peer status as a shared, immutable snapshot.
+
+    One API process (the leader, holding an advisory lock on a dedicated
+    connection) reads the dumps of all gateway nodes and records each peer's liveness in the
+    peer_status table; every other process reads that table. All workers
+    thus report the same status, and a new leader resumes the rx history
+    of the previous one instead of showing every peer disconnected.
+
+    The sampler loop refreshes once per interval; status endpoints only read
+    the latest snapshot. If the snapshot is stale (sampler not running or
+    stuck), concurrent readers await a single in-flight refresh.
+    """
+
+    def __init__(self, service: GatewayRegistry, max_age: float = STATUS_MAX_AGE_SECONDS):
+        self._service = service
+        self._max_age = max_age
+        self._snapshot = PeerStatusSnapshot(
+            taken_at=0.0, peers=MappingProxyType({}), counters=MappingProxyType({})
+        )
+        self._refresh_task: asyncio.Task | None = None
+        # Connection holding the leader lock, None while following
+        self._leader_conn: AsyncConnection | None = None
+        # Rows last written to peer_status by this leader
+        self._written: dict[str, tuple] = {}
+        self._subscribers: set[PeerStatusSubscription] = set()
+        # Bumped whenever a snapshot differs from the previous one
+        self._generation = 0
+
+    @property
+    def snapshot(self) -> PeerStatusSnapshot:
+        return self._snapshot
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_conn is not None
+
+    async def get(self) -> PeerStatusSnapshot:
+        snapshot = self._snapshot
+        if time.time() - snapshot.taken_at > self._max_age:
+            try:
+                snapshot = await self.refresh()
+            except Exception:
+                logger.exception("Peer status refresh failed, serving stale snapshot")
+        return snapshot
+
+    async def refresh(self) -> PeerStatusSnapshot:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._sample())
+        # Shield so a cancelled reader doesn't cancel the shared refresh
+        return await asyncio.shield(self._refresh_task)
+
+    async def _sample(self) -> PeerStatusSnapshot:
+        # get_peers_status mutates the service's rx history, so it must only
+        # ever run from this single refresh task.
+        if await self._acquire_leadership():
+            peers = await self._service.get_peers_status()
+            counters = {
+                key: (int(state.rx), int(state.tx))
+                for key, state in self._service.peer_states.items()
+            }
+            try:
+                # Committed by the write
+                new_peers = await traffic_accountant.new_peers(self._leader_conn, counters)
+                await self._write_shared()
+            except Exception:
+                await self.release_leadership()
+                raise
+            # After the write: a new leader counts from what was written
+            traffic_accountant.observe(counters, new_peers)
+        else:
+            peers, counters = await self._read_shared()
+
+        previous = self._snapshot.peers
+        self._snapshot = PeerStatusSnapshot(
+            taken_at=time.time(),
+            peers=MappingProxyType(peers),
+            counters=MappingProxyType(counters),
+        )
+        traffic_recorder.record(self._snapshot.taken_at, counters)
+        if peers != previous:
+            self._generation += 1
+            self._publish(previous, peers)
+        return self._snapshot
+
+    def subscribe(self) -> PeerStatusSubscription:
+        subscription = PeerStatusSubscription()
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: PeerStatusSubscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def _publish(self, previous: Mapping[str, dict], peers: Mapping[str, dict]) -> None:
+        if not self._subscribers:
+            return
+        # Peers missing from a snapshot are reported as disconnected
+        changed = {
+            key: value
+            for key, value in peers.items()
+            if previous.get(key, DISCONNECTED) != value
+        }
+        for key in previous.keys() - peers.keys():
+            if previous[key] != DISCONNECTED:
+                changed[key] = DISCONNECTED
+        added = frozenset(peers.keys() - previous.keys())
+        if not changed and not added:
+            return
+        changes = PeerStatusChanges(changed=MappingProxyType(changed), added=added)
+        for subscription in self._subscribers:
+            subscription.push(changes)
+
+    async def _acquire_leadership(self) -> bool:
+        if self._leader_conn is not None:
+            return True
+
+        from app.database import engine
+
+        conn = await engine.connect()
+        try:
+            locked = (
+                await conn.execute(select(func.pg_try_advisory_lock(PEER_STATUS_LOCK_KEY)))
+            ).scalar()
+            if locked:
+                # Tunnels created from now on have all their traffic counted
+                since = (await conn.execute(select(func.now()))).scalar()
+                # Resume from the shared state so connected peers stay connected
+                result = await conn.execute(select(PeerStatus))
+                states = {
+                    row.public_key: PeerState(
+                        str(row.rx_bytes),
+                        row.has_handshake,
+                        _to_timestamp(row.rx_changed_at),
+                        _to_timestamp(row.connected_since),
+                        str(row.tx_bytes),
+                    )
+                    for row in result
+                }
+            await conn.commit()
+        except BaseException:
+            await conn.invalidate()
+            await conn.close()
+            raise
+        if not locked:
+            await conn.close()
+            return False
+
+        self._service.load_peer_states(states)
+        traffic_accountant.baseline(
+            {key: (int(state.rx), int(state.tx)) for key, state in states.items()}, since
+        )
+        self._written = {key: self._row(state) for key, state in states.items()}
+        self._leader_conn = conn
+        logger.info("Peer status sampler is now the leader (%d peers resumed)", len(states))
+        return True
+
+    async def release_leadership(self) -> None:
+        conn, self._leader_conn = self._leader_conn, None
+        if conn is None:
+            return
+        # Invalidate rather than return to the pool: closing the DBAPI
+        # connection is what releases a session-level advisory lock.
+        try:
+            await conn.invalidate()
+            await conn.close()
+        except Exception:
+            logger.exception("Failed to release peer status leadership")
+
+    @staticmethod
+    def _row(state: PeerState) -> tuple:
+        return (
+            int(state.rx), int(state.tx), state.handshake, state.rx_changed_at, state.connected_since
+        )
+
+    async def _write_shared(self) -> None:
+        """Write the peers whose state changed and drop those that left the dump."""
+        conn = self._leader_conn
+        states = self._service.peer_states
+        changed = []
+        for key, state in states.items():
+            row = self._row(state)
+            if self._written.get(key) != row:
+                changed.append((key, row))
+        gone = [key for key in self._written if key not in states]
+
+        if changed:
+            stmt = insert(PeerStatus)
+            await conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[PeerStatus.public_key],
+                    set_={
+                        "rx_bytes": stmt.excluded.rx_bytes,
+                        "tx_bytes": stmt.excluded.tx_bytes,
+                        "has_handshake": stmt.excluded.has_handshake,
+                        "rx_changed_at": stmt.excluded.rx_changed_at,
+                        "connected_since": stmt.excluded.connected_since,
+                    },
+                ),
+                [
+                    {
+                        "public_key": key,
+                        "rx_bytes": rx,
+                        "tx_bytes": tx,
+                        "has_handshake": handshake,
+                        "rx_changed_at": _to_datetime(rx_changed_at),
+                        "connected_since": _to_datetime(connected_since),
+                    }
+                    for key, (rx, tx, handshake, rx_changed_at, connected_since) in changed
+                ],
+            )
+        if gone:
+            await conn.execute(
+                delete(PeerStatus).where(
+                    PeerStatus.public_key == any_(bindparam("gone", gone, type_=ARRAY(String)))
+                )
+            )
+        await conn.commit()
+
+        for key, row in changed:
+            self._written[key] = row
+        for key in gone:
+            del self._written[key]
+
+    async def _read_shared(self) -> tuple[dict[str, dict], dict[str, tuple[int, int]]]:
+        from app.database import async_session
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(
+                    PeerStatus.public_key,
+                    PeerStatus.rx_bytes,
+                    PeerStatus.tx_bytes,
+                    PeerStatus.has_handshake,
+                    PeerStatus.rx_changed_at,
+                    PeerStatus.connected_since,
+                )
+            )
+            rows = result.all()
+
+        peers: dict[str, dict] = {}
+        counters: dict[str, tuple[int, int]] = {}
+        for row in rows:
+            counters[row.public_key] = (row.rx_bytes, row.tx_bytes)
+            state = PeerState(
+                "", row.has_handshake, _to_timestamp(row.rx_changed_at),
+                _to_timestamp(row.connected_since),
+            )
+            # Same rule as the leader, so a stalled leader ages into "disconnected"
+            connected = state.connected
+            peers[row.public_key] = {
+                "connected": connected,
+                "connected_since": int(state.connected_since) if connected else 0,
+            }
+        return peers, counters
+
+
+peer_status_sampler = PeerStatusSampler(gateway_registry)
+
+
+async def peer_status_sampler_loop() -> None:
+    """Background loop that refreshes the peer status snapshot every 5 seconds."""
+    logger.info("Peer status sampler started (interval=%ds)", STATUS_SAMPLE_INTERVAL_SECONDS)
+
+    try:
+        while True:
+            try:
+                await peer_status_sampler.refresh()
+            except Exception:
+                logger.exception("Peer status sampler error (will retry)")
+            await asyncio.sleep(STATUS_SAMPLE_INTERVAL_SECONDS)
+    except asyncio.CancelledError:
+        await peer_status_sampler.release_leadership()
+        logger.info("Peer status sampler stopped")
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _snapshot_event(tunnels: dict[str, str], peers: Mapping[str, Mapping]) -> str:
+    return _sse(
+        "snapshot",
+        {tunnel_id: dict(peers.get(key, DISCONNECTED)) for key, tunnel_id in tunnels.items()},
+    )
+
+
+async def stream_tunnel_status(
+    load_tunnels: Callable[[], Awaitable[dict[str, str]]],
+    is_authorized: Callable[[], Awaitable[bool]],
+) -> AsyncIterator[str]:
+    """Server-Sent Events of the status of a set of tunnels.
+
+    `load_tunnels` returns {client_public_key: tunnel_id} for the tunnels the
+    client may see; it is called again when a new peer shows up (possibly a
+    new tunnel of the client) and on resync. Sends a `snapshot` event first
+    (and on resync), then `update` events with only the tunnels whose
+    status changed. `is_authorized` is checked before every event and
+    heartbeat; the stream ends once it returns False (expired token,
+    banned user).
+    """
+    subscription = peer_status_sampler.subscribe()
+    try:
+        tunnels = await load_tunnels()
+        yield _snapshot_event(tunnels, (await peer_status_sampler.get()).peers)
+        while True:
+            try:
+                changes = await asyncio.wait_for(subscription.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                changes = False
+            if not await is_authorized():
+                logger.info("Closing status stream: no longer authorized")
+                return
+            if changes is False:
+                yield ": ping\n\n"
+                continue
+
+            if changes is None:
+                subscription.resync = False
+                tunnels = await load_tunnels()
+                yield _snapshot_event(tunnels, peer_status_sampler.snapshot.peers)
+                continue
+
+            if not changes.added.issubset(tunnels):
+                tunnels = await load_tunnels()
+            update = {
+                tunnels[key]: dict(value)
+                for key, value in changes.changed.items()
+                if key in tunnels
+            }
+            if update:
+                yield _sse("update", update)
+    finally:
+        peer_status_sampler.unsubscribe(subscription)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from collections.abc import Callable
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_SECONDS = 5
+
+# Handlers receive the notification payload, or None after (re)connecting to
+# signal that notifications may have been missed while disconnected.
+NotifyHandler = Callable[[str | None], None]
+
+
+class PgListener:
+    """Dispatches Postgres LISTEN/NOTIFY messages to in-process handlers.
+
+    Holds one dedicated asyncpg connection (outside the SQLAlchemy pool) for
+    the lifetime of the process and reconnects if it drops.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, list[NotifyHandler]] = {}
+        # True while LISTENing: notifications are being received
+        self.connected = False
+
+    def subscribe(self, channel: str, handler: NotifyHandler) -> None:
+        """Register a handler; must be called before run() starts."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def _dispatch(self, channel: str, payload: str | None) -> None:
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception("Notification handler failed (channel=%s)", channel)
+
+    def _on_notification(self, _conn, _pid, channel: str, payload: str) -> None:
+        self._dispatch(channel, payload)
+
+    async def run(self) -> None:
+        from app.database import engine
+
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        logger.info("Postgres listener started (channels=%s)", ", ".join(self._handlers))
+
+        try:
+            while True:
+                conn = None
+                try:
+                    conn = await asyncpg.connect(dsn)
+                    closed = asyncio.Event()
+                    conn.add_termination_listener(lambda _conn: closed.set())
+                    for channel in self._handlers:
+                        await conn.add_listener(channel, self._on_notification)
+                        self._dispatch(channel, None)
+                    self.connected = True
+                    await closed.wait()
+                    self.connected = False
+                    logger.warning("Postgres listener connection lost, reconnecting")
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Postgres listener error (will retry)")
+                finally:
+                    self.connected = False
+                    if conn is not None and not conn.is_closed():
+                        await conn.close()
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+        except asyncio.CancelledError:
+            logger.info("Postgres listener stopped")
+
+
+pg_listener = PgListener()
+
+
+async def notify(session: AsyncSession, channel: str, payload: str = "") -> None:
+    """Queue a NOTIFY on the session's transaction (delivered on commit)."""
+    await session.execute(select(func.pg_notify(channel, payload)))
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.tunnel import Tunnel
+from app.models.user import User
+from app.services.gateway import gateway_registry
+from app.services.wireguard import WireGuardService
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = 300
+# Follow-up pass after drift was found, to catch changes racing with it
+RECONCILE_RECHECK_SECONDS = 30
+# Advisory lock so only one API process reconciles at a time
+RECONCILE_LOCK_KEY = 0x4856524E  # "HVRN"
+
+
+class WireGuardReconciler:
+    """Converges the interface's peers to the tunnels the database says should be up.
+
+    Expected peers of a node are the active tunnels of active users placed
+    on it. Missing peers and peers with wrong allowed-ips are (re)added,
+    unknown peers are removed, all in one batched `wg set` per node.
+    """
+
+    def __init__(self):
+        self.stats = {
+            "runs": 0,
+            "failures": 0,
+            "last_run_at": None,
+            "last_duration_ms": None,
+            # Drift found (and fixed) by the last run
+            "missing": 0,
+            "mismatched": 0,
+            "extra": 0,
+            # Cumulated over the process lifetime
+            "peers_added": 0,
+            "peers_removed": 0,
+        }
+
+    @property
+    def drift(self) -> int:
+        return self.stats["missing"] + self.stats["mismatched"] + self.stats["extra"]
+
+    async def reconcile(self) -> bool:
+        """Run one reconciliation; returns False if another process holds the lock."""
+        from app.database import async_session
+
+        start = time.monotonic()
+        missing = mismatched = extra = added = 0
+        async with async_session() as session:
+            # Transaction-scoped: released when the session closes
+            locked = (
+                await session.execute(select(func.pg_try_advisory_xact_lock(RECONCILE_LOCK_KEY)))
+            ).scalar()
+            if not locked:
+                return False
+
+            for service in await gateway_registry.services():
+                try:
+                    node_missing, node_mismatched, node_extra = await self._reconcile_node(
+                        session, service
+                    )
+                except Exception:
+                    # One unreachable node must not stop the others
+                    self.stats["failures"] += 1
+                    logger.exception("WireGuard reconcile failed on node %s", service.node_id)
+                    continue
+                missing += node_missing
+                mismatched += node_mismatched
+                extra += node_extra
+
+        self.stats.update(
+            runs=self.stats["runs"] + 1,
+            last_run_at=time.time(),
+            last_duration_ms=round((time.monotonic() - start) * 1000, 1),
+            missing=missing,
+            mismatched=mismatched,
+            extra=extra,
+            peers_added=self.stats["peers_added"] + missing + mismatched,
+            peers_removed=self.stats["peers_removed"] + extra,
+        )
+        if self.drift:
+            logger.warning(
+                "WireGuard drift fixed: %d missing, %d mismatched, %d extra peers",
+                missing, mismatched, extra,
+            )
+        return True
+
+    async def _reconcile_node(
+        self, session: AsyncSession, service: WireGuardService
+    ) -> tuple[int, int, int]:
+        # Interface first, then the DB. Peers are only removed once their
+        # deletion/deactivation is committed (remove_peers), so one removed
+        # between the two reads is no longer in the DB either and is not
+        # resurrected. The opposite race (a peer added just before its
+        # tunnel commits) is undone here and restored by the quick
+        # follow-up pass.
+        live = await service.list_peers()
+        result = await session.execute(
+            select(Tunnel.client_public_key, Tunnel.vpn_ip, Tunnel.device_ip)
+            .join(User, User.id == Tunnel.user_id)
+            .where(
+                Tunnel.node_id == service.node_id,
+                Tunnel.is_active == True,  # noqa: E712
+                User.is_active == True,  # noqa: E712
+            )
+        )
+        expected = {
+            row.client_public_key: (str(row.vpn_ip), str(row.device_ip)) for row in result
+        }
+
+        missing = [key for key in expected if key not in live]
+        mismatched = [
+            key for key, (vpn_ip, device_ip) in expected.items()
+            if key in live and live[key] != {f"{vpn_ip}/32", f"{device_ip}/32"}
+        ]
+        extra = [key for key in live if key not in expected]
+
+        # `wg set ... allowed-ips` replaces the peer's list, so mismatched
+        # peers are fixed by re-adding them
+        to_add = [(key, *expected[key]) for key in missing + mismatched]
+        await service.apply_peers(add=to_add, remove=extra)
+        return len(missing), len(mismatched), len(extra)
+
+    def status(self) -> dict:
+        return dict(self.stats)
+
+
+wireguard_reconciler = WireGuardReconciler()
+
+_reconcile_wakeup = asyncio.Event()
+
+
+def request_reconcile() -> None:
+    """Wake the reconciler, e.g. after a peer change failed."""
+    _reconcile_wakeup.set()
+
+
+async def remove_peers(peers: list[tuple[str, str]]) -> None:
+    """Remove the (node_id, public_key) peers of tunnels no longer expected up.
+
+    Must be called once the deletion/deactivation is committed: a pass
+    reading the DB before it would otherwise re-add them. On failure the
+    reconciler removes them.
+    """
+    if not peers:
+        return
+    try:
+        await gateway_registry.apply_peers(remove=peers)
+    except Exception:
+        logger.exception("Failed to remove %d WireGuard peer(s)", len(peers))
+        request_reconcile()
+
+
+async def reconciler_loop() -> None:
+    """Background loop reconciling WireGuard peers at startup, then every 5 minutes."""
+    logger.info("WireGuard reconciler started (interval=%ds)", RECONCILE_INTERVAL_SECONDS)
+
+    try:
+        while True:
+            try:
+                await wireguard_reconciler.reconcile()
+            except Exception:
+                wireguard_reconciler.stats["failures"] += 1
+                logger.exception("WireGuard reconciler error (will retry)")
+
+            interval = RECONCILE_RECHECK_SECONDS if wireguard_reconciler.drift else RECONCILE_INTERVAL_SECONDS
+            try:
+                await asyncio.wait_for(_reconcile_wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            _reconcile_wakeup.clear()
+    except asyncio.CancelledError:
+        logger.info("WireGuard reconciler stopped")
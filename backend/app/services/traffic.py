@@ -0,0 +1,115 @@
+import logging
+import time
+from array import array
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+# One slot per minute over 24 h: 2 x 1440 x 4 bytes = 11.25 KiB per peer
+TRAFFIC_RESOLUTION_SECONDS = 60
+TRAFFIC_SLOTS = 1440
+# Counters are bytes per slot, saturating at the array's 32-bit maximum
+_SLOT_MAX = 0xFFFFFFFF
+
+
+class TrafficSeries:
+    """rx/tx bytes per minute for one peer, in two fixed-size ring buffers."""
+
+    __slots__ = ("rx", "tx", "slot", "last_rx", "last_tx")
+
+    def __init__(self, slot: int, rx_bytes: int, tx_bytes: int):
+        self.rx = array("I", bytes(4 * TRAFFIC_SLOTS))
+        self.tx = array("I", bytes(4 * TRAFFIC_SLOTS))
+        # Absolute index (minutes since epoch) of the most recent slot written
+        self.slot = slot
+        self.last_rx = rx_bytes
+        self.last_tx = tx_bytes
+
+    def advance(self, slot: int) -> None:
+        """Move the head to `slot`, zeroing the minutes skipped on the way."""
+        if slot <= self.slot:
+            return
+        for absolute in range(self.slot + 1, min(slot, self.slot + TRAFFIC_SLOTS) + 1):
+            index = absolute % TRAFFIC_SLOTS
+            self.rx[index] = 0
+            self.tx[index] = 0
+        self.slot = slot
+
+    def add(self, rx_bytes: int, tx_bytes: int) -> None:
+        # Counters going backwards were reset (peer re-added, interface
+        # restarted): everything since then is new traffic.
+        rx_delta = rx_bytes - self.last_rx if rx_bytes >= self.last_rx else rx_bytes
+        tx_delta = tx_bytes - self.last_tx if tx_bytes >= self.last_tx else tx_bytes
+        self.last_rx = rx_bytes
+        self.last_tx = tx_bytes
+        index = self.slot % TRAFFIC_SLOTS
+        self.rx[index] = min(self.rx[index] + rx_delta, _SLOT_MAX)
+        self.tx[index] = min(self.tx[index] + tx_delta, _SLOT_MAX)
+
+    def window(self, minutes: int) -> tuple[list[int], list[int]]:
+        """rx and tx of the last `minutes` slots, oldest first."""
+        indexes = [(self.slot - offset) % TRAFFIC_SLOTS for offset in range(minutes - 1, -1, -1)]
+        return [self.rx[i] for i in indexes], [self.tx[i] for i in indexes]
+
+
+class TrafficRecorder:
+    """Keeps per-peer traffic history from the counters of each status snapshot.
+
+    Series are created on a peer's first sample and dropped when it leaves
+    the dump, so memory stays at one TrafficSeries per live peer.
+    """
+
+    def __init__(self):
+        self._series: dict[str, TrafficSeries] = {}
+
+    def record(self, taken_at: float, counters: Mapping[str, tuple[int, int]]) -> None:
+        slot = int(taken_at) // TRAFFIC_RESOLUTION_SECONDS
+        previous = self._series
+        series: dict[str, TrafficSeries] = {}
+        for key, (rx_bytes, tx_bytes) in counters.items():
+            peer = previous.get(key)
+            if peer is None:
+                # First sample is only a baseline
+                peer = TrafficSeries(slot, rx_bytes, tx_bytes)
+            else:
+                peer.advance(slot)
+                if rx_bytes != peer.last_rx or tx_bytes != peer.last_tx:
+                    peer.add(rx_bytes, tx_bytes)
+            series[key] = peer
+        self._series = series
+
+    def _aligned(self, peer: TrafficSeries) -> TrafficSeries:
+        # Peers are only advanced when sampled; align reads on the clock
+        peer.advance(int(time.time()) // TRAFFIC_RESOLUTION_SECONDS)
+        return peer
+
+    def history(self, public_key: str, minutes: int = TRAFFIC_SLOTS) -> dict:
+        """Bytes per minute over the last `minutes` (zeros for unknown peers)."""
+        minutes = max(1, min(minutes, TRAFFIC_SLOTS))
+        slot = int(time.time()) // TRAFFIC_RESOLUTION_SECONDS
+        peer = self._series.get(public_key)
+        if peer is None:
+            rx = tx = [0] * minutes
+        else:
+            rx, tx = self._aligned(peer).window(minutes)
+        return {
+            "resolution_seconds": TRAFFIC_RESOLUTION_SECONDS,
+            "start": (slot - minutes + 1) * TRAFFIC_RESOLUTION_SECONDS,
+            "rx_bytes": rx,
+            "tx_bytes": tx,
+        }
+
+    def top(self, limit: int, minutes: int) -> list[tuple[str, int, int]]:
+        """(public_key, rx_bytes, tx_bytes) of the busiest peers over the last minutes."""
+        minutes = max(1, min(minutes, TRAFFIC_SLOTS))
+        totals = []
+        for key, peer in self._series.items():
+            rx, tx = self._aligned(peer).window(minutes)
+            rx_total, tx_total = sum(rx), sum(tx)
+            if rx_total or tx_total:
+                totals.append((key, rx_total, tx_total))
+        totals.sort(key=lambda item: item[1] + item[2], reverse=True)
+        return totals[:limit]
+
+
+traffic_recorder = TrafficRecorder()
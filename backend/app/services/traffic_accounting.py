@@ -0,0 +1,353 @@
+import asyncio
+import logging
+from collections.abc import Collection, Iterable, Mapping
+from datetime import date, datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlalchemy import BigInteger, String, any_, bindparam, delete, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.models.traffic import TrafficDaily, TrafficHourly, TrafficSample
+from app.models.tunnel import Tunnel
+
+logger = logging.getLogger(__name__)
+
+# Deltas are accumulated in memory and written as one multi-row insert per flush
+TRAFFIC_FLUSH_INTERVAL_SECONDS = 60
+TRAFFIC_ROLLUP_INTERVAL_SECONDS = 300
+# Raw samples live in daily partitions, dropped whole once rolled up
+TRAFFIC_RAW_RETENTION_DAYS = 2
+TRAFFIC_HOURLY_RETENTION_DAYS = 35
+# Advisory lock so only one API process rolls up / creates partitions at a time
+TRAFFIC_ROLLUP_LOCK_KEY = 0x48565452  # "HVTR"
+
+_PARTITION_PREFIX = "traffic_samples_"
+
+_FLUSH_SQL = text(
+    """
+    INSERT INTO traffic_samples (tunnel_id, user_id, sampled_at, rx_bytes, tx_bytes)
+    SELECT t.id, t.user_id, :sampled_at, d.rx_bytes, d.tx_bytes
+    FROM unnest(:keys, :rx, :tx) AS d(public_key, rx_bytes, tx_bytes)
+    JOIN tunnels t ON t.client_public_key = d.public_key
+    """
+).bindparams(
+    bindparam("keys", type_=ARRAY(String)),
+    bindparam("rx", type_=ARRAY(BigInteger)),
+    bindparam("tx", type_=ARRAY(BigInteger)),
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _month_start(today: date) -> date:
+    return today.replace(day=1)
+
+
+class TrafficAccountant:
+    """Turns the peer counters seen by the status sampler into persisted usage.
+
+    Only the status sampler leader feeds it, so each byte is counted by one
+    process. Deltas are computed against the previous counters of the same
+    peer; a counter lower than before means it was reset (interface restart,
+    peer re-added) and its whole value is new traffic. Deltas not yet flushed
+    when a leader dies are lost, at most one flush interval of traffic.
+
+    A peer first seen by a leader is only a baseline: its counters may hold
+    traffic from before the leader (or before accounting was deployed), so
+    they are charged in full only for tunnels created since the leadership
+    started, or for peers that left the dump and came back.
+    """
+
+    def __init__(self):
+        self._last: dict[str, tuple[int, int]] = {}
+        # Peers seen since the leadership started, and when it started
+        self._seen: set[str] = set()
+        self._since: datetime | None = None
+        self._pending: dict[str, list[int]] = {}
+        # Days whose raw partition is known to exist
+        self._partitions: set[date] = set()
+        self.stats = {
+            "flushes": 0,
+            "rows_written": 0,
+            "last_flush_at": None,
+            "rollups": 0,
+            "last_rollup_at": None,
+            "partitions_dropped": 0,
+        }
+
+    def baseline(self, counters: Mapping[str, tuple[int, int]], since: datetime) -> None:
+        """Start from known counters, e.g. the shared state a new leader resumes.
+
+        `since` is the database time the leadership started at.
+        """
+        self._last = dict(counters)
+        self._seen = set(counters)
+        self._since = since
+
+    async def new_peers(self, conn: AsyncConnection, counters: Mapping[str, tuple[int, int]]) -> set[str]:
+        """Unknown peers whose tunnel was created since the leadership started."""
+        unknown = [key for key in counters if key not in self._seen]
+        if not unknown or self._since is None:
+            return set()
+        result = await conn.execute(
+            select(Tunnel.client_public_key).where(
+                Tunnel.client_public_key == any_(bindparam("keys", unknown, type_=ARRAY(String))),
+                Tunnel.created_at >= self._since,
+            )
+        )
+        return set(result.scalars())
+
+    def observe(self, counters: Mapping[str, tuple[int, int]], new_peers: Collection[str] = ()) -> None:
+        """Accumulate the traffic since the previous counters.
+
+        `new_peers` are the unknown peers whose counters are all new traffic
+        (see new_peers()); other unknown peers only set a baseline.
+        """
+        last = self._last
+        seen = self._seen
+        for key, (rx_bytes, tx_bytes) in counters.items():
+            previous = last.get(key)
+            if previous is None:
+                if key in seen or key in new_peers:
+                    # Re-added or created since: the counters start from its first handshake
+                    rx_delta, tx_delta = rx_bytes, tx_bytes
+                else:
+                    # Traffic before this leader can't be told apart
+                    rx_delta = tx_delta = 0
+                seen.add(key)
+            else:
+                rx_delta = rx_bytes - previous[0] if rx_bytes >= previous[0] else rx_bytes
+                tx_delta = tx_bytes - previous[1] if tx_bytes >= previous[1] else tx_bytes
+            if rx_delta or tx_delta:
+                pending = self._pending.setdefault(key, [0, 0])
+                pending[0] += rx_delta
+                pending[1] += tx_delta
+        self._last = dict(counters)
+
+    async def _ensure_partitions(self, session: AsyncSession, days: Iterable[date]) -> None:
+        missing = [day for day in days if day not in self._partitions]
+        if not missing:
+            return
+        # CREATE ... IF NOT EXISTS still races with a concurrent create
+        await session.execute(select(func.pg_advisory_xact_lock(TRAFFIC_ROLLUP_LOCK_KEY)))
+        for day in missing:
+            upper = day + timedelta(days=1)
+            await session.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {_PARTITION_PREFIX}{day:%Y%m%d} "
+                    f"PARTITION OF traffic_samples "
+                    f"FOR VALUES FROM ('{day.isoformat()} 00:00+00') TO ('{upper.isoformat()} 00:00+00')"
+                )
+            )
+        self._partitions.update(missing)
+
+    async def flush(self) -> int:
+        """Write the accumulated deltas in one insert; returns the number of peers."""
+        if not self._pending:
+            return 0
+
+        from app.database import async_session
+
+        pending, self._pending = self._pending, {}
+        sampled_at = _utcnow()
+        try:
+            async with async_session() as session:
+                await self._ensure_partitions(session, [sampled_at.date()])
+                await session.execute(
+                    _FLUSH_SQL,
+                    {
+                        "sampled_at": sampled_at,
+                        "keys": list(pending),
+                        "rx": [rx for rx, _ in pending.values()],
+                        "tx": [tx for _, tx in pending.values()],
+                    },
+                )
+                await session.commit()
+        except BaseException:
+            # Put the deltas back, merged with anything observed meanwhile
+            for key, (rx, tx) in pending.items():
+                merged = self._pending.setdefault(key, [0, 0])
+                merged[0] += rx
+                merged[1] += tx
+            raise
+
+        self.stats.update(
+            flushes=self.stats["flushes"] + 1,
+            rows_written=self.stats["rows_written"] + len(pending),
+            last_flush_at=sampled_at.timestamp(),
+        )
+        return len(pending)
+
+    async def rollup(self) -> bool:
+        """Refresh hourly/daily aggregates and prune; False if another process holds the lock."""
+        from app.database import async_session
+
+        now = _utcnow()
+        async with async_session() as session:
+            locked = (
+                await session.execute(select(func.pg_try_advisory_xact_lock(TRAFFIC_ROLLUP_LOCK_KEY)))
+            ).scalar()
+            if not locked:
+                return False
+
+            today = now.date()
+            await self._ensure_partitions(session, [today, today + timedelta(days=1)])
+
+            # Re-aggregate from the last (possibly partial) hour rolled up, and
+            # always the previous hour so samples flushed late are included.
+            previous_hour = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+            last_hour = (await session.execute(select(func.max(TrafficHourly.hour)))).scalar()
+            since = min(previous_hour, last_hour) if last_hour is not None else None
+
+            hour = func.date_trunc("hour", TrafficSample.sampled_at)
+            hourly = select(
+                TrafficSample.tunnel_id,
+                hour,
+                TrafficSample.user_id,
+                func.sum(TrafficSample.rx_bytes),
+                func.sum(TrafficSample.tx_bytes),
+            ).group_by(TrafficSample.tunnel_id, hour, TrafficSample.user_id)
+            if since is not None:
+                hourly = hourly.where(TrafficSample.sampled_at >= since)
+            stmt = insert(TrafficHourly).from_select(
+                ["tunnel_id", "hour", "user_id", "rx_bytes", "tx_bytes"], hourly
+            )
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[TrafficHourly.tunnel_id, TrafficHourly.hour],
+                    set_={"rx_bytes": stmt.excluded.rx_bytes, "tx_bytes": stmt.excluded.tx_bytes},
+                )
+            )
+
+            # Days are UTC, like the partitions and the hours
+            day = func.date(func.timezone("UTC", TrafficHourly.hour))
+            daily = select(
+                TrafficHourly.tunnel_id,
+                day,
+                TrafficHourly.user_id,
+                func.sum(TrafficHourly.rx_bytes),
+                func.sum(TrafficHourly.tx_bytes),
+            ).group_by(TrafficHourly.tunnel_id, day, TrafficHourly.user_id)
+            if since is not None:
+                day_start = since.astimezone(timezone.utc).replace(hour=0)
+                daily = daily.where(TrafficHourly.hour >= day_start)
+            stmt = insert(TrafficDaily).from_select(
+                ["tunnel_id", "day", "user_id", "rx_bytes", "tx_bytes"], daily
+            )
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[TrafficDaily.tunnel_id, TrafficDaily.day],
+                    set_={"rx_bytes": stmt.excluded.rx_bytes, "tx_bytes": stmt.excluded.tx_bytes},
+                )
+            )
+
+            await session.execute(
+                delete(TrafficHourly).where(
+                    TrafficHourly.hour < now - timedelta(days=TRAFFIC_HOURLY_RETENTION_DAYS)
+                )
+            )
+            dropped = await self._drop_old_partitions(session, today)
+            await session.commit()
+
+        self.stats.update(
+            rollups=self.stats["rollups"] + 1,
+            last_rollup_at=now.timestamp(),
+            partitions_dropped=self.stats["partitions_dropped"] + dropped,
+        )
+        return True
+
+    async def _drop_old_partitions(self, session: AsyncSession, today: date) -> int:
+        result = await session.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'traffic_samples'::regclass"
+            )
+        )
+        oldest_kept = today - timedelta(days=TRAFFIC_RAW_RETENTION_DAYS)
+        dropped = 0
+        for name in result.scalars().all():
+            try:
+                day = datetime.strptime(name.removeprefix(_PARTITION_PREFIX), "%Y%m%d").date()
+            except ValueError:
+                continue
+            if day < oldest_kept:
+                # Dropping a partition is instant, unlike deleting its rows
+                await session.execute(text(f"DROP TABLE {name}"))
+                self._partitions.discard(day)
+                dropped += 1
+        return dropped
+
+    def status(self) -> dict:
+        return {**self.stats, "pending_peers": len(self._pending)}
+
+
+traffic_accountant = TrafficAccountant()
+
+
+def usage_version() -> int:
+    """Changes whenever the rollups may have changed, for ETags of usage data."""
+    return int(_utcnow().timestamp()) // TRAFFIC_ROLLUP_INTERVAL_SECONDS
+
+
+async def monthly_usage_by_tunnel(
+    db: AsyncSession, tunnel_ids: Iterable[UUID] | None = None
+) -> dict[UUID, tuple[int, int]]:
+    """(rx_bytes, tx_bytes) per tunnel for the current UTC month, as of the last rollup."""
+    query = (
+        select(TrafficDaily.tunnel_id, func.sum(TrafficDaily.rx_bytes), func.sum(TrafficDaily.tx_bytes))
+        .where(TrafficDaily.day >= _month_start(_utcnow().date()))
+        .group_by(TrafficDaily.tunnel_id)
+    )
+    if tunnel_ids is not None:
+        query = query.where(TrafficDaily.tunnel_id.in_(list(tunnel_ids)))
+    result = await db.execute(query)
+    return {tunnel_id: (int(rx), int(tx)) for tunnel_id, rx, tx in result.all()}
+
+
+async def monthly_usage_by_user(db: AsyncSession, user_id: UUID) -> tuple[int, int]:
+    """(rx_bytes, tx_bytes) of all the user's tunnels for the current UTC month."""
+    result = await db.execute(
+        select(
+            func.coalesce(func.sum(TrafficDaily.rx_bytes), 0),
+            func.coalesce(func.sum(TrafficDaily.tx_bytes), 0),
+        ).where(
+            TrafficDaily.user_id == user_id,
+            TrafficDaily.day >= _month_start(_utcnow().date()),
+        )
+    )
+    rx, tx = result.one()
+    return int(rx), int(tx)
+
+
+async def traffic_accounting_loop() -> None:
+    """Background loop flushing traffic deltas every minute and rolling them up every 5."""
+    logger.info(
+        "Traffic accounting started (flush=%ds, rollup=%ds)",
+        TRAFFIC_FLUSH_INTERVAL_SECONDS, TRAFFIC_ROLLUP_INTERVAL_SECONDS,
+    )
+    loop = asyncio.get_running_loop()
+    next_rollup = loop.time()
+
+    try:
+        while True:
+            try:
+                await traffic_accountant.flush()
+            except Exception:
+                logger.exception("Traffic flush error (will retry)")
+            if loop.time() >= next_rollup:
+                next_rollup = loop.time() + TRAFFIC_ROLLUP_INTERVAL_SECONDS
+                try:
+                    await traffic_accountant.rollup()
+                except Exception:
+                    logger.exception("Traffic rollup error (will retry)")
+            await asyncio.sleep(TRAFFIC_FLUSH_INTERVAL_SECONDS)
+    except asyncio.CancelledError:
+        # Don't lose the last minute of traffic on a clean shutdown
+        try:
+            await traffic_accountant.flush()
+        except Exception:
+            logger.exception("Final traffic flush failed")
+        logger.info("Traffic accounting stopped")
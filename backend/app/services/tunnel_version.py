@@ -0,0 +1,122 @@
+import logging
+from collections import OrderedDict
+from uuid import UUID
+
+from fastapi import Request
+from sqlalchemy import func, select
+
+from app.models.tunnel import Tunnel
+from app.models.tunnel_tombstone import TunnelTombstone
+from app.services.pg_notify import pg_listener
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel the tunnels triggers (migration 011) publish versions on
+TUNNEL_CHANGES_CHANNEL = "tunnel_changes"
+# Advisory lock the triggers take to assign versions in commit order
+TUNNEL_VERSION_LOCK_KEY = 0x48565456  # "HVTV"
+TRACKED_USERS_MAX_SIZE = 10000
+
+
+class TunnelVersionTracker:
+    """Latest committed tunnel state versions, kept in memory.
+
+    Every insert, user-visible update (migration 018) and delete on tunnels
+    draws a new version and NOTIFYs it with the owner's id on commit; the
+    tracker follows those notifications so that unchanged polls can be
+    answered (304) without querying the tunnels. Versions come from one
+    sequence, so the latest notified version of a user is that user's
+    version. The DB is read at startup and for users not tracked yet, on
+    every call while the listener is disconnected, and everything is re-read
+    after it reconnects, as notifications may have been missed.
+    """
+
+    def __init__(self, max_users: int = TRACKED_USERS_MAX_SIZE):
+        self.max_users = max_users
+        self._version = 0
+        self._stale = True
+        # Latest version per user (tunnels and tombstones), LRU
+        self._users: OrderedDict[UUID, int] = OrderedDict()
+
+    def on_notify(self, payload: str | None) -> None:
+        if payload is None:
+            self._stale = True
+            self._users.clear()
+            return
+        version, _, user_id = payload.partition(":")
+        version = int(version)
+        self._version = max(self._version, version)
+        if user_id:
+            self._remember(UUID(user_id), version)
+
+    def _remember(self, user_id: UUID, version: int) -> None:
+        self._users[user_id] = max(self._users.get(user_id, 0), version)
+        self._users.move_to_end(user_id)
+        if len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def _check_listener(self) -> bool:
+        """False while notifications aren't received: nothing tracked can be trusted."""
+        if pg_listener.connected:
+            return True
+        # Re-read once notifications flow again (the reconnect also marks it)
+        self._stale = True
+        self._users.clear()
+        return False
+
+    @staticmethod
+    async def _read(user_id: UUID | None = None) -> int:
+        from app.database import async_session
+
+        tunnels = select(func.coalesce(func.max(Tunnel.version), 0))
+        tombstones = select(func.coalesce(func.max(TunnelTombstone.version), 0))
+        if user_id is not None:
+            tunnels = tunnels.where(Tunnel.user_id == user_id)
+            tombstones = tombstones.where(TunnelTombstone.user_id == user_id)
+        async with async_session() as session:
+            return (
+                await session.execute(
+                    select(func.greatest(tunnels.scalar_subquery(), tombstones.scalar_subquery()))
+                )
+            ).scalar()
+
+    async def get(self) -> int:
+        """Latest version of all tunnels."""
+        if not self._check_listener():
+            return await self._read()
+        if self._stale:
+            version = await self._read()
+            self._version = max(self._version, version)
+            self._stale = False
+        return self._version
+
+    async def get_user(self, user_id: UUID) -> int:
+        """Latest version of the user's tunnels, unaffected by other users' changes."""
+        if not self._check_listener():
+            return await self._read(user_id)
+        version = self._users.get(user_id)
+        if version is not None:
+            self._users.move_to_end(user_id)
+            return version
+
+        version = await self._read(user_id)
+        # Merged with what was notified during the query
+        self._remember(user_id, version)
+        return self._users[user_id]
+
+
+tunnel_version = TunnelVersionTracker()
+pg_listener.subscribe(TUNNEL_CHANGES_CHANNEL, tunnel_version.on_notify)
+
+
+def make_etag(*parts) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already names `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates or "*" in candidates
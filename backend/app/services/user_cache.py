@@ -0,0 +1,89 @@
+import logging
+import time
+from collections import OrderedDict
+from uuid import UUID
+
+from app.models.user import User
+from app.services.pg_notify import pg_listener
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel the users triggers (migration 017) publish changed ids on
+USER_CHANGES_CHANNEL = "user_changes"
+# Upper bound on staleness if a notification is lost; entries are never
+# served while the listener is disconnected
+USER_CACHE_TTL_SECONDS = 30
+USER_CACHE_MAX_SIZE = 10000
+
+# The fields authorization and the handlers use from the current user
+CACHED_FIELDS = ("id", "email", "is_active", "is_admin", "is_beta_tester", "is_verified", "max_tunnels")
+
+
+class UserCache:
+    """LRU cache of the authenticated users' fields, per API process.
+
+    Saves the users lookup of every authenticated request. A trigger NOTIFYs
+    the id of any user whose cached fields change or who is deleted, and
+    every process drops that entry; everything is dropped when the listener
+    reconnects. Hits return a transient User, not attached to any session.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[UUID, tuple[float, dict]] = OrderedDict()
+        # Bumped by every invalidation: a lookup that raced with one must
+        # not store what it read
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, user_id: UUID) -> User | None:
+        entry = self._entries.get(user_id)
+        if entry is None or not pg_listener.connected or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.stats["hits"] += 1
+        return User(**entry[1])
+
+    def put(self, user: User, generation: int) -> None:
+        """Cache `user`, read from the DB when the generation was `generation`."""
+        if generation != self.generation or not pg_listener.connected:
+            return
+        fields = {name: getattr(user, name) for name in CACHED_FIELDS}
+        self._entries[user.id] = (time.monotonic() + self.ttl, fields)
+        self._entries.move_to_end(user.id)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: UUID) -> None:
+        self.generation += 1
+        self.stats["invalidations"] += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def on_notify(self, payload: str | None) -> None:
+        if payload is None:
+            self.clear()
+        else:
+            self.invalidate(UUID(payload))
+
+    def status(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "listening": pg_listener.connected,
+        }
+
+
+user_cache = UserCache()
+pg_listener.subscribe(USER_CHANGES_CHANNEL, user_cache.on_notify)
@@ -1,106 +1,263 @@
-import subprocess
+import asyncio
+import base64
+import logging
+import os
 import time
+from collections.abc import Iterable
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
 
 from app.config import settings
+from app.services.gateway_driver import LocalDriver, WireGuardDriver
 
-# With PersistentKeepalive=10s, rx should increase every ~10s.
-# 20s allows up to 2 missed keepalives before declaring disconnected.
-RX_STALE_TIMEOUT = 20
+logger = logging.getLogger(__name__)
 
+# A live client sends at least one packet per keepalive interval, so rx (or
+# the latest handshake, itself a received packet) moves at least that often.
+MAX_KEEPALIVE_SECONDS = max(
+    [settings.wireguard_keepalive, *settings.wireguard_keepalive_by_service.values()]
+)
+# Two missed keepalives, plus one status sampling interval, before declaring
+# a peer disconnected (55s with the default 25s keepalive)
+RX_STALE_TIMEOUT = 2 * MAX_KEEPALIVE_SECONDS + 5
+
+# Peers per `wg set` invocation (keeps the command line bounded)
+WG_SET_MAX_PEERS = 500
+# Peer changes within this window are persisted with a single `wg-quick save`
+SAVE_DEBOUNCE_SECONDS = 2
+
+
+def keepalive_for(service_type: str | None) -> int:
+    """PersistentKeepalive of the client config for a tunnel's service type."""
+    return settings.wireguard_keepalive_by_service.get(
+        service_type or "", settings.wireguard_keepalive
+    )
 
-class WireGuardService:
-    def __init__(self):
-        self.config_path = settings.wireguard_config_path
-        self.endpoint = settings.wireguard_endpoint
-        self.interface = settings.wireguard_interface
-        # Track when each peer first became connected (pubkey -> timestamp)
-        self._connected_since: dict[str, float] = {}
-        # Track rx bytes to detect disconnection faster
-        self._last_rx: dict[str, int] = {}
-        self._last_rx_change: dict[str, float] = {}
-        # Peers we've seen at least once (to avoid false positive on first read)
-        self._initialized: set[str] = set()
-
-    def generate_keypair(self) -> tuple[str, str]:
-        private_key = subprocess.check_output(["wg", "genkey"]).decode().strip()
-        public_key = subprocess.check_output(
-            ["wg", "pubkey"], input=private_key.encode()
-        ).decode().strip()
-        return private_key, public_key
-
-    def get_server_public_key(self) -> str:
-        output = subprocess.check_output(
-            ["sudo", "wg", "show", self.interface, "public-key"]
-        ).decode().strip()
-        return output
-
-    def add_peer(self, public_key: str, vpn_ip: str, device_ip: str) -> None:
-        allowed_ips = f"{vpn_ip}/32,{device_ip}/32"
-        subprocess.run(
-            ["sudo", "wg", "set", self.interface, "peer", public_key, "allowed-ips", allowed_ips],
-            check=True,
-        )
-        subprocess.run(["sudo", "wg-quick", "save", self.interface], check=True)
 
-    def remove_peer(self, public_key: str) -> None:
-        subprocess.run(
-            ["sudo", "wg", "set", self.interface, "peer", public_key, "remove"],
-            check=True,
+class PeerState:
+    """Liveness tracking of one peer across dumps."""
+
+    __slots__ = ("rx", "tx", "handshake", "rx_changed_at", "connected_since")
+
+    def __init__(
+        self,
+        rx: str,
+        handshake: bool = False,
+        rx_changed_at: float = 0.0,
+        connected_since: float = 0.0,
+        tx: str = "0",
+    ):
+        # Raw counter tokens from the dump: compared as strings, parsed only
+        # on change
+        self.rx = rx
+        self.tx = tx
+        self.handshake = handshake
+        self.rx_changed_at = rx_changed_at
+        self.connected_since = connected_since
+
+    @property
+    def connected(self) -> bool:
+        # Connected = had a handshake AND rx (or handshake) still moving
+        return (
+            self.handshake
+            and self.rx_changed_at > 0
+            and (time.time() - self.rx_changed_at) < RX_STALE_TIMEOUT
         )
-        subprocess.run(["sudo", "wg-quick", "save", self.interface], check=True)
 
-    def get_peers_status(self) -> dict[str, dict]:
-        """Return {public_key: {connected: bool, connected_since: int}} for all peers."""
+
+# Set along with any service's own flag, so one loop can serve every node
+_any_save_requested = asyncio.Event()
+
+
+def generate_keypair() -> tuple[str, str]:
+    """Same output as `wg genkey | wg pubkey`, without forking."""
+    private_bytes = bytearray(os.urandom(32))
+    # Curve25519 clamping, as done by `wg genkey`
+    private_bytes[0] &= 248
+    private_bytes[31] &= 127
+    private_bytes[31] |= 64
+    public_bytes = (
+        X25519PrivateKey.from_private_bytes(bytes(private_bytes))
+        .public_key()
+        .public_bytes(Encoding.Raw, PublicFormat.Raw)
+    )
+    return (
+        base64.b64encode(private_bytes).decode(),
+        base64.b64encode(public_bytes).decode(),
+    )
+
+
+class WireGuardService:
+    """WireGuard operations on the interface of one gateway node."""
+
+    def __init__(
+        self,
+        node_id: str = "local",
+        interface: str = settings.wireguard_interface,
+        endpoint: str = settings.wireguard_endpoint,
+        vpn_server_ip: str = settings.vpn_server_ip,
+        driver: WireGuardDriver | None = None,
+    ):
+        self.node_id = node_id
+        self.endpoint = endpoint
+        self.interface = interface
+        self.vpn_server_ip = vpn_server_ip
+        self.driver = driver or LocalDriver()
+        # Liveness state of the peers in the last dump; peers that leave the
+        # dump (deleted/disabled tunnels) are dropped with it
+        self._peers: dict[str, PeerState] = {}
+        # Interface public key, read once and refreshed from the dump header
+        self._server_public_key: str | None = None
+        # Set when live peers changed and the interface config must be saved
+        self._save_requested = asyncio.Event()
+
+    async def get_server_public_key(self) -> str:
+        if self._server_public_key is None:
+            result = await self.driver.run(["wg", "show", self.interface, "public-key"])
+            self._server_public_key = result.stdout.decode().strip()
+        return self._server_public_key
+
+    def _update_server_public_key(self, public_key: str) -> None:
+        if public_key and public_key != self._server_public_key:
+            if self._server_public_key is not None:
+                logger.warning("WireGuard interface %s (node %s) was re-keyed", self.interface, self.node_id)
+            self._server_public_key = public_key
+
+    async def add_peer(self, public_key: str, vpn_ip: str, device_ip: str) -> None:
+        await self.apply_peers(add=[(public_key, vpn_ip, device_ip)])
+
+    async def remove_peer(self, public_key: str) -> None:
+        await self.apply_peers(remove=[public_key])
+
+    async def apply_peers(
+        self,
+        add: Iterable[tuple[str, str, str]] = (),
+        remove: Iterable[str] = (),
+    ) -> None:
+        """Add (public_key, vpn_ip, device_ip) peers and remove peers by key.
+
+        All changes go through as few `wg set` invocations as possible;
+        persisting them to the interface config is left to the debounced
+        save loop.
+        """
+        specs: list[list[str]] = []
+        for public_key, vpn_ip, device_ip in add:
+            specs.append(["peer", public_key, "allowed-ips", f"{vpn_ip}/32,{device_ip}/32"])
+        for public_key in remove:
+            specs.append(["peer", public_key, "remove"])
+        if not specs:
+            return
+
         try:
-            output = subprocess.check_output(
-                ["sudo", "wg", "show", self.interface, "dump"]
-            ).decode().strip()
-        except Exception:
-            return {}
+            for i in range(0, len(specs), WG_SET_MAX_PEERS):
+                args = [arg for spec in specs[i : i + WG_SET_MAX_PEERS] for arg in spec]
+                await self.driver.run(["wg", "set", self.interface, *args])
+        finally:
+            # Persist whatever part of the batch was applied
+            self.request_save()
+
+    def request_save(self) -> None:
+        """Ask the save loop to persist the live peers with `wg-quick save`."""
+        self._save_requested.set()
+        _any_save_requested.set()
+
+    @property
+    def save_pending(self) -> bool:
+        return self._save_requested.is_set()
+
+    async def save(self) -> None:
+        self._save_requested.clear()
+        await self.driver.run(["wg-quick", "save", self.interface])
+
+    async def list_peers(self) -> dict[str, frozenset[str]]:
+        """Return {public_key: allowed_ips} for the peers configured on the interface."""
+        result = await self.driver.run(["wg", "show", self.interface, "dump"], timeout=30)
+        peers: dict[str, frozenset[str]] = {}
+        for line in result.stdout.decode().splitlines()[1:]:  # skip interface line
+            parts = line.split("\t")
+            if len(parts) >= 4:
+                allowed_ips = parts[3]
+                peers[parts[0]] = frozenset(
+                    allowed_ips.split(",") if allowed_ips != "(none)" else ()
+                )
+        return peers
+
+    @property
+    def peer_states(self) -> dict[str, PeerState]:
+        """Liveness state of the peers in the last dump (owned by the sampler)."""
+        return self._peers
+
+    def load_peer_states(self, states: dict[str, PeerState]) -> None:
+        """Resume liveness tracking from state recorded by another sampler."""
+        self._peers = states
+
+    async def get_peers_status(self) -> dict[str, dict]:
+        """Return {public_key: {connected: bool, connected_since: int}} for all peers.
+
+        Raises if the dump cannot be read, rather than reporting no peers.
+        """
+        result = await self.driver.run(["wg", "show", self.interface, "dump"], timeout=10)
+        output = result.stdout.decode().strip()
+
+        lines = output.splitlines()
+        if lines:
+            # Interface line: private-key, public-key, listen-port, fwmark
+            header = lines[0].split("\t")
+            if len(header) >= 2:
+                self._update_server_public_key(header[1])
 
         now = time.time()
+        previous = self._peers
+        peers: dict[str, PeerState] = {}
         status: dict[str, dict] = {}
         # wg dump columns: pubkey, preshared, endpoint, allowed-ips,
         #                   latest-handshake, rx, tx, keepalive
-        for line in output.splitlines()[1:]:  # skip header line
-            parts = line.split("\t")
-            if len(parts) >= 7:
-                pubkey = parts[0]
-                latest_handshake = int(parts[4]) if parts[4] != "0" else 0
-                rx_bytes = int(parts[5]) if parts[5] != "0" else 0
+        # Only the first 7 are needed: keepalive stays unsplit.
+        for line in lines[1:]:
+            parts = line.split("\t", 7)
+            if len(parts) < 7:
+                continue
+            pubkey = parts[0]
+            rx = parts[5]
 
+            state = previous.get(pubkey)
+            if state is None:
                 # First time seeing this peer: just record rx baseline, don't
-                # mark as "changed" (avoids false positive after API restart)
-                if pubkey not in self._initialized:
-                    self._initialized.add(pubkey)
-                    self._last_rx[pubkey] = rx_bytes
-                    # Don't set _last_rx_change → stays at 0 → not connected
-                else:
-                    # Track rx changes: if rx increased, peer is alive
-                    prev_rx = self._last_rx.get(pubkey, 0)
-                    if rx_bytes > prev_rx:
-                        self._last_rx[pubkey] = rx_bytes
-                        self._last_rx_change[pubkey] = now
-
-                last_rx_change = self._last_rx_change.get(pubkey, 0)
-                # Connected = had a handshake AND rx still changing (keepalives)
-                connected = (
-                    latest_handshake > 0
-                    and last_rx_change > 0
-                    and (now - last_rx_change) < RX_STALE_TIMEOUT
-                )
+                # mark as "changed" (avoids false positive after API restart);
+                # only its latest handshake counts below
+                state = PeerState(rx)
+            elif rx != state.rx:
+                # rx moved: the peer is alive if it increased. A decrease
+                # means the counters were reset (peer re-added): new baseline.
+                if int(rx) > int(state.rx):
+                    state.rx_changed_at = now
+                state.rx = rx
+            state.tx = parts[6]
+            state.handshake = parts[4] != "0"
+            if state.handshake:
+                # A handshake is a packet from the peer: activity even with a
+                # fresh rx baseline, so live peers show up right after a restart
+                latest_handshake = float(parts[4])
+                if latest_handshake > state.rx_changed_at:
+                    state.rx_changed_at = latest_handshake
+            peers[pubkey] = state
+
+            connected = state.connected
+
+            # Track connection start time
+            if connected:
+                if not state.connected_since:
+                    state.connected_since = now
+            else:
+                state.connected_since = 0.0
+
+            status[pubkey] = {
+                "connected": connected,
+                "connected_since": int(state.connected_since),
+            }
 
-                # Track connection start time
-                if connected:
-                    if pubkey not in self._connected_since:
-                        self._connected_since[pubkey] = now
-                else:
-                    self._connected_since.pop(pubkey, None)
-
-                status[pubkey] = {
-                    "connected": connected,
-                    "connected_since": int(self._connected_since.get(pubkey, 0)),
-                }
+        self._peers = peers
         return status
 
     def generate_client_config(
@@ -109,12 +266,14 @@ class WireGuardService:
         vpn_ip: str,
         device_ip: str,
         server_public_key: str,
+        service_type: str | None = None,
     ) -> str:
         # AllowedIPs = server VPN IP so client can:
         #   - Accept incoming packets from server (HAProxy reverse proxy)
         #   - Route responses back to server through the tunnel
         # NOT 0.0.0.0/0 to prevent client using VPN as internet proxy
-        server_vpn_ip = settings.vpn_server_ip
+        server_vpn_ip = self.vpn_server_ip
+        keepalive = keepalive_for(service_type)
         return f"""# IP de l'equipement cible : {device_ip}
 # Assignez cette IP directement a votre equipement (camera, NAS...)
 # et activez ip_forward sur ce routeur WireGuard.
@@ -128,8 +287,11 @@ DNS = 1.1.1.1
 PublicKey = {server_public_key}
 Endpoint = {self.endpoint}
 AllowedIPs = {server_vpn_ip}/32
-PersistentKeepalive = 10
+PersistentKeepalive = {keepalive}
 """
 
 
-wireguard_service = WireGuardService()
+async def wait_any_save_requested() -> None:
+    """Wait until some service requests a save, and re-arm the wakeup."""
+    await _any_save_requested.wait()
+    _any_save_requested.clear()
@@ -0,0 +1,123 @@
+"""Per-message cost of rendering and encoding the transactional emails.
+
+Compares build_message() with building the same bodies as `email.mime`
+objects serialized with the SMTP policy (how messages were assembled
+before the templates), and times loading the templates with and without
+the bytecode cache.
+
+Run from backend/:  python -m scripts.bench_email_render [--number N]
+"""
+import argparse
+import tempfile
+import time
+import timeit
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import SMTP
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from app.config import settings
+from app.services.email_templates import TEMPLATES, TEMPLATES_DIR, build_message
+
+TO_EMAIL = "user@example.com"
+CONFIG_TEXT = "[Interface]\nPrivateKey = x\n" * 10
+
+MESSAGES = {
+    "verification": (
+        "HomeAccess - Code de verification : 123456",
+        {"code": "123456", "password": "Pw!1abcd"},
+        None,
+    ),
+    "tunnel_created": (
+        "HomeAccess - Tunnel cam pret",
+        {
+            "subdomain": "cam",
+            "full_domain": "cam.homeaccess.site",
+            "url": "https://cam.homeaccess.site",
+            "docs_url": "https://homeaccess.site/docs",
+            "dashboard_url": "https://homeaccess.site/dashboard",
+            "vpn_ip": "172.16.0.2",
+            "device_ip": "10.100.0.2",
+            "target_port": 8123,
+        },
+        [("homevpn-cam.conf", CONFIG_TEXT.encode())],
+    ),
+}
+
+
+def mime_message(subject: str, text: str, html: str, attachments) -> bytes:
+    alternative = MIMEMultipart("alternative")
+    alternative.attach(MIMEText(text, "plain"))
+    alternative.attach(MIMEText(html, "html"))
+    if attachments:
+        msg = MIMEMultipart("mixed")
+        msg.attach(alternative)
+        for filename, content in attachments:
+            part = MIMEBase("application", "octet-stream")
+            part.set_payload(content)
+            encoders.encode_base64(part)
+            part.add_header("Content-Disposition", f'attachment; filename="{filename}"')
+            msg.attach(part)
+    else:
+        msg = alternative
+    msg["Subject"] = subject
+    msg["From"] = settings.smtp_from
+    msg["To"] = TO_EMAIL
+    return msg.as_bytes(policy=SMTP)
+
+
+def best(func, number: int) -> float:
+    """Best of 5 runs, in microseconds per call."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def load_templates(bytecode_dir: str | None) -> float:
+    """Milliseconds to load every template into a fresh environment."""
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=select_autoescape(["html"]),
+        bytecode_cache=FileSystemBytecodeCache(bytecode_dir) if bytecode_dir else None,
+        auto_reload=False,
+    )
+    start = time.perf_counter()
+    for name in env.list_templates():
+        env.get_template(name)
+    return (time.perf_counter() - start) * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=5000, help="calls per run")
+    args = parser.parse_args()
+
+    for name, (subject, context, attachments) in MESSAGES.items():
+        template = TEMPLATES[name]
+        text, html = template.render(**context)
+
+        def render():
+            template.render(**context)
+
+        def mime():
+            mime_message(subject, *template.render(**context), attachments)
+
+        def raw():
+            build_message(TO_EMAIL, subject, *template.render(**context), attachments)
+
+        print(
+            f"{name:15s} email.mime {best(mime, args.number):7.1f} us/msg"
+            f"  build_message {best(raw, args.number):6.1f} us/msg"
+            f"  (render alone {best(render, args.number):5.1f})"
+        )
+
+    with tempfile.TemporaryDirectory() as bytecode_dir:
+        compiled = min(load_templates(None) for _ in range(5))
+        load_templates(bytecode_dir)
+        cached = min(load_templates(bytecode_dir) for _ in range(5))
+    print(f"loading the templates: {compiled:.1f} ms compiled, {cached:.1f} ms from bytecode cache")
+
+
+if __name__ == "__main__":
+    main()
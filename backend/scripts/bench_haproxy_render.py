@@ -0,0 +1,100 @@
+"""Time and memory of the HAProxy config rendering from 1k to 100k tunnels.
+
+For each size, inserts that many active tunnels for a throwaway user in
+one transaction, renders the config from them through the server-side
+cursor (runtime API and reload disabled, files in a temp directory), and
+rolls everything back. Reports the render time and the peak Python
+memory (tracemalloc), next to loading the same tunnels as ORM objects
+(how the config was rendered before).
+
+Needs the configured database. Run from backend/:
+    python -m scripts.bench_haproxy_render [--sizes 1000 10000 100000]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from sqlalchemy import select, text
+
+from app.database import async_session
+from app.models.tunnel import Tunnel
+from app.models.user import User
+from app.services.haproxy import HAProxyService
+
+# CGNAT range, never allocated to real tunnels
+INSERT_TUNNELS = text("""
+    INSERT INTO tunnels (
+        id, user_id, subdomain, target_port, vpn_ip, device_ip, use_device_ip,
+        client_private_key, client_public_key, server_public_key
+    )
+    SELECT gen_random_uuid(), :user_id, 'bench-' || n, 8123,
+           '100.64.0.0'::inet + n, '100.96.0.0'::inet + n, n % 2 = 0,
+           repeat('k', 140), 'bench-' || n, 'server'
+    FROM generate_series(1, :count) AS n
+""")
+
+
+def make_service(directory: str) -> HAProxyService:
+    service = HAProxyService()
+    service.backends_path = f"{directory}/homevpn-backends.cfg"
+    service.map_path = f"{directory}/homevpn-subdomains.map"
+    service.state_path = f"{service.backends_path}.applied"
+    service.runtime = None
+
+    async def reload() -> bool:
+        return True
+
+    service._reload = reload
+    return service
+
+
+async def measure(coro_factory) -> tuple[float, float]:
+    """(seconds, peak MiB) of a call: timed first, then run again under tracemalloc."""
+    start = time.perf_counter()
+    await coro_factory()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    await coro_factory()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+async def bench(count: int) -> None:
+    async with async_session() as db:
+        user = User(email=f"haproxy-bench-{uuid.uuid4().hex[:8]}@example.com", password_hash="x")
+        db.add(user)
+        await db.flush()
+        await db.execute(INSERT_TUNNELS, {"user_id": user.id, "count": count})
+
+        with tempfile.TemporaryDirectory() as directory:
+            service = make_service(directory)
+            render_time, render_peak = await measure(lambda: service.regenerate_config(db))
+
+        async def load_orm():
+            result = await db.execute(select(Tunnel).where(Tunnel.is_active == True))  # noqa: E712
+            result.scalars().all()
+
+        orm_time, orm_peak = await measure(load_orm)
+        await db.rollback()
+
+    print(
+        f"{count:>7} tunnels  render {render_time * 1e3:8.1f} ms  peak {render_peak:6.1f} MiB"
+        f"  ({render_time / count * 1e6:5.1f} us/tunnel)"
+        f"  | ORM load alone {orm_time * 1e3:8.1f} ms  peak {orm_peak:6.1f} MiB"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    for count in args.sizes:
+        await bench(count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
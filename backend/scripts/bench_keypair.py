@@ -0,0 +1,64 @@
+"""Cost of the keys needed by create_tunnel: in-process vs forking `wg`.
+
+The in-process path is generate_keypair() plus the cached server public
+key. The fork path is what create_tunnel ran before: `wg genkey`,
+`wg pubkey` and `sudo wg show <interface> public-key`, through the command
+executor. Without `wg` on PATH, three runs of `true` stand in for them,
+which only counts the process spawns (a lower bound).
+
+Run from backend/:  python -m scripts.bench_keypair [--number N]
+"""
+import argparse
+import asyncio
+import shutil
+import time
+
+from app.config import settings
+from app.services.executor import command_executor
+from app.services.wireguard import WireGuardService, generate_keypair
+
+
+async def fork_keys() -> None:
+    private = (await command_executor.run(["wg", "genkey"])).stdout
+    await command_executor.run(["wg", "pubkey"], input=private)
+    await command_executor.run(["sudo", "wg", "show", settings.wireguard_interface, "public-key"])
+
+
+async def spawn_stand_in() -> None:
+    for _ in range(3):
+        await command_executor.run(["true"])
+
+
+async def per_call(func, number: int) -> float:
+    """Best of 5 runs, in microseconds per call."""
+    runs = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        runs.append((time.perf_counter() - start) / number * 1e6)
+    return min(runs)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    service = WireGuardService()
+    service._server_public_key = "cached"
+
+    async def in_process() -> None:
+        generate_keypair()
+        await service.get_server_public_key()
+
+    print(f"in-process     {await per_call(in_process, args.number * 10):8.1f} us/tunnel")
+    if shutil.which("wg"):
+        print(f"wg (3 forks)   {await per_call(fork_keys, args.number):8.1f} us/tunnel")
+    else:
+        print(f"3 x true       {await per_call(spawn_stand_in, args.number):8.1f} us/tunnel"
+              "  (wg not found: process spawns only)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
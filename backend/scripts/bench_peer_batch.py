@@ -0,0 +1,63 @@
+"""Cost of removing the peers of a banned user with N tunnels.
+
+Compares one `wg set` + `wg-quick save` per peer (as remove_peer did
+before the batch API) with apply_peers() followed by a single save. The
+interface is never touched: each command is replaced by a run of `true`
+through the command executor, so the timings count the process spawns,
+and the `wg-quick save` rewrites are counted rather than performed.
+
+Run from backend/:  python -m scripts.bench_peer_batch [--tunnels 50]
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.executor import DEFAULT_TIMEOUT_SECONDS, CommandResult, command_executor
+from app.services.gateway_driver import WireGuardDriver
+from app.services.wireguard import WireGuardService, generate_keypair
+
+
+class StandInDriver(WireGuardDriver):
+    """Records the commands and runs `true` for each of them."""
+
+    def __init__(self):
+        self.commands: list[list[str]] = []
+
+    async def run(self, args, *, input=None, timeout=DEFAULT_TIMEOUT_SECONDS) -> CommandResult:
+        self.commands.append(args)
+        return await command_executor.run(["true"], timeout=timeout)
+
+
+async def per_peer(service: WireGuardService, keys: list[str]) -> None:
+    for key in keys:
+        await service.driver.run(["wg", "set", service.interface, "peer", key, "remove"])
+        await service.driver.run(["wg-quick", "save", service.interface])
+
+
+async def batched(service: WireGuardService, keys: list[str]) -> None:
+    await service.apply_peers(remove=keys)
+    # What the save loop runs once the debounce window has passed
+    await service.save()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tunnels", type=int, default=50)
+    args = parser.parse_args()
+    keys = [generate_keypair()[1] for _ in range(args.tunnels)]
+
+    for name, ban in (("per peer", per_peer), ("batched", batched)):
+        service = WireGuardService(driver=StandInDriver())
+        start = time.perf_counter()
+        await ban(service, keys)
+        elapsed = time.perf_counter() - start
+        commands = service.driver.commands
+        saves = sum(command[0] == "wg-quick" for command in commands)
+        print(
+            f"{name:9s} {len(commands):4d} commands ({saves} wg-quick save)"
+            f"  {elapsed * 1e3:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Parse time and state size of `wg show dump` for a large interface.
+
+Feeds a synthetic dump of N peers to get_peers_status(): the first
+sample (every peer new), steady samples where a tenth of the peers moved,
+and a sample after a tenth of the peers were removed. Also reports the
+memory held by the per-peer records (tracemalloc).
+
+Run from backend/:  python -m scripts.bench_peer_dump [--peers 50000]
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+import tracemalloc
+
+from app.services.executor import DEFAULT_TIMEOUT_SECONDS, CommandResult
+from app.services.gateway_driver import WireGuardDriver
+from app.services.wireguard import WireGuardService
+
+
+class DumpDriver(WireGuardDriver):
+    def __init__(self):
+        self.dump = b""
+
+    async def run(self, args, *, input=None, timeout=DEFAULT_TIMEOUT_SECONDS) -> CommandResult:
+        return CommandResult(tuple(args), 0, self.dump, b"", 0.0)
+
+
+def make_dump(keys: list[str], rx: list[int], now: int) -> bytes:
+    lines = ["private\tserver-key\t51820\toff"]
+    for i, key in enumerate(keys):
+        lines.append(
+            f"{key}\t(none)\t203.0.113.{i % 250}:51820\t172.16.{i // 250}.{i % 250}/32,"
+            f"10.100.{i // 250}.{i % 250}/32\t{now - 30}\t{rx[i]}\t{rx[i] // 2}\t25"
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def timed_sample(service: WireGuardService) -> float:
+    start = time.perf_counter()
+    await service.get_peers_status()
+    return (time.perf_counter() - start) * 1e3
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, default=50000)
+    args = parser.parse_args()
+
+    keys = [base64.b64encode(os.urandom(32)).decode() for _ in range(args.peers)]
+    rx = [1000 * (i + 1) for i in range(args.peers)]
+    driver = DumpDriver()
+    service = WireGuardService(driver=driver)
+    service._server_public_key = "server-key"
+    now = int(time.time())
+
+    driver.dump = make_dump(keys, rx, now)
+    print(f"first sample   {await timed_sample(service):7.1f} ms  ({args.peers} new peers)")
+
+    steady = []
+    for step in range(5):
+        for i in range(step, args.peers, 10):
+            rx[i] += 148
+        driver.dump = make_dump(keys, rx, now)
+        steady.append(await timed_sample(service))
+    print(f"steady sample  {min(steady):7.1f} ms  (best of 5, a tenth of the peers moved)")
+
+    kept = args.peers - args.peers // 10
+    driver.dump = make_dump(keys[:kept], rx, now)
+    print(f"after removals {await timed_sample(service):7.1f} ms  ({len(service.peer_states)} peers tracked)")
+
+    # The status returned is dropped: what stays allocated are the records
+    tracemalloc.start()
+    service.load_peer_states({})
+    await service.get_peers_status()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"peer records   {held / len(service.peer_states):7.0f} bytes/peer"
+          f"  ({held / 2**20:.1f} MiB for {len(service.peer_states)} peers)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Authenticated request throughput with and without the user cache.
+
+Adds a no-op endpoint that only depends on get_current_user to the app,
+and times sequential requests to it (in-process ASGI client) for a
+throwaway user, with the cache on and bypassed. Also measures how long a
+change written by another connection (plain SQL, standing in for another
+API process) takes to reach this process through NOTIFY.
+
+Needs the configured database. Run from backend/:
+    python -m scripts.bench_user_cache [--requests 2000]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import delete, update
+
+from app.database import async_session
+from app.dependencies import get_current_user
+from app.main import app
+from app.models.user import User
+from app.services.auth import create_access_token
+from app.services.pg_notify import pg_listener
+from app.services.user_cache import user_cache
+
+EMAIL = "user-cache-bench@example.com"
+
+
+@app.get("/bench/whoami")
+async def whoami(user: User = Depends(get_current_user)):
+    return {"id": str(user.id)}
+
+
+async def timed_requests(client: httpx.AsyncClient, headers: dict, n: int) -> str:
+    await client.get("/bench/whoami", headers=headers)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n):
+        request_start = time.perf_counter()
+        response = await client.get("/bench/whoami", headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - request_start) * 1e3)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (
+        f"{n / elapsed:.0f} req/s  p50 {latencies[n // 2]:.2f} ms  "
+        f"p99 {latencies[int(n * 0.99)]:.2f} ms"
+    )
+
+
+async def external_change_delay(client: httpx.AsyncClient, headers: dict, user_id) -> float:
+    """Milliseconds until a ban committed by another connection answers 401."""
+    await client.get("/bench/whoami", headers=headers)
+    async with async_session() as db:
+        await db.execute(update(User).where(User.id == user_id).values(is_active=False))
+        await db.commit()
+    start = time.perf_counter()
+    while (await client.get("/bench/whoami", headers=headers)).status_code != 401:
+        await asyncio.sleep(0.001)
+    return (time.perf_counter() - start) * 1e3
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    listener = asyncio.create_task(pg_listener.run())
+    for _ in range(100):
+        if pg_listener.connected:
+            break
+        await asyncio.sleep(0.05)
+    else:
+        raise SystemExit("LISTEN connection not established")
+
+    async with async_session() as db:
+        await db.execute(delete(User).where(User.email == EMAIL))
+        user = User(email=EMAIL, password_hash="x", is_verified=True)
+        db.add(user)
+        await db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+            print(f"cache     {await timed_requests(client, headers, args.requests)}")
+            print(f"hit rate  {user_cache.status()['hit_rate']}")
+
+            get = user_cache.get
+            user_cache.get = lambda _user_id: None
+            try:
+                print(f"no cache  {await timed_requests(client, headers, args.requests)}")
+            finally:
+                user_cache.get = get
+
+            delay = await external_change_delay(client, headers, user.id)
+            print(f"ban by another connection seen after {delay:.1f} ms")
+    finally:
+        async with async_session() as db:
+            await db.execute(delete(User).where(User.email == EMAIL))
+            await db.commit()
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
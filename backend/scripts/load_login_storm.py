@@ -0,0 +1,121 @@
+"""Event loop latency during a login storm, with bcrypt in the pool or on the loop.
+
+Sends waves of concurrent logins to the app (in-process ASGI client, rate
+limits off) for a throwaway user, while GET /api/health is polled every
+20 ms, and reports the health latencies and the login status codes.
+`inline` runs bcrypt on the event loop, as before the password hasher.
+
+Needs the configured database. Run from backend/:
+    python -m scripts.load_login_storm [--mode pool|inline|both] [--waves 4] [--concurrency 25]
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import bcrypt
+import httpx
+from sqlalchemy import delete
+
+from app.config import settings
+from app.database import async_session
+from app.main import app
+from app.models.user import User
+from app.routers import auth as auth_router
+from app.services.auth import password_hasher
+
+EMAIL = "login-storm@example.com"
+PASSWORD = "S3cret!pass"
+POLL_INTERVAL_SECONDS = 0.02
+
+
+def quantile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def poll_health(client: httpx.AsyncClient, stop: asyncio.Event) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/api/health")
+        latencies.append((time.perf_counter() - start) * 1e3)
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+    return sorted(latencies)
+
+
+async def measure(client: httpx.AsyncClient, storm) -> tuple[list[float], float]:
+    stop = asyncio.Event()
+    poller = asyncio.create_task(poll_health(client, stop))
+    start = time.perf_counter()
+    await storm()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return await poller, elapsed
+
+
+def report(label: str, latencies: list[float]) -> str:
+    return (
+        f"{label}: health n={len(latencies)} p50={quantile(latencies, 0.5):.1f} ms "
+        f"p99={quantile(latencies, 0.99):.1f} ms max={latencies[-1]:.1f} ms"
+    )
+
+
+async def run_mode(client: httpx.AsyncClient, mode: str, waves: int, concurrency: int) -> None:
+    codes: Counter[int] = Counter()
+
+    async def login():
+        response = await client.post("/api/auth/login", json={"email": EMAIL, "password": PASSWORD})
+        codes[response.status_code] += 1
+
+    async def storm():
+        for _ in range(waves):
+            await asyncio.gather(*(login() for _ in range(concurrency)))
+
+    run = password_hasher._run
+    if mode == "inline":
+        async def inline(func, *args):
+            return func(*args)
+
+        password_hasher._run = inline
+    try:
+        latencies, elapsed = await measure(client, storm)
+    finally:
+        password_hasher._run = run
+    print(f"{report(mode, latencies)} | {waves * concurrency} logins in {elapsed:.1f}s {dict(codes)}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("pool", "inline", "both"), default="both")
+    parser.add_argument("--waves", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=25)
+    args = parser.parse_args()
+
+    auth_router.limiter.enabled = False
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(settings.bcrypt_rounds)).decode()
+    async with async_session() as db:
+        await db.execute(delete(User).where(User.email == EMAIL))
+        db.add(User(email=EMAIL, password_hash=password_hash, is_verified=True))
+        await db.commit()
+    print(
+        f"bcrypt cost {settings.bcrypt_rounds}, {password_hasher.workers} workers, "
+        f"queue {password_hasher.max_queue}"
+    )
+
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+            idle, _ = await measure(client, lambda: asyncio.sleep(2))
+            print(report("idle", idle))
+            modes = ("inline", "pool") if args.mode == "both" else (args.mode,)
+            for mode in modes:
+                await run_mode(client, mode, args.waves, args.concurrency)
+    finally:
+        async with async_session() as db:
+            await db.execute(delete(User).where(User.email == EMAIL))
+            await db.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """Runs against the configured Postgres database; skipped when it is unreachable.
+
+    Tests create their own rows and delete them in asyncTearDown.
+    """
+
+    async def asyncSetUp(self):
+        # NullPool: connections must not outlive the test's event loop
+        self.engine = create_async_engine(settings.database_url, poolclass=NullPool)
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        except Exception as e:
+            await self.engine.dispose()
+            self.skipTest(f"database unavailable: {e}")
+        self.session = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
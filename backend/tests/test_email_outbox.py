@@ -0,0 +1,201 @@
+import asyncio
+import email
+import smtplib
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email import policy
+from unittest import mock
+
+from sqlalchemy import delete, select
+
+from app.models.email_outbox import EmailOutbox
+from app.services.email_outbox import (
+    EMAIL_CLAIM_SECONDS,
+    EMAIL_FAILED,
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_PENDING,
+    EMAIL_RETRY_BACKOFF_SECONDS,
+    EMAIL_SENT,
+    EmailSender,
+    RateLimiter,
+    _is_permanent,
+    enqueue_email,
+)
+from app.services.email_templates import TEMPLATES, build_message
+from tests.support import DatabaseTestCase
+
+DOMAIN = "outbox.invalid"
+
+TEMPORARY = smtplib.SMTPResponseException(451, b"Try again later")
+PERMANENT = smtplib.SMTPResponseException(550, b"Mailbox unavailable")
+
+
+class FakeSMTP:
+    """Stands in for an SMTPSession; errors are looked up by recipient."""
+
+    def __init__(self, errors: dict[str, Exception]):
+        self.errors = errors
+        self.sent: dict[str, bytes] = {}
+        self.is_open = True
+        self.last_used = time.monotonic()
+
+    async def send(self, from_addr: str, to_addrs: list[str], message: bytes) -> None:
+        await asyncio.sleep(0)
+        if to_addrs[0] in self.errors:
+            raise self.errors[to_addrs[0]]
+        self.sent[to_addrs[0]] = message
+
+    async def close(self) -> None:
+        self.is_open = False
+
+
+class ClassificationTest(unittest.TestCase):
+    def test_permanent_errors(self):
+        self.assertTrue(_is_permanent(PERMANENT))
+        self.assertFalse(_is_permanent(TEMPORARY))
+        self.assertFalse(_is_permanent(smtplib.SMTPServerDisconnected("gone")))
+        self.assertFalse(_is_permanent(TimeoutError()))
+
+    def test_refused_recipients(self):
+        refused = smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"unknown")})
+        self.assertTrue(_is_permanent(refused))
+        refused = smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"greylisted")})
+        self.assertFalse(_is_permanent(refused))
+
+    def test_backoff_doubles_until_the_last_attempt(self):
+        sender = EmailSender(1, 0)
+        entry = EmailOutbox(id=1, to_email="a@example.com", attempts=0, status=EMAIL_PENDING, message="m")
+        delays = []
+        while entry.status == EMAIL_PENDING:
+            before = datetime.now(timezone.utc)
+            sender._record(entry, TEMPORARY)
+            if entry.status == EMAIL_PENDING:
+                delays.append(round((entry.next_attempt_at - before).total_seconds()))
+        self.assertEqual(
+            delays, [EMAIL_RETRY_BACKOFF_SECONDS * 2 ** n for n in range(EMAIL_MAX_ATTEMPTS - 1)]
+        )
+        self.assertEqual(entry.attempts, EMAIL_MAX_ATTEMPTS)
+        self.assertEqual(entry.status, EMAIL_FAILED)
+        self.assertIsNone(entry.message)
+        self.assertEqual(sender.stats["failed"], 1)
+
+    def test_batch_fits_in_the_claim_at_the_rate_cap(self):
+        self.assertEqual(EmailSender(1, 0).batch_size, 50)
+        sender = EmailSender(1, 0.1)
+        self.assertLessEqual(sender.batch_size / 0.1, EMAIL_CLAIM_SECONDS)
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_spaces_acquisitions(self):
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(6):
+            await limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50 - 0.005)
+
+    async def test_no_limit(self):
+        limiter = RateLimiter(0)
+        start = time.monotonic()
+        for _ in range(100):
+            await limiter.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+
+class OutboxDeliveryTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await self._cleanup()
+        patch = mock.patch("app.database.async_session", self.session)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.sender = EmailSender(2, 0)
+
+    async def asyncTearDown(self):
+        await self._cleanup()
+        await super().asyncTearDown()
+
+    async def _cleanup(self) -> None:
+        async with self.session() as db:
+            await db.execute(delete(EmailOutbox).where(EmailOutbox.to_email.like(f"%@{DOMAIN}")))
+            await db.commit()
+
+    async def _entries(self) -> dict[str, EmailOutbox]:
+        async with self.session() as db:
+            result = await db.execute(
+                select(EmailOutbox).where(EmailOutbox.to_email.like(f"%@{DOMAIN}"))
+            )
+            return {entry.to_email: entry for entry in result.scalars()}
+
+    async def test_rendered_message_round_trip(self):
+        to_email = f"user@{DOMAIN}"
+        text, html = TEMPLATES["verification"].render(code="123456", password="p<w>&d")
+        subject = "HomeAccess - Code de vérification : 123456"
+        message = build_message(
+            to_email, subject, text, html, [("clé wg0.conf", b"[Interface]\n")], f"reply@{DOMAIN}"
+        )
+        async with self.session() as db:
+            await enqueue_email(to_email, subject, message, db)
+            await db.commit()
+
+        smtp = FakeSMTP({})
+        self.sender.pool = [smtp]
+        self.assertEqual(await self.sender.deliver_batch(), 1)
+        self.assertEqual(smtp.sent[to_email], message)
+
+        parsed = email.message_from_bytes(smtp.sent[to_email], policy=policy.default)
+        self.assertEqual(parsed["Subject"], subject)
+        self.assertEqual(parsed["To"], to_email)
+        self.assertEqual(parsed["Reply-To"], f"reply@{DOMAIN}")
+        # The text body is sent with CRLF line endings
+        plain = parsed.get_body(("plain",)).get_content()
+        self.assertEqual(plain.replace("\r\n", "\n"), text)
+        self.assertEqual(parsed.get_body(("html",)).get_content(), html)
+        self.assertIn("p&lt;w&gt;&amp;d", html)
+        (attachment,) = parsed.iter_attachments()
+        self.assertEqual(attachment.get_filename(), "clé wg0.conf")
+        self.assertEqual(attachment.get_content(), b"[Interface]\n")
+
+    async def test_outcomes_are_recorded_per_message(self):
+        async with self.session() as db:
+            for name in ("ok", "later", "never"):
+                to_email = f"{name}@{DOMAIN}"
+                await enqueue_email(to_email, name, build_message(to_email, name, "t", "h"), db)
+            await db.commit()
+        smtps = [FakeSMTP({f"later@{DOMAIN}": TEMPORARY, f"never@{DOMAIN}": PERMANENT}) for _ in range(2)]
+        self.sender.pool = smtps
+
+        started = datetime.now(timezone.utc)
+        self.assertEqual(await self.sender.deliver_batch(), 3)
+        entries = await self._entries()
+
+        ok, later, never = (entries[f"{name}@{DOMAIN}"] for name in ("ok", "later", "never"))
+        self.assertEqual((ok.status, ok.attempts, ok.message), (EMAIL_SENT, 1, None))
+        self.assertIsNotNone(ok.sent_at)
+        self.assertEqual((later.status, later.attempts), (EMAIL_PENDING, 1))
+        self.assertIsNotNone(later.message)
+        self.assertGreaterEqual(
+            later.next_attempt_at, started + timedelta(seconds=EMAIL_RETRY_BACKOFF_SECONDS)
+        )
+        self.assertEqual((never.status, never.message), (EMAIL_FAILED, None))
+        self.assertIn("550", never.last_error)
+        # Nothing else is due
+        self.assertEqual(await self.sender.deliver_batch(), 0)
+        self.assertEqual(sum(len(smtp.sent) for smtp in smtps), 1)
+
+    async def test_claimed_messages_are_hidden_from_other_senders(self):
+        to_email = f"user@{DOMAIN}"
+        async with self.session() as db:
+            await enqueue_email(to_email, "s", build_message(to_email, "s", "t", "h"), db)
+            await db.commit()
+
+        async with self.session() as db:
+            claimed = await self.sender._claim(db)
+        self.assertEqual([entry.to_email for entry in claimed], [to_email])
+        other = EmailSender(1, 0)
+        other.pool = [FakeSMTP({})]
+        self.assertEqual(await other.deliver_batch(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
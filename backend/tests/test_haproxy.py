@@ -0,0 +1,239 @@
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+
+from app.services.haproxy import GENERATED_HEADER, RENDER_BATCH_SIZE, HAProxyService
+from app.services.haproxy_runtime import HAProxyRuntimeClient
+
+Row = namedtuple("Row", "subdomain vpn_ip device_ip use_device_ip target_port")
+
+# Success answers of the runtime commands that print something
+ANSWERS = {
+    "add server": "New server registered.",
+    "del server": "Server deleted.",
+    "set server": "IP changed from 'a' to 'b', no need to change the port",
+}
+
+
+def tunnel(subdomain: str, n: int, port: int = 8123, use_device_ip: bool = True) -> Row:
+    return Row(subdomain, f"10.8.0.{n}", f"10.9.0.{n}", use_device_ip, port)
+
+
+class FakeRuntime(HAProxyRuntimeClient):
+    """Records runtime commands; a command starting with `fail_on` gets an error."""
+
+    def __init__(self):
+        super().__init__("/nonexistent")
+        self.commands: list[str] = []
+        self.fail_on: str | None = None
+
+    async def execute(self, command: str) -> str:
+        self.commands.append(command)
+        if self.fail_on and command.startswith(self.fail_on):
+            return "No such server."
+        return next((a for prefix, a in ANSWERS.items() if command.startswith(prefix)), "")
+
+
+class FakeStream:
+    def __init__(self, rows):
+        self._rows = iter(rows)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._rows)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+
+class FakeSession:
+    """Serves the active tunnels (already ordered) to regenerate_config."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.streamed = None
+
+    async def execute(self, _statement):
+        return None
+
+    async def stream(self, statement):
+        self.streamed = statement
+        return FakeStream(self.rows)
+
+
+class HAProxyTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.reloads = 0
+        self.reload_ok = True
+        self.service = self.make_service()
+
+    def make_service(self) -> HAProxyService:
+        service = HAProxyService()
+        service.backends_path = os.path.join(self.tmp.name, "homevpn-backends.cfg")
+        service.map_path = os.path.join(self.tmp.name, "homevpn-subdomains.map")
+        service.state_path = f"{service.backends_path}.applied"
+        service.runtime = FakeRuntime()
+
+        async def reload() -> bool:
+            self.reloads += 1
+            return self.reload_ok
+
+        service._reload = reload
+        return service
+
+    async def regenerate(self, rows, service: HAProxyService | None = None, version=None):
+        service = service or self.service
+        service.runtime.commands.clear()
+        await service.regenerate_config(FakeSession(rows), version)
+        return service.runtime.commands
+
+    def read(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class RuntimeApplyTest(HAProxyTestCase):
+    async def test_first_apply_reloads(self):
+        commands = await self.regenerate([tunnel("cam", 2)])
+        self.assertEqual(commands, [])
+        self.assertEqual(self.reloads, 1)
+
+    async def test_address_change_is_applied_in_place(self):
+        await self.regenerate([tunnel("cam", 2), tunnel("nas", 3)])
+        commands = await self.regenerate([tunnel("cam", 2), tunnel("nas", 3, use_device_ip=False)])
+        self.assertEqual(commands, ["set server bk_hvpn_nas/srv1 addr 10.8.0.3 port 8123"])
+        self.assertEqual(self.reloads, 1)
+        self.assertEqual(self.service.stats["runtime_updates"], 1)
+
+    async def test_removed_tunnel_is_unrouted(self):
+        await self.regenerate([tunnel("cam", 2), tunnel("nas", 3)])
+        commands = await self.regenerate([tunnel("cam", 2)])
+        self.assertEqual(commands, [
+            f"del map {self.service.map_path} nas",
+            "disable server bk_hvpn_nas/srv1",
+            "del server bk_hvpn_nas/srv1",
+        ])
+        self.assertEqual(self.reloads, 1)
+
+    async def test_loaded_backend_is_re_added_at_runtime(self):
+        await self.regenerate([tunnel("cam", 2), tunnel("nas", 3)])
+        await self.regenerate([tunnel("cam", 2)])
+        commands = await self.regenerate([tunnel("cam", 2), tunnel("nas", 4, port=80)])
+        self.assertEqual(commands, [
+            "add server bk_hvpn_nas/srv1 10.9.0.4:80 check inter 10s fall 3 rise 2",
+            "enable health bk_hvpn_nas/srv1",
+            "enable server bk_hvpn_nas/srv1",
+            f"add map {self.service.map_path} nas bk_hvpn_nas",
+        ])
+        self.assertEqual(self.reloads, 1)
+
+    async def test_new_backend_reloads(self):
+        await self.regenerate([tunnel("cam", 2)])
+        commands = await self.regenerate([tunnel("cam", 2), tunnel("nas", 3)])
+        self.assertEqual(commands, [])
+        self.assertEqual(self.reloads, 2)
+
+    async def test_runtime_failure_falls_back_to_reload(self):
+        await self.regenerate([tunnel("cam", 2)])
+        self.service.runtime.fail_on = "set server"
+        await self.regenerate([tunnel("cam", 5)])
+        self.assertEqual(self.reloads, 2)
+        self.assertEqual(self.service.stats["runtime_updates"], 0)
+
+    async def test_failed_reload_forces_the_next_one(self):
+        await self.regenerate([tunnel("cam", 2)])
+        self.reload_ok = False
+        await self.regenerate([tunnel("cam", 2), tunnel("nas", 3)])
+        self.reload_ok = True
+        # Same rows again: the failed apply must not count as applied
+        commands = await self.regenerate([tunnel("cam", 2), tunnel("nas", 3)])
+        self.assertEqual(commands, [])
+        self.assertEqual(self.reloads, 3)
+        self.assertIsNotNone(self.service.status()["applied_sha256"])
+
+    async def test_apply_by_another_process_is_not_diffed(self):
+        await self.regenerate([tunnel("cam", 2)])
+        other = self.make_service()
+        # Adopts the config HAProxy runs, then diffs against it
+        await self.regenerate([tunnel("cam", 2)], service=other)
+        commands = await self.regenerate([tunnel("cam", 3)], service=other)
+        self.assertEqual(commands, ["set server bk_hvpn_cam/srv1 addr 10.9.0.3 port 8123"])
+        self.assertEqual(self.reloads, 1)
+
+        # Our routes predate the other process's apply: reload, don't diff
+        commands = await self.regenerate([tunnel("cam", 4)])
+        self.assertEqual(commands, [])
+        self.assertEqual(self.reloads, 2)
+
+
+class RenderTest(HAProxyTestCase):
+    async def test_renders_backends_and_map(self):
+        await self.regenerate([tunnel("cam", 2), tunnel("nas", 3, port=5000, use_device_ip=False)])
+        self.assertEqual(self.read(self.service.backends_path).decode(), GENERATED_HEADER + (
+            "\nbackend bk_hvpn_cam\n"
+            "    server srv1 10.9.0.2:8123 check inter 10s fall 3 rise 2\n"
+            "\nbackend bk_hvpn_nas\n"
+            "    server srv1 10.8.0.3:5000 check inter 10s fall 3 rise 2\n"
+        ))
+        self.assertEqual(self.read(self.service.map_path).decode(), GENERATED_HEADER + (
+            "cam bk_hvpn_cam\n"
+            "nas bk_hvpn_nas\n"
+        ))
+
+    async def test_streams_ordered_routing_columns(self):
+        session = FakeSession([])
+        await self.service.regenerate_config(session)
+        statement = session.streamed
+        self.assertEqual(
+            [c.name for c in statement.selected_columns],
+            ["subdomain", "vpn_ip", "device_ip", "use_device_ip", "target_port"],
+        )
+        self.assertTrue(str(statement).endswith("ORDER BY tunnels.subdomain"))
+        self.assertEqual(statement.get_execution_options()["yield_per"], RENDER_BATCH_SIZE)
+
+    async def test_unchanged_state_is_skipped(self):
+        rows = [tunnel("cam", 2), tunnel("nas", 3)]
+        await self.regenerate(rows, version=1)
+        rendered = self.read(self.service.backends_path), self.read(self.service.map_path)
+        mtime = os.stat(self.service.backends_path).st_mtime_ns
+
+        commands = await self.regenerate(rows, version=2)
+        self.assertEqual(commands, [])
+        self.assertEqual(self.reloads, 1)
+        self.assertEqual(self.service.stats["skipped"], 1)
+        self.assertEqual((self.read(self.service.backends_path), self.read(self.service.map_path)), rendered)
+        self.assertEqual(os.stat(self.service.backends_path).st_mtime_ns, mtime)
+        self.assertEqual(self.service.status()["applied_version"], 2)
+        # No temp file left behind by the discarded render
+        self.assertEqual(
+            sorted(os.listdir(self.tmp.name)),
+            ["homevpn-backends.cfg", "homevpn-backends.cfg.applied", "homevpn-subdomains.map"],
+        )
+
+    async def test_missing_files_are_rewritten_without_reload(self):
+        rows = [tunnel("cam", 2)]
+        await self.regenerate(rows)
+        rendered = self.read(self.service.backends_path)
+        os.unlink(self.service.backends_path)
+
+        await self.regenerate(rows)
+        self.assertEqual(self.read(self.service.backends_path), rendered)
+        self.assertEqual(self.reloads, 1)
+
+    async def test_render_error_keeps_the_previous_files(self):
+        await self.regenerate([tunnel("cam", 2)])
+        rendered = self.read(self.service.backends_path)
+
+        with self.assertRaises(AttributeError):
+            await self.regenerate([tunnel("nas", 3), object()])
+        self.assertEqual(self.read(self.service.backends_path), rendered)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import unittest
+import uuid
+
+from sqlalchemy import delete, func, select
+
+from app.models.gateway_node import GatewayNode
+from app.models.ip_lease import IPLease
+from app.models.tunnel import Tunnel
+from app.models.user import User
+from app.services.ip_allocator import ip_allocator
+from tests.support import DatabaseTestCase
+
+NODE_ID = "test-alloc"
+# /29 pools: 6 hosts, minus the node's own address
+POOL_SIZE = 5
+
+
+class IPAllocatorTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # Rows left behind by an interrupted run
+        await self._cleanup()
+        self.user_id = uuid.uuid4()
+        async with self.session() as db:
+            db.add(User(id=self.user_id, email=f"{self.user_id}@{NODE_ID}.invalid", password_hash="x"))
+            db.add(GatewayNode(
+                id=NODE_ID, driver="local", interface="wgtest", endpoint="test.invalid:51820",
+                vpn_subnet="198.18.0.0/29", vpn_server_ip="198.18.0.1",
+                device_subnet="198.18.1.0/29", device_gateway_ip="198.18.1.1",
+                is_active=False,
+            ))
+            await db.flush()
+            await ip_allocator.add_pools(
+                db, NODE_ID, "198.18.0.0/29", "198.18.0.1", "198.18.1.0/29", "198.18.1.1"
+            )
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self._cleanup()
+        await super().asyncTearDown()
+
+    async def _cleanup(self) -> None:
+        async with self.session() as db:
+            await db.execute(delete(Tunnel).where(Tunnel.node_id == NODE_ID))
+            await db.execute(delete(GatewayNode).where(GatewayNode.id == NODE_ID))
+            await db.execute(delete(User).where(User.email.like(f"%@{NODE_ID}.invalid")))
+            await db.commit()
+
+    async def _create_tunnel(self, db, tunnel_id: uuid.UUID, n: int) -> tuple[str, str]:
+        vpn_ip, device_ip = await ip_allocator.allocate(db, tunnel_id, NODE_ID)
+        await self._insert_tunnel(db, tunnel_id, n, vpn_ip, device_ip)
+        return vpn_ip, device_ip
+
+    async def _insert_tunnel(self, db, tunnel_id, n, vpn_ip, device_ip) -> None:
+        db.add(Tunnel(
+            id=tunnel_id, user_id=self.user_id, subdomain=f"test-alloc-{n}",
+            vpn_ip=vpn_ip, device_ip=device_ip, node_id=NODE_ID,
+            client_private_key="k", client_public_key=f"pub-{tunnel_id}", server_public_key="s",
+        ))
+        await db.flush()
+
+    async def test_pools_exclude_the_node_addresses(self):
+        async with self.session() as db:
+            addresses = set(
+                (await db.execute(
+                    select(func.host(IPLease.address)).where(IPLease.node_id == NODE_ID)
+                )).scalars()
+            )
+        self.assertEqual(len(addresses), 2 * POOL_SIZE)
+        self.assertNotIn("198.18.0.1", addresses)
+        self.assertNotIn("198.18.1.1", addresses)
+
+    async def test_concurrent_claims_get_distinct_addresses(self):
+        attempts = POOL_SIZE + 3
+        # Every transaction holds its claim until all have tried theirs
+        barrier = asyncio.Barrier(attempts)
+
+        async def create(n: int):
+            tunnel_id = uuid.uuid4()
+            async with self.session() as db:
+                try:
+                    result = await ip_allocator.allocate(db, tunnel_id, NODE_ID)
+                except RuntimeError as e:
+                    await db.rollback()
+                    result = e
+                await barrier.wait()
+                if not isinstance(result, RuntimeError):
+                    # Inserting the tunnel serializes on the version lock,
+                    # so only after every claim has been attempted
+                    await self._insert_tunnel(db, tunnel_id, n, *result)
+                    await db.commit()
+                return result
+
+        results = await asyncio.gather(*(create(n) for n in range(attempts)))
+
+        claimed = [r for r in results if not isinstance(r, RuntimeError)]
+        exhausted = [r for r in results if isinstance(r, RuntimeError)]
+        self.assertEqual(len(claimed), POOL_SIZE)
+        self.assertEqual(len({vpn for vpn, _ in claimed}), POOL_SIZE)
+        self.assertEqual(len({device for _, device in claimed}), POOL_SIZE)
+        self.assertEqual(len(exhausted), attempts - POOL_SIZE)
+        self.assertTrue(all("pool exhausted" in str(e) for e in exhausted))
+
+    async def test_rolled_back_claim_is_released(self):
+        async with self.session() as db:
+            first = await self._create_tunnel(db, uuid.uuid4(), 0)
+            await db.rollback()
+        async with self.session() as db:
+            again = await self._create_tunnel(db, uuid.uuid4(), 0)
+            await db.commit()
+        self.assertEqual(first, again)
+
+    async def test_deleted_tunnel_frees_its_leases(self):
+        tunnel_id = uuid.uuid4()
+        async with self.session() as db:
+            for n in range(POOL_SIZE):
+                await self._create_tunnel(db, tunnel_id if n == 0 else uuid.uuid4(), n)
+            await db.commit()
+        async with self.session() as db:
+            with self.assertRaises(RuntimeError):
+                await self._create_tunnel(db, uuid.uuid4(), POOL_SIZE)
+        async with self.session() as db:
+            await db.execute(delete(Tunnel).where(Tunnel.id == tunnel_id))
+            await db.commit()
+        async with self.session() as db:
+            await self._create_tunnel(db, uuid.uuid4(), POOL_SIZE)
+            await db.commit()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import unittest
+
+from app.services.auth import PasswordHasher, PasswordHasherBusy
+
+
+class PasswordHasherTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(workers=1, max_queue=1, rounds=4)
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.hasher._executor.shutdown(wait=True)
+
+    def _blocking(self) -> str:
+        self.started.set()
+        self.release.wait(5)
+        return "done"
+
+    async def test_rejects_beyond_workers_and_queue(self):
+        running = asyncio.ensure_future(self.hasher._run(self._blocking))
+        queued = asyncio.ensure_future(self.hasher._run(self._blocking))
+        await asyncio.sleep(0)
+        with self.assertRaises(PasswordHasherBusy):
+            await self.hasher._run(self._blocking)
+        self.release.set()
+        self.assertEqual(await asyncio.gather(running, queued), ["done", "done"])
+        self.assertEqual(self.hasher.stats["rejected"], 1)
+
+    async def test_cancelled_caller_keeps_the_slot_until_the_job_ends(self):
+        self.hasher.max_queue = 0
+        task = asyncio.ensure_future(self.hasher._run(self._blocking))
+        await asyncio.to_thread(self.started.wait, 5)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        # The bcrypt job still runs in the worker thread
+        with self.assertRaises(PasswordHasherBusy):
+            await self.hasher._run(self._blocking)
+
+        self.release.set()
+        for _ in range(100):
+            if self.hasher._pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(await self.hasher._run(self._blocking), "done")
+
+    async def test_cancelled_queued_job_frees_its_slot(self):
+        running = asyncio.ensure_future(self.hasher._run(self._blocking))
+        await asyncio.to_thread(self.started.wait, 5)
+        queued = asyncio.ensure_future(self.hasher._run(self._blocking))
+        await asyncio.sleep(0)
+        queued.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await queued
+        # Never started: cancelled in the executor queue, slot released
+        self.assertEqual(self.hasher._pending, 1)
+        self.release.set()
+        self.assertEqual(await running, "done")
+
+    async def test_hash_round_trip(self):
+        hashed = await self.hasher.hash("secret123")
+        self.assertTrue(await self.hasher.verify("secret123", hashed))
+        self.assertFalse(await self.hasher.verify("wrong", hashed))
+        self.assertFalse(self.hasher.needs_rehash(hashed))
+        self.assertTrue(PasswordHasher(1, 1, rounds=5).needs_rehash(hashed))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from datetime import datetime, timezone
+
+from app.services.traffic_accounting import TrafficAccountant
+
+LEADER_SINCE = datetime(2026, 10, 16, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeResult:
+    def __init__(self, keys):
+        self._keys = keys
+
+    def scalars(self):
+        return iter(self._keys)
+
+
+class FakeConnection:
+    """Answers the tunnels lookup of new_peers() with the given keys."""
+
+    def __init__(self, created_since):
+        self.created_since = created_since
+        self.queries = 0
+
+    async def execute(self, _statement):
+        self.queries += 1
+        return FakeResult(self.created_since)
+
+
+def pending(accountant: TrafficAccountant) -> dict[str, list[int]]:
+    return accountant._pending
+
+
+class ObserveTest(unittest.IsolatedAsyncioTestCase):
+    async def test_first_deploy_does_not_charge_lifetime_counters(self):
+        # Empty shared state: accounting has just been deployed
+        accountant = TrafficAccountant()
+        accountant.baseline({}, LEADER_SINCE)
+        counters = {"old-peer": (50_000_000, 20_000_000)}
+
+        new_peers = await accountant.new_peers(FakeConnection([]), counters)
+        accountant.observe(counters, new_peers)
+        self.assertEqual(pending(accountant), {})
+
+        accountant.observe({"old-peer": (50_001_000, 20_000_500)})
+        self.assertEqual(pending(accountant), {"old-peer": [1_000, 500]})
+
+    async def test_peer_of_new_tunnel_is_charged_in_full(self):
+        accountant = TrafficAccountant()
+        accountant.baseline({"old-peer": (100, 100)}, LEADER_SINCE)
+        counters = {"old-peer": (150, 120), "new-peer": (3_000, 2_000)}
+
+        new_peers = await accountant.new_peers(FakeConnection(["new-peer"]), counters)
+        accountant.observe(counters, new_peers)
+        self.assertEqual(pending(accountant), {"old-peer": [50, 20], "new-peer": [3_000, 2_000]})
+
+    async def test_known_peers_skip_the_tunnels_lookup(self):
+        accountant = TrafficAccountant()
+        accountant.baseline({"old-peer": (100, 100)}, LEADER_SINCE)
+        conn = FakeConnection([])
+
+        self.assertEqual(await accountant.new_peers(conn, {"old-peer": (200, 200)}), set())
+        self.assertEqual(conn.queries, 0)
+
+    def test_re_added_peer_is_charged_in_full(self):
+        accountant = TrafficAccountant()
+        accountant.baseline({"peer": (1_000, 1_000)}, LEADER_SINCE)
+        accountant.observe({})
+        accountant.observe({"peer": (300, 200)})
+        self.assertEqual(pending(accountant), {"peer": [300, 200]})
+
+    def test_counter_reset_is_new_traffic(self):
+        accountant = TrafficAccountant()
+        accountant.baseline({"peer": (1_000, 1_000)}, LEADER_SINCE)
+        accountant.observe({"peer": (10, 20)})
+        self.assertEqual(pending(accountant), {"peer": [10, 20]})
+
+
+if __name__ == "__main__":
+    unittest.main()
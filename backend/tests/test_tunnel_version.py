@@ -0,0 +1,77 @@
+import unittest
+import uuid
+
+from app.services.pg_notify import pg_listener
+from app.services.tunnel_version import TunnelVersionTracker
+
+
+class FakeTracker(TunnelVersionTracker):
+    """Reads versions from a dict instead of the tunnels tables."""
+
+    def __init__(self, versions: dict):
+        super().__init__()
+        self.versions = versions
+        self.reads = 0
+
+    async def _read(self, user_id=None) -> int:
+        self.reads += 1
+        return self.versions[user_id]
+
+
+class TunnelVersionTrackerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.user = uuid.uuid4()
+        self.other = uuid.uuid4()
+        self.tracker = FakeTracker({None: 10, self.user: 7, self.other: 10})
+        pg_listener.connected = True
+
+    def tearDown(self):
+        pg_listener.connected = False
+
+    async def test_follows_notifications_without_reading(self):
+        self.assertEqual(await self.tracker.get_user(self.user), 7)
+        self.assertEqual(await self.tracker.get(), 10)
+        reads = self.tracker.reads
+
+        self.tracker.on_notify(f"11:{self.other}")
+        self.assertEqual(await self.tracker.get_user(self.user), 7)
+        self.assertEqual(await self.tracker.get(), 11)
+        self.tracker.on_notify(f"12:{self.user}")
+        self.assertEqual(await self.tracker.get_user(self.user), 12)
+        self.assertEqual(self.tracker.reads, reads)
+
+    async def test_bypassed_while_disconnected(self):
+        self.assertEqual(await self.tracker.get_user(self.user), 7)
+        self.assertEqual(await self.tracker.get(), 10)
+
+        pg_listener.connected = False
+        # Changes committed meanwhile are never notified
+        self.tracker.versions.update({None: 15, self.user: 15})
+        self.assertEqual(await self.tracker.get_user(self.user), 15)
+        self.assertEqual(await self.tracker.get(), 15)
+        reads = self.tracker.reads
+        await self.tracker.get_user(self.user)
+        self.assertEqual(self.tracker.reads, reads + 1)
+
+        # Reconnected: read once more, then served from memory again
+        pg_listener.connected = True
+        self.tracker.on_notify(None)
+        self.tracker.versions.update({None: 16, self.user: 16})
+        self.assertEqual(await self.tracker.get_user(self.user), 16)
+        self.assertEqual(await self.tracker.get(), 16)
+        reads = self.tracker.reads
+        await self.tracker.get_user(self.user)
+        await self.tracker.get()
+        self.assertEqual(self.tracker.reads, reads)
+
+    async def test_drops_least_recently_used_users(self):
+        self.tracker.max_users = 1
+        await self.tracker.get_user(self.user)
+        await self.tracker.get_user(self.other)
+        reads = self.tracker.reads
+        await self.tracker.get_user(self.user)
+        self.assertEqual(self.tracker.reads, reads + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,308 @@
+import asyncio
+import base64
+import subprocess
+import unittest
+from unittest import mock
+
+from app.services import gateway
+from app.services.executor import CommandResult
+from app.services.gateway_driver import WireGuardDriver
+from app.config import settings
+from app.services.wireguard import (
+    MAX_KEEPALIVE_SECONDS,
+    RX_STALE_TIMEOUT,
+    PeerState,
+    WireGuardService,
+    generate_keypair,
+    keepalive_for,
+)
+
+# RFC 7748 section 6.1 (Alice)
+RFC_PRIVATE = bytes.fromhex("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+RFC_PUBLIC = bytes.fromhex("8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a")
+
+
+class FakeDriver(WireGuardDriver):
+    """Records the commands; answers each with the next queued output (or raises it)."""
+
+    def __init__(self, *outputs: str | Exception):
+        self.commands: list[list[str]] = []
+        self.outputs = list(outputs)
+
+    async def run(self, args, *, input=None, timeout=10) -> CommandResult:
+        self.commands.append(args)
+        output = self.outputs.pop(0) if self.outputs else ""
+        if isinstance(output, Exception):
+            raise output
+        return CommandResult(tuple(args), 0, output.encode(), b"", 0.0)
+
+
+def failure(args: list[str]) -> subprocess.CalledProcessError:
+    return subprocess.CalledProcessError(1, args)
+
+
+def dump(*peers: tuple[str, int, int]) -> str:
+    """`wg show dump` output for (public_key, latest_handshake, rx) peers."""
+    lines = ["private\tserver-key\t51820\toff"]
+    for public_key, handshake, rx in peers:
+        lines.append(
+            f"{public_key}\t(none)\t203.0.113.1:51820\t10.8.0.2/32\t{handshake}\t{rx}\t100\t25"
+        )
+    return "\n".join(lines) + "\n"
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class KeypairTest(unittest.TestCase):
+    def test_matches_rfc_7748_vector(self):
+        with mock.patch("app.services.wireguard.os.urandom", return_value=RFC_PRIVATE):
+            private_key, public_key = generate_keypair()
+        self.assertEqual(base64.b64decode(public_key), RFC_PUBLIC)
+        # Stored clamped, like `wg genkey`
+        private = base64.b64decode(private_key)
+        self.assertEqual(private[1:31], RFC_PRIVATE[1:31])
+        self.assertEqual((private[0], private[31]), (0x70, 0x6A))
+
+    def test_keys_are_clamped_and_distinct(self):
+        keys = [generate_keypair() for _ in range(20)]
+        self.assertEqual(len({private for private, _ in keys}), 20)
+        for private_key, public_key in keys:
+            private = base64.b64decode(private_key)
+            self.assertEqual(len(private_key), 44)
+            self.assertEqual(len(base64.b64decode(public_key)), 32)
+            self.assertEqual(private[0] & 7, 0)
+            self.assertEqual(private[31] & 0xC0, 0x40)
+
+
+class ServerPublicKeyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_read_once(self):
+        driver = FakeDriver("server-key\n")
+        service = WireGuardService(driver=driver)
+        self.assertEqual(await service.get_server_public_key(), "server-key")
+        self.assertEqual(await service.get_server_public_key(), "server-key")
+        self.assertEqual(driver.commands, [["wg", "show", service.interface, "public-key"]])
+
+    async def test_refreshed_from_the_dump_header(self):
+        service = WireGuardService(driver=FakeDriver("old-key\n", "private\tnew-key\t51820\toff\n"))
+        self.assertEqual(await service.get_server_public_key(), "old-key")
+        with self.assertLogs("app.services.wireguard", "WARNING"):
+            await service.get_peers_status()
+        self.assertEqual(await service.get_server_public_key(), "new-key")
+
+
+class ApplyPeersTest(unittest.IsolatedAsyncioTestCase):
+    async def test_one_wg_set_for_the_batch(self):
+        driver = FakeDriver()
+        service = WireGuardService(interface="wg0", driver=driver)
+        await service.apply_peers(
+            add=[("a", "10.8.0.2", "10.9.0.2"), ("b", "10.8.0.3", "10.9.0.3")], remove=["c"]
+        )
+        self.assertEqual(driver.commands, [[
+            "wg", "set", "wg0",
+            "peer", "a", "allowed-ips", "10.8.0.2/32,10.9.0.2/32",
+            "peer", "b", "allowed-ips", "10.8.0.3/32,10.9.0.3/32",
+            "peer", "c", "remove",
+        ]])
+        self.assertTrue(service.save_pending)
+
+    async def test_large_batches_are_chunked(self):
+        driver = FakeDriver()
+        service = WireGuardService(driver=driver)
+        with mock.patch("app.services.wireguard.WG_SET_MAX_PEERS", 2):
+            await service.apply_peers(remove=[f"key{i}" for i in range(5)])
+        self.assertEqual([c.count("peer") for c in driver.commands], [2, 2, 1])
+
+    async def test_nothing_to_apply(self):
+        driver = FakeDriver()
+        service = WireGuardService(driver=driver)
+        await service.apply_peers()
+        self.assertEqual(driver.commands, [])
+        self.assertFalse(service.save_pending)
+
+    async def test_partial_batch_is_still_saved(self):
+        driver = FakeDriver("", failure(["wg"]))
+        service = WireGuardService(driver=driver)
+        with mock.patch("app.services.wireguard.WG_SET_MAX_PEERS", 1):
+            with self.assertRaises(subprocess.CalledProcessError):
+                await service.apply_peers(remove=["a", "b", "c"])
+        self.assertEqual(len(driver.commands), 2)
+        self.assertTrue(service.save_pending)
+
+
+class SaveLoopTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.driver = FakeDriver()
+        self.service = WireGuardService(interface="wg0", driver=self.driver)
+        for patch in (
+            # Module-level event: bound to the loop of the first test using it
+            mock.patch("app.services.wireguard._any_save_requested", asyncio.Event()),
+            mock.patch.object(gateway, "SAVE_DEBOUNCE_SECONDS", 0.05),
+            mock.patch.object(
+                type(gateway.gateway_registry), "loaded_services", property(lambda _: [self.service])
+            ),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.loop_task = asyncio.create_task(gateway.wireguard_save_loop())
+
+    async def asyncTearDown(self):
+        self.loop_task.cancel()
+        await asyncio.gather(self.loop_task, return_exceptions=True)
+
+    def saves(self) -> int:
+        return self.driver.commands.count(["wg-quick", "save", "wg0"])
+
+    async def test_burst_is_saved_once(self):
+        for i in range(3):
+            await self.service.add_peer(f"key{i}", f"10.8.0.{i}", f"10.9.0.{i}")
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.saves(), 1)
+        self.assertFalse(self.service.save_pending)
+
+    async def test_failed_save_is_retried(self):
+        self.driver.outputs = ["", failure(["wg-quick"])]
+        await self.service.remove_peer("key")
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.saves(), 2)
+        self.assertFalse(self.service.save_pending)
+
+    async def test_pending_save_is_flushed_on_shutdown(self):
+        await self.service.remove_peer("key")
+        await asyncio.sleep(0)
+        self.loop_task.cancel()
+        await asyncio.gather(self.loop_task, return_exceptions=True)
+        self.assertEqual(self.saves(), 1)
+
+
+class PeerStatusTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = Clock(1_000_000.0)
+        patch = mock.patch("app.services.wireguard.time", self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.service = WireGuardService(driver=FakeDriver())
+        # The server key is known: dumps don't log a re-key
+        self.service._server_public_key = "server-key"
+
+    async def sample(self, *peers: tuple[str, int, int], after: float = 0) -> dict[str, dict]:
+        self.clock.now += after
+        self.service.driver.outputs.append(dump(*peers))
+        return await self.service.get_peers_status()
+
+
+class PeerStateTest(PeerStatusTestCase):
+    def test_slotted(self):
+        self.assertFalse(hasattr(PeerState("0"), "__dict__"))
+
+    async def test_new_peer_without_handshake_is_a_baseline(self):
+        status = await self.sample(("a", 0, 5000))
+        self.assertEqual(status, {"a": {"connected": False, "connected_since": 0}})
+        self.assertEqual(self.service.peer_states["a"].rx, "5000")
+
+    async def test_rx_growth_connects_and_keeps_the_start(self):
+        await self.sample(("a", 0, 100))
+        started = self.clock.now + 10
+        status = await self.sample(("a", 0, 200), after=10)
+        self.assertEqual(status["a"], {"connected": False, "connected_since": 0})
+
+        status = await self.sample(("a", int(started), 300))
+        self.assertEqual(status["a"], {"connected": True, "connected_since": int(started)})
+        status = await self.sample(("a", int(started), 400), after=10)
+        self.assertEqual(status["a"]["connected_since"], int(started))
+
+    async def test_peers_leaving_the_dump_are_evicted(self):
+        await self.sample(("a", 0, 100), ("b", 0, 100))
+        await self.sample(("b", 0, 100), after=10)
+        self.assertEqual(list(self.service.peer_states), ["b"])
+
+    async def test_counter_reset_is_a_new_baseline(self):
+        handshake = int(self.clock.now)
+        await self.sample(("a", handshake, 1000))
+        await self.sample(("a", handshake, 10), after=RX_STALE_TIMEOUT)
+        state = self.service.peer_states["a"]
+        self.assertEqual(state.rx, "10")
+        self.assertEqual(state.rx_changed_at, handshake)
+        self.assertFalse(state.connected)
+
+    async def test_states_resume_in_another_sampler(self):
+        handshake = int(self.clock.now)
+        await self.sample(("a", handshake, 100))
+        since = self.service.peer_states["a"].connected_since
+
+        other = WireGuardService(driver=FakeDriver(dump(("a", handshake, 200))))
+        other._server_public_key = "server-key"
+        other.load_peer_states(self.service.peer_states)
+        self.clock.now += 10
+        status = await other.get_peers_status()
+        self.assertEqual(status["a"], {"connected": True, "connected_since": int(since)})
+
+
+class KeepaliveTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(settings, "wireguard_keepalive_by_service", {"camera": 15})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_per_service_keepalive(self):
+        self.assertEqual(keepalive_for("camera"), 15)
+        self.assertEqual(keepalive_for("nas"), settings.wireguard_keepalive)
+        self.assertEqual(keepalive_for(None), settings.wireguard_keepalive)
+
+    def test_client_config_keepalive(self):
+        service = WireGuardService(endpoint="vpn.example:51820", vpn_server_ip="10.8.0.1")
+        config = service.generate_client_config("priv", "10.8.0.2", "10.9.0.2", "pub", "camera")
+        self.assertIn("PersistentKeepalive = 15\n", config)
+        self.assertIn("AllowedIPs = 10.8.0.1/32\n", config)
+
+    def test_stale_timeout_covers_two_missed_keepalives(self):
+        self.assertGreaterEqual(MAX_KEEPALIVE_SECONDS, settings.wireguard_keepalive)
+        self.assertEqual(RX_STALE_TIMEOUT, 2 * MAX_KEEPALIVE_SECONDS + 5)
+
+
+class LivenessThresholdTest(PeerStatusTestCase):
+    async def test_disconnected_after_the_stale_timeout(self):
+        await self.sample(("a", 0, 100))
+        await self.sample(("a", 1, 200), after=5)
+        rx_at = self.clock.now
+
+        status = await self.sample(("a", 1, 200), after=RX_STALE_TIMEOUT - 1)
+        self.assertTrue(status["a"]["connected"])
+        status = await self.sample(("a", 1, 200), after=1)
+        self.assertEqual(status["a"], {"connected": False, "connected_since": 0})
+        self.assertEqual(self.service.peer_states["a"].rx_changed_at, rx_at)
+
+    async def test_one_lost_keepalive_keeps_the_peer_connected(self):
+        await self.sample(("a", 0, 100))
+        await self.sample(("a", 1, 200), after=5)
+        since = int(self.clock.now)
+        # Next keepalive lost: rx moves again two intervals later
+        for _ in range(2 * MAX_KEEPALIVE_SECONDS // 5):
+            status = await self.sample(("a", 1, 200), after=5)
+            self.assertTrue(status["a"]["connected"])
+        status = await self.sample(("a", 1, 300), after=5)
+        self.assertEqual(status["a"], {"connected": True, "connected_since": since})
+
+    async def test_recent_handshake_connects_right_after_restart(self):
+        status = await self.sample(("a", int(self.clock.now) - 30, 100))
+        self.assertTrue(status["a"]["connected"])
+
+    async def test_old_handshake_alone_is_not_a_connection(self):
+        status = await self.sample(("a", int(self.clock.now) - RX_STALE_TIMEOUT, 100))
+        self.assertFalse(status["a"]["connected"])
+
+    def test_handshake_is_required(self):
+        state = PeerState("100", handshake=False, rx_changed_at=self.clock.now)
+        self.assertFalse(state.connected)
+        state.handshake = True
+        self.assertTrue(state.connected)
+
+
+if __name__ == "__main__":
+    unittest.main()
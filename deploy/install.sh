@@ -83,11 +83,14 @@ else
 fi
 
 # 8. Configure sudoers for wg commands (no password required for the service user)
+# ip route: routes towards the pools of remote gateway nodes
 echo "[8/9] Configuring permissions..."
 cat > /etc/sudoers.d/homevpn <<SUDOERS
-homevpn ALL=(root) NOPASSWD: /usr/bin/wg, /usr/bin/wg-quick, /usr/bin/systemctl reload haproxy
+homevpn ALL=(root) NOPASSWD: /usr/bin/wg, /usr/bin/wg-quick, /usr/bin/systemctl reload haproxy, /usr/sbin/ip route replace *, /usr/sbin/ip route del *
 SUDOERS
 chmod 440 /etc/sudoers.d/homevpn
+# Runtime API access (stats socket is mode 660, group haproxy)
+usermod -aG haproxy "$APP_USER"
 
 # 9. Install services
 echo "[9/9] Installing systemd service and nginx config..."
@@ -102,6 +105,10 @@ touch /etc/haproxy/homevpn-subdomains.map
 # Set permissions
 chown -R "$APP_USER:$APP_USER" "$APP_DIR"
 chown "$APP_USER:$APP_USER" /etc/haproxy/homevpn-backends.cfg /etc/haproxy/homevpn-subdomains.map
+# Generated files are replaced atomically (temp file + rename), which needs
+# write access to the directory; the sticky bit keeps root-owned files safe
+chgrp "$APP_USER" /etc/haproxy
+chmod g+w,+t /etc/haproxy
 
 # Run migrations
 echo "Running database migrations..."
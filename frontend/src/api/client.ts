@@ -23,4 +23,57 @@ api.interceptors.response.use(
   }
 );
 
+export type StreamHandler = (event: string, data: unknown) => void;
+
+/**
+ * Subscribe to a Server-Sent Events endpoint with the auth token.
+ * Uses fetch streaming (EventSource cannot send headers) and reconnects
+ * after `retryMs` until the signal is aborted.
+ */
+export async function streamEvents(
+  path: string,
+  onEvent: StreamHandler,
+  signal: AbortSignal,
+  retryMs = 5_000
+): Promise<void> {
+  while (!signal.aborted) {
+    try {
+      const token = localStorage.getItem("token");
+      const response = await fetch(`/api${path}`, {
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+        signal,
+      });
+      if (response.status === 401) {
+        localStorage.removeItem("token");
+        window.location.href = "/login";
+        return;
+      }
+      if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        let end;
+        while ((end = buffer.indexOf("\n\n")) !== -1) {
+          const block = buffer.slice(0, end);
+          buffer = buffer.slice(end + 2);
+          let event = "message";
+          let data = "";
+          for (const line of block.split("\n")) {
+            if (line.startsWith("event: ")) event = line.slice(7);
+            else if (line.startsWith("data: ")) data += line.slice(6);
+          }
+          if (data) onEvent(event, JSON.parse(data));
+        }
+      }
+    } catch {
+      if (signal.aborted) return;
+    }
+    await new Promise((resolve) => setTimeout(resolve, retryMs));
+  }
+}
+
 export default api;
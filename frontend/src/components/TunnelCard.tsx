@@ -154,6 +154,14 @@ export default function TunnelCard({ tunnel, connected, connectedSince, onDelete
         <span>VPN {tunnel.vpn_ip}</span>
         <span className="text-gray-700">|</span>
         <span>Device {tunnel.device_ip}</span>
+        {tunnel.cert_status !== "issued" && (
+          <>
+            <span className="text-gray-700">|</span>
+            <span className={tunnel.cert_status === "failed" ? "text-red-400" : "text-amber-400"}>
+              {tunnel.cert_status === "failed" ? "Certificat SSL en échec" : "Certificat SSL en cours"}
+            </span>
+          </>
+        )}
       </div>
 
       {/* Target IP toggle */}
@@ -11,7 +11,7 @@ import {
   MagnifyingGlassIcon,
   ArrowPathIcon,
 } from "@heroicons/react/24/outline";
-import api from "../api/client";
+import api, { streamEvents } from "../api/client";
 import { useAuth } from "../contexts/AuthContext";
 import type { AdminUser, AdminTunnel } from "../types";
 import ServiceLogo from "../components/ServiceLogo";
@@ -40,6 +40,9 @@ const ACTION_LABELS: Record<string, { label: string; color: string }> = {
   admin_update_quota: { label: "Quota modifié", color: "bg-yellow-500/10 text-yellow-400 border-yellow-500/20" },
   admin_promote: { label: "Promotion admin", color: "bg-amber-500/10 text-amber-400 border-amber-500/20" },
   admin_demote: { label: "Révocation admin", color: "bg-orange-500/10 text-orange-400 border-orange-500/20" },
+  admin_add_node: { label: "Passerelle ajoutée", color: "bg-cyan-500/10 text-cyan-400 border-cyan-500/20" },
+  admin_update_node: { label: "Passerelle modifiée", color: "bg-cyan-500/10 text-cyan-400 border-cyan-500/20" },
+  admin_send_announcement: { label: "Annonce envoyée", color: "bg-indigo-500/10 text-indigo-400 border-indigo-500/20" },
 };
 
 function formatDuration(seconds: number): string {
@@ -50,6 +53,17 @@ function formatDuration(seconds: number): string {
   return `${h}h${String(m).padStart(2, "0")}`;
 }
 
+function formatBytes(bytes: number): string {
+  const units = ["o", "Ko", "Mo", "Go", "To"];
+  let value = bytes;
+  let unit = 0;
+  while (value >= 1024 && unit < units.length - 1) {
+    value /= 1024;
+    unit++;
+  }
+  return `${unit === 0 ? value : value.toFixed(1)} ${units[unit]}`;
+}
+
 export default function AdminPage() {
   const { user } = useAuth();
   const [tab, setTab] = useState<Tab>("users");
@@ -137,10 +151,20 @@ export default function AdminPage() {
     );
   }, [fetchUsers, fetchTunnels, fetchStatus]);
 
+  // Live peer status: initial snapshot, then only the tunnels that change
   useEffect(() => {
-    const interval = setInterval(fetchStatus, 5_000);
-    return () => clearInterval(interval);
-  }, [fetchStatus]);
+    const controller = new AbortController();
+    streamEvents(
+      "/admin/tunnels/status/stream",
+      (event, data) => {
+        const status = data as Record<string, { connected: boolean; connected_since: number }>;
+        if (event === "snapshot") setPeerStatus(status);
+        else if (event === "update") setPeerStatus((prev) => ({ ...prev, ...status }));
+      },
+      controller.signal
+    );
+    return () => controller.abort();
+  }, []);
 
   useEffect(() => {
     const interval = setInterval(
@@ -542,6 +566,10 @@ export default function AdminPage() {
                                   <span>·</span>
                                   <span>Device {t.device_ip}</span>
                                   <span>·</span>
+                                  <span>
+                                    ↓ {formatBytes(t.monthly_rx_bytes)} · ↑ {formatBytes(t.monthly_tx_bytes)} ce mois
+                                  </span>
+                                  <span>·</span>
                                   <span>{formatDate(t.created_at)}</span>
                                 </div>
                               </div>
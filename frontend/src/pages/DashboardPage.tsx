@@ -1,6 +1,6 @@
 import { useEffect, useState, useCallback } from "react";
 import { PlusIcon } from "@heroicons/react/24/outline";
-import api from "../api/client";
+import api, { streamEvents } from "../api/client";
 import { useAuth } from "../contexts/AuthContext";
 import TunnelCard from "../components/TunnelCard";
 import CreateTunnelModal from "../components/CreateTunnelModal";
@@ -37,11 +37,20 @@ export default function DashboardPage() {
     fetchStatus();
   }, [fetchStatus]);
 
-  // Poll peer status every 5 seconds
+  // Live peer status: initial snapshot, then only the tunnels that change
   useEffect(() => {
-    const interval = setInterval(fetchStatus, 5_000);
-    return () => clearInterval(interval);
-  }, [fetchStatus]);
+    const controller = new AbortController();
+    streamEvents(
+      "/tunnels/status/stream",
+      (event, data) => {
+        const status = data as Record<string, { connected: boolean; connected_since: number }>;
+        if (event === "snapshot") setPeerStatus(status);
+        else if (event === "update") setPeerStatus((prev) => ({ ...prev, ...status }));
+      },
+      controller.signal
+    );
+    return () => controller.abort();
+  }, []);
 
   const handleCreated = () => {
     setShowCreate(false);
@@ -451,7 +451,7 @@ DNS = 1.1.1.1
 PublicKey = <clé publique du serveur>
 Endpoint = vpn.homeaccess.site:51820
 AllowedIPs = 172.16.0.z/32
-PersistentKeepalive = 10`}</Code>
+PersistentKeepalive = 25`}</Code>
 
           <ul className="list-disc list-inside space-y-2 text-gray-400 mt-4">
             <li>
@@ -633,7 +633,7 @@ ping 10.100.0.y   # l'IP device de votre équipement`}</Code>
                 Le tunnel se déconnecte souvent.
               </h3>
               <p className="text-gray-400">
-                Le paramètre <code className="px-1 py-0.5 rounded bg-gray-800 text-indigo-300 text-sm">PersistentKeepalive = 10</code>{" "}
+                Le paramètre <code className="px-1 py-0.5 rounded bg-gray-800 text-indigo-300 text-sm">PersistentKeepalive = 25</code>{" "}
                 dans la configuration WireGuard maintient le tunnel actif.
                 Si votre connexion Internet est instable, WireGuard se
                 reconnectera automatiquement. Vérifiez aussi que votre box
@@ -16,6 +16,7 @@ export interface Tunnel {
   device_ip: string;
   use_device_ip: boolean;
   is_active: boolean;
+  cert_status: "pending" | "issued" | "failed";
   full_domain: string;
   created_at: string;
   updated_at: string;
@@ -53,4 +54,6 @@ export interface AdminTunnel {
   is_active: boolean;
   full_domain: string;
   created_at: string;
+  monthly_rx_bytes: number;
+  monthly_tx_bytes: number;
 }